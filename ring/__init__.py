@@ -14,5 +14,17 @@
 
 
 from ring.context import Context
-from ring.connection import NONBLOCK, POLLIN, POLLOUT, REPLIER, REQUESTER, PUSHER, PULLER
-from ring.connection_impl import Again
+from ring.connection import (
+    NONBLOCK, POLLIN, POLLOUT, REPLIER, REQUESTER, PUSHER, PULLER, ROUTER, PUBLISHER, SUBSCRIBER,
+    TimeoutError
+)
+from ring.options import (
+    SNDHWM_BYTES, RCVHWM_BYTES, MAXMEMORY, SNDHWM, RCVHWM, OVERFLOW, OVERFLOW_BLOCK,
+    OVERFLOW_AGAIN, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST, SPILL_THRESHOLD, SPILL_DIR,
+    BALANCE, BALANCE_ROUND_ROBIN, BALANCE_LEAST_OUTSTANDING, BALANCE_P2C_EWMA, PIPELINE,
+    FAIR_QUANTUM, PEER_WEIGHT, PEER_QUOTA, CREDIT, CREDIT_BYTES,
+    BACKLOG, MAX_CONNECTIONS, REUSEPORT, NODELAY, SNDBUF, RCVBUF, KEEPALIVE, KEEPALIVE_IDLE,
+    KEEPALIVE_INTVL, KEEPALIVE_CNT, QUICKACK, FASTOPEN, MMAP_THRESHOLD, RECONNECT_IVL,
+    RECONNECT_IVL_MAX, HEARTBEAT_IVL, HEARTBEAT_LIVENESS
+)
+from ring.connection_impl import Again, RequestFailed, StreamInterrupted
@@ -0,0 +1,149 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import errno
+import socket
+import threading
+
+from ring.constants import ERR_WOULD_BLOCK
+from ring.options import MAX_CONNECTIONS, InvalidOptionError
+from ring.pipes import create_send_pipe
+from ring.poller import READ
+from ring.sockopt import configure_peer
+from ring.utils import errno_from_exception, get_logger
+
+_logger = get_logger(__name__)
+
+# Connections accepted per readiness event at most, so a storm of them does not starve the
+# other sockets of the IO loop
+ACCEPT_BATCH = 64
+# Seconds to wait before accepting again after running out of file descriptors
+ACCEPT_RETRY_IVL = 0.1
+
+# The client gave up before we got to it
+_ERR_ABORTED = (errno.ECONNABORTED, errno.EPROTO)
+# Out of file descriptors
+_ERR_NO_FD = (errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM)
+
+
+class AcceptMixin(object):
+    """Accepting for impls listening on ``self._socket``, which keep their peers in
+    ``self._connections`` and set up each accepted one in ``_add_connection(conn, addr)``.
+
+    Pending connections are accepted in batches until the backlog is drained. Accepting pauses
+    while the connection has MAX_CONNECTIONS peers, and resumes once a peer is removed. Having
+    run out of file descriptors, it pauses for ACCEPT_RETRY_IVL seconds. Meanwhile, new clients
+    wait in the listen backlog.
+
+    Peers are set up without a send pipe, which is created by ``_send_pipe`` once something is
+    sent. Many peers never need one, like those of a puller, or idle ones of a replier.
+    """
+
+    def _start_accepting(self):
+        # Guards the accepting state, and send pipes created from several threads
+        self._accept_lock = threading.Lock()
+        self._listening = True
+        self._accepting = False
+        self._accept_retry = None
+        self._update_accepting()
+
+    def _stop_accepting(self):
+        with self._accept_lock:
+            self._listening = False
+            self._set_accepting(False)
+            if self._accept_retry is not None:
+                self._context.io_loop.clear_timeout(self._accept_retry)
+                self._accept_retry = None
+
+    def _retry_accepting(self):
+        self._accept_retry = None
+        self._update_accepting()
+
+    def _update_accepting(self):
+        """Resumes or pauses accepting according to the number of peers. Call whenever one is
+        removed.
+        """
+        with self._accept_lock:
+            self._set_accepting(self._listening and self._has_room())
+
+    def _has_room(self):
+        limit = self._options.get(MAX_CONNECTIONS)
+        return limit is None or len(self._connections) < limit
+
+    def _set_accepting(self, accepting):
+        if accepting == self._accepting:
+            return
+        self._accepting = accepting
+        if accepting:
+            self._context.io_loop.register(self._socket.fileno(), READ, self._on_accept)
+        else:
+            self._context.io_loop.unregister(self._socket.fileno())
+            if self._listening:
+                self._stats['accept_paused'] += 1
+
+    def _send_pipe(self, engine_id):
+        """Returns the send pipe of a peer, created on first use."""
+        with self._accept_lock:
+            engine, stream, recv_pipe, send_pipe = self._connections[engine_id]
+            if send_pipe is None:
+                send_pipe = create_send_pipe(self._options, self._budget, self._stats)
+                send_pipe.set_writable_callback(engine.post_activate_send)
+                engine.set_send_pipe(send_pipe)
+                self._connections[engine_id] = (engine, stream, recv_pipe, send_pipe)
+            return send_pipe
+
+    def _on_accept(self, fd, events):
+        for _ in xrange(ACCEPT_BATCH):
+            if not self._has_room():
+                self._update_accepting()
+                return
+
+            try:
+                conn, addr = self._socket.accept()
+            except socket.error as e:
+                error = errno_from_exception(e)
+                if error in ERR_WOULD_BLOCK:
+                    return
+                if error in _ERR_ABORTED:
+                    self._stats['rejected'] += 1
+                    continue
+                if error in _ERR_NO_FD:
+                    # Retrying right away would spin. Wait for a peer to go, or a while.
+                    self._stats['rejected'] += 1
+                    with self._accept_lock:
+                        self._set_accepting(False)
+                        if self._accept_retry is None:
+                            self._accept_retry = self._context.io_loop.set_timeout(
+                                ACCEPT_RETRY_IVL, self._retry_accepting)
+                    return
+                raise
+
+            try:
+                configure_peer(conn, self._options)
+            except socket.error:
+                # Reset before it could be set up
+                conn.close()
+                self._stats['rejected'] += 1
+                continue
+
+            try:
+                self._add_connection(conn, addr)
+            except InvalidOptionError as e:
+                # E.g. PEER_WEIGHT refused the address
+                _logger.warning('Rejected peer %s: %s', addr, e)
+                conn.close()
+                self._stats['rejected'] += 1
+                continue
+            self._stats['accepted'] += 1
@@ -0,0 +1,44 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import random
+
+
+class Backoff(object):
+    """Delays between attempts to redial a lost peer.
+
+    The delay doubles on each failed attempt, from ``initial`` up to ``maximum`` seconds. Each
+    one is drawn at random from the upper half of that, so peers that lost the same server at
+    once spread out their attempts instead of redialing in lockstep.
+    """
+
+    __slots__ = ('_initial', '_maximum', '_attempts', '_random')
+
+    def __init__(self, initial, maximum, random=random.random):
+        self._initial = initial
+        self._maximum = max(initial, maximum)
+        self._attempts = 0
+        self._random = random
+
+    def next(self):
+        """Returns the seconds to wait before the next attempt."""
+        # Capped before it could overflow
+        ceiling = min(self._maximum, self._initial * 2 ** min(self._attempts, 32))
+        self._attempts += 1
+        return ceiling / 2.0 * (1 + self._random())
+
+    def reset(self):
+        """Starts over from ``initial``, once connected."""
+        self._attempts = 0
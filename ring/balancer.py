@@ -0,0 +1,128 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import itertools
+import random
+
+from ring.options import BALANCE_ROUND_ROBIN, BALANCE_LEAST_OUTSTANDING, BALANCE_P2C_EWMA
+
+
+class Balancer(object):
+    """Chooses the peer each request is sent to.
+
+    Peers are identified by engine id. The requester reports every request sent and every
+    reply received, so policies can keep track of outstanding requests and latency.
+    """
+
+    def __init__(self):
+        self._outstanding = {}
+
+    def add(self, peer_id):
+        self._outstanding[peer_id] = 0
+
+    def remove(self, peer_id):
+        del self._outstanding[peer_id]
+
+    def outstanding(self, peer_id):
+        return self._outstanding[peer_id]
+
+    def choose(self, candidates):
+        """Returns one of candidates, a non-empty list of peers able to take a request."""
+        raise NotImplementedError
+
+    def on_sent(self, peer_id):
+        self._outstanding[peer_id] += 1
+
+    def on_reply(self, peer_id, latency):
+        self._outstanding[peer_id] -= 1
+
+    def on_failed(self, peer_id):
+        """A request lost with its peer, which is kept to be redialed."""
+        self._outstanding[peer_id] -= 1
+
+
+class RoundRobinBalancer(Balancer):
+
+    def __init__(self):
+        super(RoundRobinBalancer, self).__init__()
+        self._counter = itertools.count()
+
+    def choose(self, candidates):
+        return candidates[next(self._counter) % len(candidates)]
+
+
+class LeastOutstandingBalancer(RoundRobinBalancer):
+
+    def choose(self, candidates):
+        # Ties are broken round robin, or the first peer would take all the load when idle
+        start = next(self._counter) % len(candidates)
+        rotated = candidates[start:] + candidates[:start]
+        return min(rotated, key=self.outstanding)
+
+
+class P2CEWMABalancer(Balancer):
+    """Power of two choices on an exponentially weighted moving average of latency.
+
+    Of two random candidates, the one with the lower average latency, scaled by the requests
+    it already has outstanding, wins. Peers without a sample yet count as fastest, so they get
+    probed right away.
+    """
+
+    def __init__(self, decay=0.3):
+        super(P2CEWMABalancer, self).__init__()
+        self._decay = decay
+        self._latency = {}
+
+    def add(self, peer_id):
+        super(P2CEWMABalancer, self).add(peer_id)
+        self._latency[peer_id] = 0.0
+
+    def remove(self, peer_id):
+        super(P2CEWMABalancer, self).remove(peer_id)
+        del self._latency[peer_id]
+
+    def latency(self, peer_id):
+        return self._latency[peer_id]
+
+    def _score(self, peer_id):
+        return self._latency[peer_id] * (self._outstanding[peer_id] + 1)
+
+    def choose(self, candidates):
+        if len(candidates) == 1:
+            return candidates[0]
+        first, second = random.sample(candidates, 2)
+        return first if self._score(first) <= self._score(second) else second
+
+    def on_reply(self, peer_id, latency):
+        super(P2CEWMABalancer, self).on_reply(peer_id, latency)
+        previous = self._latency[peer_id]
+        if previous == 0.0:
+            self._latency[peer_id] = latency
+        else:
+            self._latency[peer_id] = previous + self._decay * (latency - previous)
+
+
+_POLICIES = {
+    BALANCE_ROUND_ROBIN: RoundRobinBalancer,
+    BALANCE_LEAST_OUTSTANDING: LeastOutstandingBalancer,
+    BALANCE_P2C_EWMA: P2CEWMABalancer,
+}
+
+
+def create_balancer(policy):
+    """Creates the balancer of a BALANCE option value, a policy constant or a factory."""
+    if callable(policy):
+        return policy()
+    return _POLICIES[policy]()
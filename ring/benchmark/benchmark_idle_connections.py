@@ -0,0 +1,98 @@
+from collections import OrderedDict
+import gc
+import multiprocessing
+import resource
+import socket
+import time
+
+import ring
+from ring import PULLER, REPLIER, ROUTER
+from ring.benchmark.benchmark import BenchmarkTask
+
+_TYPES = {'replier': REPLIER, 'puller': PULLER, 'router': ROUTER}
+
+
+def _rss():
+    """Resident memory of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except IOError:
+        # Peak rather than current, but only grows here anyway
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _hold_connections(port, count, ready, done):
+    sockets = []
+    for _ in xrange(count):
+        so = socket.socket()
+        so.connect(('127.0.0.1', port))
+        sockets.append(so)
+    ready.set()
+    done.wait()
+
+
+class BenchmarkIdleConnections(BenchmarkTask):
+    """Resident memory a bound connection takes per idle peer.
+
+    The peers are held by a child process, so only the server side is measured. Mind the limit
+    of open files (ulimit -n) of both.
+    """
+
+    def setup(self):
+        self._ctx = ring.Context()
+        self._connection = self._ctx.connection(_TYPES[self.params['type']])
+        self._ready = multiprocessing.Event()
+        self._done = multiprocessing.Event()
+        self._clients = None
+        self.rss_per_connection = None
+
+    def tear_down(self):
+        self._done.set()
+        if self._clients is not None:
+            self._clients.join()
+        self._connection.close()
+        self._ctx.stop()
+
+    def run_sync(self, type=None, connections=None):
+        self._connection.setsockopt(ring.BACKLOG, min(connections, 4096))
+        self._connection.bind(('127.0.0.1', 0))
+        port = self._connection.getsockname()[1]
+
+        gc.collect()
+        before = _rss()
+
+        self.start_timer()
+        self._clients = multiprocessing.Process(
+            target=_hold_connections, args=(port, connections, self._ready, self._done))
+        self._clients.daemon = True
+        self._clients.start()
+        self._ready.wait()
+        while self._connection.stats().get('accepted', 0) < connections:
+            time.sleep(0.01)
+        self.stop_timer()
+
+        gc.collect()
+        self.rss_per_connection = (_rss() - before) / connections
+
+    @property
+    def args(self):
+        return OrderedDict([
+            ('--type', {'help': 'connection type, defaults to replier', 'default': 'replier',
+                        'choices': sorted(_TYPES)}),
+            ('--connections', {'help': 'number of idle peers, defaults to 10000',
+                               'default': 10000, 'type': int}),
+        ])
+
+    def inspect(self):
+        overall_time, system_time = self.results
+        return '{}: Accepted {} connections in {}s, Processor time {}s. ' \
+               'Resident memory {} bytes per connection' \
+            .format(self.name, self.params['connections'], overall_time, system_time,
+                    self.rss_per_connection)
+
+export = BenchmarkIdleConnections()
+
+if __name__ == '__main__':
+    export.main()
+    print export.inspect()
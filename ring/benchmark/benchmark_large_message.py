@@ -0,0 +1,84 @@
+from collections import OrderedDict
+import multiprocessing
+import resource
+
+import ring
+from ring import MMAP_THRESHOLD, PULLER, PUSHER
+from ring.benchmark.benchmark import BenchmarkTask
+
+
+def _peak_rss():
+    """Peak resident memory of this process in bytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _send(port, size, received):
+    ctx = ring.Context()
+    connection = ctx.connection(PUSHER)
+    connection.connect(('127.0.0.1', port))
+    connection.send('a' * size)
+    # Stopping the context would drop what is still queued
+    received.wait()
+    connection.close()
+    ctx.stop()
+
+
+class BenchmarkLargeMessage(BenchmarkTask):
+    """Peak resident memory a puller takes to receive one large message.
+
+    The message is sent by a child process, so only the receiving side is measured. Nothing
+    touches the received message, so a memory mapped one is not paged in.
+    """
+
+    def setup(self):
+        self._ctx = ring.Context()
+        self._connection = self._ctx.connection(PULLER)
+        self._sender = None
+        self._received = multiprocessing.Event()
+        self.peak_rss = None
+
+    def tear_down(self):
+        self._received.set()
+        if self._sender is not None:
+            self._sender.join()
+        self._connection.close()
+        self._ctx.stop()
+
+    def run_sync(self, size=None, mmap_threshold=None):
+        if mmap_threshold is not None:
+            self._connection.setsockopt(MMAP_THRESHOLD, mmap_threshold * 1024 * 1024)
+        self._connection.bind(('127.0.0.1', 0))
+        port = self._connection.getsockname()[1]
+        before = _peak_rss()
+
+        self.start_timer()
+        self._sender = multiprocessing.Process(
+            target=_send, args=(port, size * 1024 * 1024, self._received))
+        self._sender.daemon = True
+        self._sender.start()
+        message = self._connection.recv()
+        self.stop_timer()
+
+        assert len(message) == size * 1024 * 1024
+        self.peak_rss = _peak_rss() - before
+
+    @property
+    def args(self):
+        return OrderedDict([
+            ('--size', {'help': 'message size in MB, defaults to 256', 'default': 256,
+                        'type': int}),
+            ('--mmap-threshold', {'help': 'MMAP_THRESHOLD in MB, unset by default',
+                                  'type': int}),
+        ])
+
+    def inspect(self):
+        overall_time, system_time = self.results
+        return '{}: Received {} MB in {}s, Processor time {}s. Peak resident memory grew by {} MB' \
+            .format(self.name, self.params['size'], overall_time, system_time,
+                    self.peak_rss / 1024 / 1024)
+
+export = BenchmarkLargeMessage()
+
+if __name__ == '__main__':
+    export.main()
+    print export.inspect()
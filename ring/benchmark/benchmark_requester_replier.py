@@ -8,13 +8,16 @@ class BenchmarkRequesterReplier(BenchmarkTask):
 
     def setup(self):
         self._ctx = ring.Context()
+        # Nagle's algorithm holds back small requests until the previous segment is acked
+        self._ctx.setsockopt(ring.NODELAY, not self.params.get('nagle'))
         self._connection = self._ctx.connection(ring.REQUESTER)
 
     def tear_down(self):
         self._connection.close()
         self._ctx.stop()
 
-    def run_sync(self, host=None, port=None, scale=None, iteration=None, pkg_size=None):
+    def run_sync(self, host=None, port=None, scale=None, iteration=None, pkg_size=None,
+                 nagle=False):
         self._connection.connect((host, port))
         content = 'a' * 1024 * pkg_size
         self.start_timer()
@@ -29,15 +32,17 @@ class BenchmarkRequesterReplier(BenchmarkTask):
             ('--host', {'help': 'host name', 'required': True}),
             ('--port', {'help': 'host port, defaults to 9000', 'default': 9000, 'type': int}),
             ('--iteration', {'help': 'number of iterations', 'type': int, 'required': True}),
-            ('--pkg-size', {'help': 'package size in KB', 'type': int, 'required': True})
+            ('--pkg-size', {'help': 'package size in KB', 'type': int, 'required': True}),
+            ('--nagle', {'help': 'leave TCP_NODELAY unset', 'action': 'store_true'})
         ])
 
     def inspect(self):
         overall_time, system_time = self.results
         transfer_rate = self.params['pkg_size'] * self.params['iteration'] * 8 \
             / overall_time / (10 ** 3)
-        return '{}: Overall {}s, Processor time {}s. Transfer rate {} Mb/s' \
-            .format(self.name, overall_time, system_time, transfer_rate)
+        latency = overall_time / self.params['iteration'] * (10 ** 6)
+        return '{}: Overall {}s, Processor time {}s. Transfer rate {} Mb/s, latency {} us' \
+            .format(self.name, overall_time, system_time, transfer_rate, latency)
 
 export = BenchmarkRequesterReplier()
 
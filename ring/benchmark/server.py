@@ -1,21 +1,40 @@
 import argparse
 
 import ring
+from ring.server import MODE_PROCESS, MODE_THREAD, Server
 
-ctx = ring.Context()
-connection = ctx.connection(ring.REPLIER)
+
+def echo(obj):
+    return obj
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--port', help='server port', type=int, default=9000)
+    parser.add_argument('--workers', help='serve with a pool of workers', type=int, default=0)
+    parser.add_argument(
+        '--mode', help='worker pool type', choices=[MODE_THREAD, MODE_PROCESS],
+        default=MODE_THREAD)
+    parser.add_argument('--nagle', help='leave TCP_NODELAY unset', action='store_true')
     args = parser.parse_args()
 
-    connection.bind(('', args.port))
-    print 'Port: %d' % (connection.getsockname()[1],)
+    if args.workers:
+        server = Server(('', args.port), echo, args.workers, args.mode, pyobj=True)
+        server.start()
+        print 'Port: %d' % (server.address[1],)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        ctx = ring.Context()
+        ctx.setsockopt(ring.NODELAY, not args.nagle)
+        connection = ctx.connection(ring.REPLIER)
+        connection.bind(('', args.port))
+        print 'Port: %d' % (connection.getsockname()[1],)
 
-    try:
-        while 1:
-            connection.send_pyobj(connection.recv_pyobj())
-    finally:
-        connection.close()
+        try:
+            while 1:
+                connection.send_pyobj(connection.recv_pyobj())
+        finally:
+            connection.close()
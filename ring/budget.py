@@ -0,0 +1,130 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import threading
+
+from ring.utils import get_logger
+
+_logger = get_logger(__name__)
+
+
+class MemoryBudget(object):
+    """Byte counter shared by every pipe of a connection (or of a context).
+
+    Budgets form a chain: a connection budget charges its parent, the context budget, so a
+    single limit can cap the memory held by all connections together. Like pipe watermarks,
+    a limit is only checked before a write, so usage may overshoot it by one message.
+
+    Writers refused for lack of budget leave a waiter, which is called once usage drops to the
+    low watermark (half the limit) again.
+    """
+
+    def __init__(self, limit=None, parent=None):
+        self._lock = threading.RLock()
+        self._limit = limit
+        self._parent = parent
+        self._usage = 0
+        self._waiters = []
+
+    def _chain(self):
+        budget = self
+        while budget is not None:
+            yield budget
+            budget = budget._parent
+
+    def _exhausted(self):
+        return self._limit is not None and self._usage > self._limit
+
+    def _low_watermark(self):
+        return (self._limit + 1) / 2 if self._limit is not None else None
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @limit.setter
+    def limit(self, limit):
+        with self._lock:
+            self._limit = limit
+            if self._exhausted():
+                return
+            waiters = self._waiters
+            self._waiters = []
+        self._notify(waiters)
+
+    @property
+    def usage(self):
+        return self._usage
+
+    def limited(self):
+        """Whether any budget in the chain has a limit."""
+        for budget in self._chain():
+            if budget._limit is not None:
+                return True
+        return False
+
+    def available(self):
+        for budget in self._chain():
+            if budget._exhausted():
+                return False
+        return True
+
+    def acquire(self, size, waiter=None):
+        """Charges ``size`` bytes if no budget in the chain is exhausted.
+
+        Returns False otherwise, after registering ``waiter`` on the exhausted budget, unless
+        it waits there already. Writers retry, so they would pile up otherwise.
+        """
+        chain = list(self._chain())
+        for budget in chain:
+            budget._lock.acquire()
+        try:
+            for budget in chain:
+                if budget._exhausted():
+                    if waiter is not None and waiter not in budget._waiters:
+                        budget._waiters.append(waiter)
+                    return False
+            for budget in chain:
+                budget._usage += size
+            return True
+        finally:
+            for budget in reversed(chain):
+                budget._lock.release()
+
+    def charge(self, size):
+        """Charges ``size`` bytes unconditionally, e.g. for data already read off a socket."""
+        for budget in self._chain():
+            with budget._lock:
+                budget._usage += size
+
+    def release(self, size):
+        waiters = []
+        for budget in self._chain():
+            with budget._lock:
+                previous = budget._usage
+                budget._usage -= size
+                lwm = budget._low_watermark()
+                if budget._waiters and lwm is not None and previous > lwm >= budget._usage:
+                    waiters.extend(budget._waiters)
+                    budget._waiters = []
+        self._notify(waiters)
+
+    @staticmethod
+    def _notify(waiters):
+        for waiter in waiters:
+            try:
+                waiter()
+            except Exception as e:
+                _logger.warning('Exception raised in memory budget waiter: %s', e)
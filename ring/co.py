@@ -26,6 +26,8 @@ _logger = get_logger(__name__)
 
 class Future(object):
 
+    __slots__ = ('_done', '_done_callbacks', '_result', '_exc_info')
+
     def __init__(self):
         self._done = False
         self._done_callbacks = []
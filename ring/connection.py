@@ -13,26 +13,52 @@
 # limitations under the License.
 
 
+import mmap
 import socket
 import os
+import sys
 
 import threading
+import time
 
 import cPickle
 
-from ring.connection_impl import Again
+from ring.connection_impl import Again, RequestFailed, StreamInterrupted
 from ring.constants import (
-    TYPE_ACTIVATE_SEND, TYPE_ACTIVATE_RECV, BACKLOG, TYPE_ERROR, TYPE_CLOSED, TYPE_FINALIZE,
-    TYPE_CONNECT_SUCCESS, ERR_CONNRESET
+    TYPE_ACTIVATE_SEND, TYPE_ACTIVATE_RECV, TYPE_ERROR, TYPE_CLOSED, TYPE_FINALIZE,
+    TYPE_CONNECT_SUCCESS, TYPE_DISCONNECTED, ERR_CONNRESET
 )
 from ring.events import Mailbox
+from ring.options import (
+    SNDHWM_BYTES, RCVHWM_BYTES, MAXMEMORY, SNDHWM, RCVHWM, OVERFLOW, OVERFLOW_BLOCK,
+    OVERFLOW_AGAIN, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST, SPILL_THRESHOLD, SPILL_DIR,
+    BALANCE, BALANCE_ROUND_ROBIN, BALANCE_LEAST_OUTSTANDING, BALANCE_P2C_EWMA, PIPELINE,
+    FAIR_QUANTUM, PEER_WEIGHT, PEER_QUOTA, CREDIT, CREDIT_BYTES,
+    BACKLOG, MAX_CONNECTIONS, REUSEPORT, NODELAY, SNDBUF, RCVBUF, KEEPALIVE, KEEPALIVE_IDLE,
+    KEEPALIVE_INTVL, KEEPALIVE_CNT, QUICKACK, FASTOPEN, MMAP_THRESHOLD, RECONNECT_IVL,
+    RECONNECT_IVL_MAX, HEARTBEAT_IVL, HEARTBEAT_LIVENESS, InvalidOptionError
+)
 from ring.poller import READ
+from ring.protocol import Chunk
+from ring.publisher import PublisherConnectionImpl
 from ring.puller import PullerConnectionImpl
 from ring.pusher import PusherConnectionImpl
 from ring.replier import ReplierConnectionImpl
-from ring.requester import RequesterConnectionImpl
+from ring.requester import RequesterConnectionImpl, PipelinedRequesterConnectionImpl
+from ring.router import RouterConnectionImpl
+from ring.sendfile import FileRegion
+from ring.sockopt import configure_connecting, configure_listening, set_option
+from ring.subscriber import SubscriberConnectionImpl
 from ring.utils import RingError, raise_exc_info
 
+
+def _unpickle(data):
+    if isinstance(data, mmap.mmap):
+        # Received above MMAP_THRESHOLD
+        data = data[:]
+    return cPickle.loads(data)
+
+
 _idle = 1
 _open = 1 << 1
 _closing = 1 << 2
@@ -42,6 +68,16 @@ REPLIER = 1
 REQUESTER = 2
 PULLER = 3
 PUSHER = 5
+ROUTER = 6
+PUBLISHER = 7
+SUBSCRIBER = 8
+
+# Types that may connect to more than one peer
+_MULTI_CONNECT = (PUSHER, REQUESTER, SUBSCRIBER)
+
+# Types whose peers wait for every request or reply, so none may be dropped
+_LOCKSTEP = (REQUESTER, REPLIER, ROUTER)
+_DROP = (OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST)
 
 NONBLOCK = 1
 
@@ -68,6 +104,15 @@ class ConnectionClosedError(RingError):
         super(ConnectionClosedError, self).__init__('Socket closed')
 
 
+class TimeoutError(Again):
+    """Raised when a send or recv given a timeout could not complete in time. The connection
+    is left as it was, so the call may be retried.
+    """
+
+    def __init__(self):
+        super(TimeoutError, self).__init__('Timed out')
+
+
 class Connection(object):
 
     def __init__(self, type, ctx):
@@ -85,6 +130,15 @@ class Connection(object):
 
         self._mailbox = Mailbox()
 
+        self._options = ctx.default_options()
+        if type in _LOCKSTEP and self._options.get(OVERFLOW) in _DROP:
+            # A context wide drop policy does not apply here
+            self._options.set(OVERFLOW, OVERFLOW_BLOCK)
+        self._impl = None
+        self._handlers = None
+        # Subscriptions made before the impl exists
+        self._early_subscriptions = []
+
         self._lock = threading.RLock()
 
     def bind(self, target):
@@ -92,31 +146,43 @@ class Connection(object):
             raise ConnectionClosedError
         if self._state != _idle:
             raise ConnectionInUse
-        if not self._type & (REPLIER | PULLER):
+        if self._type not in (REPLIER, PULLER, ROUTER, PUBLISHER):
             raise NotImplementedError('Bind is not applicable to such type of socket')
 
         self._bound_addr = target[0]
         self._bound_port = target[1]
 
+        reuse_port = self._options.get(REUSEPORT)
+        if reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+            raise NotImplementedError('SO_REUSEPORT is not supported on this platform')
+
         self._initialize_socket()
         self._state = _open
+        if reuse_port:
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        configure_listening(self._socket, self._options)
         self._socket.bind(target)
-        self._socket.listen(BACKLOG)
+        self._socket.listen(self._options.get(BACKLOG))
         self._initialize_impl()
 
     def connect(self, target):
+        """Connects to target. A PUSHER may connect to several pullers, and distributes
+        messages among them. A REQUESTER may connect to several repliers, and balances
+        requests among them.
+        """
         if self._state & (_closing | _closed):
             raise ConnectionClosedError
-        if self._state != _idle:
-            raise ConnectionInUse
-        if not self._type & (REQUESTER | PUSHER):
+        if self._type not in (REQUESTER, PUSHER, SUBSCRIBER):
             raise NotImplementedError('Connect is not applicable to such type of socket')
 
-        self._target_addr = target[0]
-        self._target_port = target[1]
-        self._state = _open
-        self._initialize_socket()
-        self._initialize_impl()
+        if self._state == _idle:
+            self._target_addr = target[0]
+            self._target_port = target[1]
+            self._state = _open
+            self._initialize_socket()
+            self._initialize_impl()
+        elif self._type not in _MULTI_CONNECT:
+            raise ConnectionInUse
 
         self._impl.connect(target)
         self._process_commands(None)
@@ -133,54 +199,82 @@ class Connection(object):
     def _initialize_socket(self):
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._socket.setblocking(0)
-        if self._type & (REPLIER | PULLER):
+        if self._type in (REPLIER, PULLER, ROUTER, PUBLISHER):
             self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        else:
+            configure_connecting(self._socket, self._options)
 
     def _initialize_impl(self):
         if self._type == REPLIER:
-            self._impl = ReplierConnectionImpl(self._socket, self._context, self._mailbox)
+            impl_class = ReplierConnectionImpl
         elif self._type == REQUESTER:
-            self._impl = RequesterConnectionImpl(self._socket, self._context, self._mailbox)
+            if self._options.get(PIPELINE):
+                impl_class = PipelinedRequesterConnectionImpl
+            else:
+                impl_class = RequesterConnectionImpl
         elif self._type == PULLER:
-            self._impl = PullerConnectionImpl(self._socket, self._context, self._mailbox)
+            impl_class = PullerConnectionImpl
         elif self._type == PUSHER:
-            self._impl = PusherConnectionImpl(self._socket, self._context, self._mailbox)
+            impl_class = PusherConnectionImpl
+        elif self._type == ROUTER:
+            impl_class = RouterConnectionImpl
+        elif self._type == PUBLISHER:
+            impl_class = PublisherConnectionImpl
+        elif self._type == SUBSCRIBER:
+            impl_class = SubscriberConnectionImpl
         else:
             raise RuntimeError('Type not implemented')
+        self._impl = impl_class(self._socket, self._context, self._mailbox, self._options)
+        self._initialize_handlers()
+
+        for prefix in self._early_subscriptions:
+            self._impl.subscribe(prefix)
+        self._early_subscriptions = None
+
+    def _initialize_handlers(self):
+        # Handlers return True when no further command should be processed
+        self._handlers = {
+            TYPE_ACTIVATE_SEND: self._impl.activate_send,
+            TYPE_ACTIVATE_RECV: self._impl.activate_recv,
+            TYPE_CONNECT_SUCCESS: self._impl.connection_open,
+            TYPE_DISCONNECTED: self._impl.connection_lost,
+            TYPE_ERROR: self._on_error,
+            TYPE_CLOSED: self._impl.connection_close,
+            TYPE_FINALIZE: self._on_finalize,
+        }
+
+    def _on_error(self, engine_id, exc_info):
+        if self._impl.connection_close(engine_id, exc_info):
+            # A peer was ejected, but the connection still has others to serve
+            return
+        if not getattr(exc_info[1], 'errno', -1) in ERR_CONNRESET:
+            # Only raise the exception when the error is not connection reset
+            raise_exc_info(exc_info)
+
+    def _on_finalize(self, *args):
+        self._impl.connection_finalize()
+        self._connection_finalize()
+
+        # Finalize event should break immediately as everything is closed.
+        return True
 
     def _process_commands(self, timeout):
+        handlers = self._handlers
         while 1:
             try:
                 result = self._mailbox.recv(timeout)
             except Again:
                 return
-            else:
-                cmd = result.command
-                if cmd == TYPE_ACTIVATE_SEND:
-                    self._impl.activate_send(*result.args)
-                elif cmd == TYPE_ACTIVATE_RECV:
-                    self._impl.activate_recv(*result.args)
-                elif cmd == TYPE_CONNECT_SUCCESS:
-                    # Nothing to be done. We're just attempting to block here.
-                    pass
-                elif cmd == TYPE_ERROR:
-                    self._impl.connection_close(*result.args)
-                    if not getattr(result.args[1][1], 'errno', -1) in ERR_CONNRESET:
-                        # Only raise the exception when the error is not connection reset
-                        raise_exc_info(result.args[1])
-                elif cmd == TYPE_CLOSED:
-                    self._impl.connection_close(*result.args)
-                elif cmd == TYPE_FINALIZE:
-                    self._impl.connection_finalize()
-                    self._connection_finalize()
-
-                    # Finalize event should break immediately as everything is closed.
-                    break
-                else:
-                    raise RuntimeError('Received undefined command %s' % (cmd,))
-
-                # Rerun. Set timeout to 0.
-                timeout = 0
+
+            try:
+                handler = handlers[result.command]
+            except KeyError:
+                raise RuntimeError('Received undefined command %s' % (result.command,))
+            if handler(*result.args):
+                break
+
+            # Rerun. Set timeout to 0.
+            timeout = 0
 
     def _connection_finalize(self):
         self._socket.close()
@@ -188,26 +282,139 @@ class Connection(object):
         self._mailbox.close()
         self._state = _closed
 
+    def setsockopt(self, option, value):
+        """Sets a connection option. See ring.options for the available ones.
+
+        Options are best set before bind/connect. Watermarks set afterwards only apply to
+        peers connected later. REQUESTER, REPLIER and ROUTER refuse the drop policies of
+        OVERFLOW.
+        """
+        if self._state & (_closing | _closed):
+            raise ConnectionClosedError
+        if option == OVERFLOW and value in _DROP and self._type in _LOCKSTEP:
+            raise InvalidOptionError(option, value)
+
+        set_option(self._options, option, value)
+        if self._impl is not None:
+            self._impl.set_option(option, value)
+
+    def getsockopt(self, option):
+        return self._options.get(option)
+
+    @property
+    def memory_usage(self):
+        """Bytes currently queued in the pipes of this connection."""
+        if self._impl is None:
+            return 0
+        return self._impl.memory_usage()
+
+    def stats(self):
+        """Counters for monitoring.
+
+        ``dropped_newest``/``dropped_oldest`` count messages discarded by the drop overflow
+        policies, ``refused`` counts writes turned down by a full pipe under the others.
+        """
+        stats = {'memory_usage': self.memory_usage}
+        if self._impl is not None:
+            stats.update(self._impl.stats())
+        return stats
+
+    def subscribe(self, prefix):
+        """Receives the messages starting with prefix. SUBSCRIBER only, and may be called before
+        connect. An empty prefix matches every message.
+        """
+        self._check_subscriber()
+        if self._impl is None:
+            self._early_subscriptions.append(prefix)
+        else:
+            self._impl.subscribe(prefix)
+
+    def unsubscribe(self, prefix):
+        """Cancels one earlier subscription to prefix."""
+        self._check_subscriber()
+        if self._impl is None:
+            if prefix in self._early_subscriptions:
+                self._early_subscriptions.remove(prefix)
+        else:
+            self._impl.unsubscribe(prefix)
+
+    def _check_subscriber(self):
+        if self._type != SUBSCRIBER:
+            raise NotImplementedError('Only subscribers subscribe')
+        if self._state & (_closing | _closed):
+            raise ConnectionClosedError
+
+    def peer_stats(self):
+        """Per peer counters of PULLER, REPLIER and ROUTER: the peer's ``address``, the
+        messages (``depth``) and ``bytes`` queued from it, and the bytes ``served`` to the user.
+
+        A PUSHER reports the messages and bytes queued for each puller instead, the
+        ``credit``/``credit_bytes`` it granted that are left, and whether it is ``connected``.
+        """
+        if self._impl is None:
+            return []
+        return self._impl.peer_stats()
+
     def getsockname(self):
         if self._state != _open:
             raise ConnectionClosedError
 
         return self._socket.getsockname()
 
-    def poll(self, events):
-        return (POLLIN & events & self._impl.recv_available()) | \
-               (POLLOUT & events & self._impl.send_available()) << 1
+    def poll(self, events, timeout=0):
+        """Returns which of ``events``, POLLIN and POLLOUT, the connection is ready for,
+        waiting up to ``timeout`` seconds for any, or for ever if None. Returns 0 if none is
+        ready in time.
+        """
+        if self._state != _open:
+            raise ConnectionClosedError
+
+        deadline = None if timeout is None else time.time() + timeout
+        self._process_commands(0)
+        while 1:
+            ready = (POLLIN & events & self._impl.recv_available()) | \
+                (POLLOUT & events & self._impl.send_available()) << 1
+            if ready:
+                return ready
+            try:
+                self._wait(deadline)
+            except TimeoutError:
+                return 0
+
+    def _check_peers(self):
+        # Finalized while open, as the last peer is gone. There is nowhere to send to.
+        if self._state != _open:
+            raise ConnectionClosedError
 
-    def recv(self, flags=0):
+    def _wait(self, deadline):
+        # Waits for commands and processes them, or raises TimeoutError past the deadline
+        if deadline is None:
+            self._process_commands(None)
+            return
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise TimeoutError
+        self._process_commands(remaining)
+
+    def recv(self, flags=0, timeout=None):
+        """Receives a message. Blocks until one arrives, unless NONBLOCK is given, in which
+        case Again is raised if none is queued. With a ``timeout``, TimeoutError is raised if
+        none arrives within that many seconds.
+        """
+        return self._receive(self._impl.recv, flags, timeout)
+
+    def _receive(self, method, flags=0, timeout=None):
         if self._state != _open:
             raise ConnectionClosedError
 
+        deadline = None if timeout is None else time.time() + timeout
+
         # Process once
         self._process_commands(0)
 
         # Receive once
         try:
-            return self._impl.recv()
+            return method()
         except Again:
             if not flags & NONBLOCK:
                 # If the connection should block, wait until recv is activated
@@ -218,24 +425,39 @@ class Connection(object):
 
             # Let's wait
             while 1:
-                self._process_commands(None)
+                self._wait(deadline)
                 try:
-                    return self._impl.recv()
+                    return method()
                 except Again:
                     continue
 
-    def send(self, data, flags=0):
+    def send(self, data, flags=0, timeout=None):
+        """Sends data. A pipelined REQUESTER returns the correlation id of the request.
+
+        Blocks while the connection is full, unless NONBLOCK is given, in which case Again is
+        raised. With a ``timeout``, TimeoutError is raised if the data could not be queued
+        within that many seconds.
+
+        A ROUTER sends (token, reply) pairs, and may do so from any thread. It blocks while the
+        requester's send queue is full.
+        """
         if self._state != _open:
             raise ConnectionClosedError
 
+        deadline = None if timeout is None else time.time() + timeout
+
+        if self._type == ROUTER:
+            return self._send_routed(lambda: self._impl.send(data), flags, deadline)
+
         # Process once
         self._process_commands(0)
+        self._check_peers()
 
         # Send once
         try:
-            self._impl.send(data)
+            return self._impl.send(data)
         except Again:
-            if not flags & NONBLOCK:
+            if not flags & NONBLOCK and self._options.get(OVERFLOW) != OVERFLOW_AGAIN:
                 # If the connection should block, wait until send is activated
                 pass
             else:
@@ -244,17 +466,194 @@ class Connection(object):
 
             # Let's wait
             while 1:
-                self._process_commands(None)
+                self._wait(deadline)
+                self._check_peers()
                 try:
-                    self._impl.send(data)
-                    break
+                    return self._impl.send(data)
                 except Again:
                     continue
 
-    def recv_pyobj(self, flags=0):
-        return cPickle.loads(self.recv(flags=flags))
+    def _send_routed(self, method, flags, deadline):
+        # Waits for room without the mailbox, which is left to the receiving thread
+        while 1:
+            count = self._impl.writable_count()
+            try:
+                return method()
+            except Again:
+                if flags & NONBLOCK or self._options.get(OVERFLOW) == OVERFLOW_AGAIN:
+                    raise
+
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise TimeoutError
+            self._impl.wait_writable(count, remaining)
+            if self._state != _open:
+                raise ConnectionClosedError
+
+    def send_file(self, source, offset=0, count=None, flags=0):
+        """Sends ``count`` bytes of a file from ``offset`` as one message, received like any
+        other. ``source`` is a path or a file descriptor, which may be closed once this returns.
+        ``count`` defaults to the rest of the file.
+
+        The IO thread has the kernel copy the bytes from the file to the socket, so they never
+        pass through Python. The file must not shrink until they are sent.
+        """
+        if self._type not in (PUSHER, REQUESTER, REPLIER):
+            raise NotImplementedError('Send file is not applicable to such type of socket')
+        return self.send(FileRegion.open(source, offset, count), flags)
+
+    def send_stream(self, chunks):
+        """Sends the chunks of an iterable as one message, each as soon as it is produced.
+
+        A PUSHER sends them all to the same puller, a REPLIER as the reply to the last request,
+        unless it was pipelined. The receiver may get the message whole with recv, or chunk by
+        chunk with recv_stream. If the iterable raises, the message is aborted, and the
+        receiver gets StreamInterrupted instead.
+        """
+        if self._type not in (PUSHER, REPLIER):
+            raise NotImplementedError('Send stream is not applicable to such type of socket')
+
+        chunks = iter(chunks)
+        while 1:
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                break
+            except:
+                exc_info = sys.exc_info()
+                try:
+                    self.send(Chunk(b'', False, aborted=True))
+                except StreamInterrupted:
+                    pass
+                raise_exc_info(exc_info)
+            if chunk:
+                self.send(Chunk(chunk, True))
+        self.send(Chunk(b'', False))
+
+    def recv_stream(self):
+        """Returns an iterator over the chunks of the next message, yielding each as it
+        arrives. Messages not sent with send_stream come as a single chunk. PULLER and
+        non-pipelined REQUESTER only.
+
+        Read the iterator to its end before receiving anything else. It raises
+        StreamInterrupted if the sender aborts the message or goes in the middle of it.
+        """
+        if self._type not in (PULLER, REQUESTER) or self._options.get(PIPELINE):
+            raise NotImplementedError('Recv stream is not applicable to such type of socket')
+        return self._iterate_chunks()
+
+    def _iterate_chunks(self):
+        empty = True
+        while 1:
+            chunk, more = self._receive(self._impl.recv_chunk)
+            # A stream ends with an empty chunk, only passed on if the whole message is empty
+            if chunk or (empty and not more):
+                empty = False
+                yield chunk
+            if not more:
+                return
 
-    def send_pyobj(self, data, flags=0):
-        self.send(cPickle.dumps(data), flags=flags)
+    def recv_many(self, max_count, timeout=None):
+        """Receives up to max_count messages already queued, waiting for the first one for at
+        most ``timeout`` seconds. Returns an empty list if none arrived in time.
+        """
+        if self._state != _open:
+            raise ConnectionClosedError
+
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        # Process once
+        self._process_commands(0)
 
-__all__ = ['Connection', 'REPLIER', 'REQUESTER', 'PULLER', 'PUSHER', 'NONBLOCK']
+        while 1:
+            try:
+                return self._impl.recv_many(max_count)
+            except Again:
+                pass
+
+            if timeout is None:
+                self._process_commands(None)
+            else:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return []
+                self._process_commands(remaining)
+
+    def send_many(self, iterable, flags=0):
+        """Sends all messages of iterable, queueing them in batches.
+
+        Returns the number of messages sent. With NONBLOCK that may be fewer than given, or
+        Again is raised if none could be sent.
+        """
+        if self._state != _open:
+            raise ConnectionClosedError
+
+        items = list(iterable)
+
+        if self._type == ROUTER:
+            sent = 0
+            while sent < len(items):
+                try:
+                    sent += self._send_routed(
+                        lambda: self._impl.send_many(items[sent:]), flags, None)
+                except Again:
+                    if sent:
+                        return sent
+                    raise
+            return sent
+
+        # Process once
+        self._process_commands(0)
+
+        sent = 0
+        while sent < len(items):
+            self._check_peers()
+            try:
+                sent += self._impl.send_many(items[sent:] if sent else items)
+            except Again:
+                if flags & NONBLOCK or self._options.get(OVERFLOW) == OVERFLOW_AGAIN:
+                    if sent:
+                        return sent
+                    raise
+                self._process_commands(None)
+        return sent
+
+    def _loads(self, data):
+        if isinstance(data, tuple):
+            # Paired with a ROUTER token or a pipelined request's id
+            return data[0], _unpickle(data[1])
+        return _unpickle(data)
+
+    def _dumps(self, data):
+        if self._type == ROUTER:
+            token, obj = data
+            return token, cPickle.dumps(obj)
+        return cPickle.dumps(data)
+
+    def recv_pyobj(self, flags=0, timeout=None):
+        return self._loads(self.recv(flags=flags, timeout=timeout))
+
+    def send_pyobj(self, data, flags=0, timeout=None):
+        return self.send(self._dumps(data), flags=flags, timeout=timeout)
+
+    def recv_pyobj_many(self, max_count, timeout=None):
+        return [self._loads(data) for data in self.recv_many(max_count, timeout)]
+
+    def send_pyobj_many(self, iterable, flags=0):
+        return self.send_many([self._dumps(data) for data in iterable], flags=flags)
+
+__all__ = ['Connection', 'REPLIER', 'REQUESTER', 'PULLER', 'PUSHER', 'ROUTER', 'PUBLISHER',
+           'SUBSCRIBER', 'NONBLOCK',
+           'SNDHWM_BYTES', 'RCVHWM_BYTES', 'MAXMEMORY', 'SNDHWM', 'RCVHWM', 'OVERFLOW',
+           'OVERFLOW_BLOCK', 'OVERFLOW_AGAIN', 'OVERFLOW_DROP_NEWEST', 'OVERFLOW_DROP_OLDEST',
+           'SPILL_THRESHOLD', 'SPILL_DIR', 'BALANCE', 'BALANCE_ROUND_ROBIN',
+           'BALANCE_LEAST_OUTSTANDING', 'BALANCE_P2C_EWMA', 'PIPELINE',
+           'FAIR_QUANTUM', 'PEER_WEIGHT', 'PEER_QUOTA', 'CREDIT', 'CREDIT_BYTES',
+           'BACKLOG', 'MAX_CONNECTIONS', 'REUSEPORT', 'NODELAY', 'SNDBUF', 'RCVBUF',
+           'KEEPALIVE', 'KEEPALIVE_IDLE', 'KEEPALIVE_INTVL', 'KEEPALIVE_CNT', 'QUICKACK',
+           'FASTOPEN', 'MMAP_THRESHOLD', 'RECONNECT_IVL', 'RECONNECT_IVL_MAX', 'HEARTBEAT_IVL',
+           'HEARTBEAT_LIVENESS',
+           'RequestFailed', 'StreamInterrupted', 'TimeoutError']
@@ -13,6 +13,17 @@
 # limitations under the License.
 
 
+import collections
+import socket
+
+from ring.backoff import Backoff
+from ring.budget import MemoryBudget
+from ring.heartbeat import Heartbeat
+from ring.options import (
+    HEARTBEAT_IVL, HEARTBEAT_LIVENESS, MAXMEMORY, MMAP_THRESHOLD, RECONNECT_IVL,
+    RECONNECT_IVL_MAX, SPILL_DIR, Options
+)
+from ring.sockopt import configure_connecting
 from ring.utils import RingError
 
 
@@ -24,13 +35,74 @@ class Done(RingError):
     pass
 
 
+class RequestFailed(RingError):
+
+    def __init__(self, request_id=None):
+        super(RequestFailed, self).__init__('Peer lost before replying')
+        # Correlation id of the failed request, when pipelining
+        self.request_id = request_id
+
+
+class StreamInterrupted(RingError):
+
+    def __init__(self):
+        super(StreamInterrupted, self).__init__('Streamed message ended unfinished')
+
+
 # Isolated to prevent circular import
 class ConnectionImpl(object):
 
-    def __init__(self, socket, ctx, mailbox):
+    def __init__(self, socket, ctx, mailbox, options=None):
         self._socket = socket
         self._context = ctx
         self._mailbox = mailbox
+        self._options = options if options is not None else Options()
+        self._budget = MemoryBudget(self._options.get(MAXMEMORY), parent=ctx.memory_budget)
+        self._stats = collections.Counter()
+
+    def set_option(self, option, value):
+        # Most options are read whenever a peer's pipes are created. Only those that affect
+        # shared state need to be applied here.
+        if option == MAXMEMORY:
+            self._budget.limit = value
+
+    def memory_usage(self):
+        return self._budget.usage
+
+    def _engine_options(self):
+        # Keyword arguments of the StreamEngine of any peer
+        interval = self._options.get(HEARTBEAT_IVL)
+        if interval is None:
+            return {}
+        return {'heartbeat': Heartbeat(interval, self._options.get(HEARTBEAT_LIVENESS))}
+
+    def _recv_options(self):
+        # Keyword arguments of the StreamEngine of a peer that messages are received from
+        options = self._engine_options()
+        options.update(mmap_threshold=self._options.get(MMAP_THRESHOLD),
+                       mmap_dir=self._options.get(SPILL_DIR))
+        return options
+
+    def _connecting_socket(self):
+        so = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        so.setblocking(0)
+        configure_connecting(so, self._options)
+        return so
+
+    def _reconnect_options(self):
+        # Keyword arguments of the StreamEngine of a peer connected to, to redial it once lost
+        options = self._engine_options()
+        initial = self._options.get(RECONNECT_IVL)
+        if initial is not None:
+            options.update(backoff=Backoff(initial, self._options.get(RECONNECT_IVL_MAX)),
+                           new_socket=self._connecting_socket)
+        return options
+
+    def stats(self):
+        return dict(self._stats)
+
+    def peer_stats(self):
+        return []
 
     def close(self):
         pass
@@ -41,9 +113,24 @@ class ConnectionImpl(object):
     def recv(self):
         raise NotImplementedError
 
+    def recv_chunk(self):
+        """Returns the next chunk of a streamed message and whether more follow. Other
+        messages come whole, as a single chunk.
+        """
+        raise NotImplementedError('Streams are not received by such type of socket')
+
     def send(self, data):
         raise NotImplementedError
 
+    def recv_many(self, max_count):
+        # Types that can queue up several messages override this
+        return [self.recv()]
+
+    def send_many(self, items):
+        """Sends a prefix of items. Returns the number sent, or raises Again if none was."""
+        self.send(items[0])
+        return 1
+
     def send_available(self):
         raise NotImplementedError
 
@@ -57,7 +144,46 @@ class ConnectionImpl(object):
         raise NotImplementedError
 
     def connection_close(self, engine_id, err):
+        """Drops the peer of engine_id. Returns True if the connection goes on serving other
+        peers, in which case an error of the peer is not raised to the user.
+        """
         raise NotImplementedError
 
+    def connection_lost(self, engine_id):
+        """Called when the peer of engine_id is lost, or failed to connect, and is being
+        redialed. Its pipes are kept.
+        """
+        pass
+
+    def connection_open(self, engine_id):
+        """Called when the peer of engine_id is connected, including after being redialed."""
+        pass
+
     def connection_finalize(self):
         raise NotImplementedError
+
+
+class JoinChunksMixin(object):
+    """recv for impls implementing recv_chunk. The chunks of a streamed message are joined."""
+
+    _partial = None
+
+    def recv(self):
+        while 1:
+            try:
+                data, more = self.recv_chunk()
+            except Again:
+                raise
+            except Exception:
+                # The message is lost
+                self._partial = None
+                raise
+            if not more and self._partial is None:
+                return data
+            if self._partial is None:
+                self._partial = []
+            self._partial.append(data)
+            if not more:
+                data = b''.join(self._partial)
+                self._partial = None
+                return data
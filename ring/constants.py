@@ -44,6 +44,7 @@ BACKLOG = 128
 TYPE_ACTIVATE_SEND = 1
 TYPE_ACTIVATE_RECV = 2
 TYPE_CONNECT_SUCCESS = 3
+TYPE_DISCONNECTED = 4
 
 TYPE_ERROR = 5
 TYPE_CLOSED = 6
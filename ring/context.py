@@ -13,18 +13,38 @@
 # limitations under the License.
 
 
+import os
 from threading import Thread, Event
 
+from ring.budget import MemoryBudget
 from ring.connection import Connection
 from ring.io_loop import IOLoop
-from ring.utils import get_logger
+from ring.options import Options
+from ring.sockopt import set_option
+from ring.utils import RingError, get_logger
 
 _logger = get_logger(__name__)
 
 
-class Context(object):
+class ContextForkedError(RingError):
 
     def __init__(self):
+        super(ContextForkedError, self).__init__(
+            'Context was created by the parent process. Create a new one after fork')
+
+
+class Context(object):
+    """Runs the IO threads of connections.
+
+    A forked child inherits the contexts of its parent, but not their threads, so it cannot use
+    them. It may create its own instead.
+    """
+
+    def __init__(self, max_memory=None):
+        """``max_memory`` caps the bytes queued by all connections of this context together."""
+        self._pid = os.getpid()
+        self._memory_budget = MemoryBudget(max_memory)
+        self._options = Options()
         self._io_loop = None
         self._io_loop_thread = None
         self._reaper = None
@@ -59,7 +79,16 @@ class Context(object):
         self._reaper_initialized_event.wait()
         self._started = True
 
+    @property
+    def forked(self):
+        """Whether this context was inherited from the parent process."""
+        return self._pid != os.getpid()
+
     def stop(self):
+        if self.forked:
+            # The threads are gone, and their fds are shared with the parent
+            return
+
         self._io_loop.next_tick(self._io_loop.stop)
         self._io_loop_thread.join(5)
         if self._io_loop_thread.isAlive():
@@ -70,8 +99,20 @@ class Context(object):
         if self._reaper_thread.isAlive():
             _logger.warning('Context Reaper thread failed to stop within 5 secs')
 
+    def setsockopt(self, option, value):
+        """Sets the default of a connection option, for connections created afterwards."""
+        set_option(self._options, option, value)
+
+    def getsockopt(self, option):
+        return self._options.get(option)
+
+    def default_options(self):
+        return self._options.copy()
+
     def connection(self, type):
         assert self._started
+        if self.forked:
+            raise ContextForkedError
         return Connection(type, self)
 
     def run_in_background(self, cb, *args, **kwargs):
@@ -87,3 +128,12 @@ class Context(object):
     def reaper(self):
         assert self._started
         return self._reaper
+
+    @property
+    def memory_budget(self):
+        return self._memory_budget
+
+    @property
+    def memory_usage(self):
+        """Bytes currently queued in the pipes of all connections of this context."""
+        return self._memory_budget.usage
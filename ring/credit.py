@@ -0,0 +1,112 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from struct import calcsize, pack, unpack
+
+from ring.protocol import Control
+
+# Control message of a puller granting its pusher credit, followed by FMT_GRANT
+GRANT = b'\x02'
+FMT_GRANT = '>II'
+LEN_GRANT = calcsize(FMT_GRANT)
+# Granted for a dimension the puller does not limit
+UNLIMITED = 0xffffffff
+
+
+def generate_grant(messages, nbytes):
+    return Control(GRANT + pack(FMT_GRANT, messages, nbytes))
+
+
+def parse_grant(message):
+    """Returns the (messages, bytes) granted by a control message, or None if it is not a
+    grant.
+    """
+    if not isinstance(message, Control) or len(message.data) != len(GRANT) + LEN_GRANT or \
+            not message.data.startswith(GRANT):
+        return None
+    return unpack(FMT_GRANT, message.data[len(GRANT):])
+
+
+class Credit(object):
+    """What a pusher may still send to one peer.
+
+    Unlimited until the peer grants any, so pullers that do not take part in flow control are
+    served as before. A message is sent as long as some credit is left, even if it is larger
+    than that, so messages larger than the window still get through.
+    """
+
+    __slots__ = ('messages', 'bytes')
+
+    def __init__(self):
+        self.messages = None
+        self.bytes = None
+
+    def grant(self, messages, nbytes):
+        if messages != UNLIMITED:
+            self.messages = (self.messages or 0) + messages
+        if nbytes != UNLIMITED:
+            self.bytes = (self.bytes or 0) + nbytes
+
+    def available(self):
+        return (self.messages is None or self.messages > 0) and \
+            (self.bytes is None or self.bytes > 0)
+
+    def bytes_available(self):
+        return self.bytes is None or self.bytes > 0
+
+    def take(self, size, message=True):
+        """Counts size bytes sent. Chunks of a streamed message after the first count as no
+        message.
+        """
+        if self.messages is not None and message:
+            self.messages -= 1
+        if self.bytes is not None:
+            self.bytes -= size
+
+
+class Window(object):
+    """What a puller grants one peer: the whole window up front, then whatever the user
+    received, once that reaches half the window, so grants stay rare.
+    """
+
+    __slots__ = ('_messages', '_bytes', '_received', '_received_bytes')
+
+    def __init__(self, messages, nbytes):
+        self._messages = messages
+        self._bytes = nbytes
+        self._received = 0
+        self._received_bytes = 0
+
+    def initial_grant(self):
+        return generate_grant(
+            UNLIMITED if self._messages is None else self._messages,
+            UNLIMITED if self._bytes is None else self._bytes)
+
+    def consume(self, size, message=True):
+        """Counts a message received by the user, or a chunk of one, which counts as a message
+        once it is the last. Returns the grant to send back, if due.
+        """
+        if message:
+            self._received += 1
+        self._received_bytes += size
+        if (self._messages is None or self._received * 2 < self._messages) and \
+                (self._bytes is None or self._received_bytes * 2 < self._bytes):
+            return None
+
+        grant = generate_grant(
+            UNLIMITED if self._messages is None else self._received,
+            UNLIMITED if self._bytes is None else self._received_bytes)
+        self._received = self._received_bytes = 0
+        return grant
@@ -0,0 +1,92 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from ring.connection import NONBLOCK
+from ring.connection_impl import Again
+from ring.poller import READ
+from ring.utils import get_logger
+
+_logger = get_logger(__name__)
+
+# Messages moved per pass, so one busy proxy does not hog the IO loop
+_BATCH = 256
+
+
+class Proxy(object):
+    """Forwards every message received by frontend to backend, on the context's IO loop.
+
+    Both connections' mailboxes are watched by the IO loop instead of a user thread.
+    Messages are moved as they are, without copying. While backend refuses messages, nothing
+    more is taken from frontend, so watermarks on both sides hold back the upstream peers.
+
+    Neither connection may be used by other threads while proxied.
+    """
+
+    def __init__(self, frontend, backend):
+        self._frontend = frontend
+        self._backend = backend
+        self._io_loop = frontend._context.io_loop
+        # Messages taken from frontend that backend has not accepted yet
+        self._pending = []
+        self._started = False
+
+    def start(self):
+        self._started = True
+        for connection in (self._frontend, self._backend):
+            self._io_loop.register(
+                connection._mailbox.waker_fd, READ, lambda fd, events: self._forward())
+        # Messages may have been queued before
+        self._io_loop.next_tick(self._forward)
+
+    def stop(self):
+        """Stops forwarding. Messages taken from frontend but not yet sent are discarded."""
+        self._started = False
+        for connection in (self._frontend, self._backend):
+            self._io_loop.unregister(connection._mailbox.waker_fd)
+
+    def _forward(self):
+        if not self._started:
+            return
+
+        try:
+            # Both mailboxes must be drained, or the IO loop would keep polling them readable
+            self._frontend._process_commands(0)
+            self._backend._process_commands(0)
+
+            for _ in xrange(_BATCH):
+                if not self._pending:
+                    self._pending = self._frontend.recv_many(_BATCH, timeout=0)
+                    if not self._pending:
+                        return
+                try:
+                    sent = self._backend.send_many(self._pending, NONBLOCK)
+                except Again:
+                    # Resumed by the backend's activation
+                    return
+                del self._pending[:sent]
+            # Let others run, then carry on
+            self._io_loop.next_tick(self._forward)
+        except Exception:
+            _logger.exception('Proxy stopped on error')
+            self.stop()
+
+
+def proxy(frontend, backend):
+    """Starts forwarding messages from frontend to backend, e.g. from a PULLER to a PUSHER.
+
+    Returns the Proxy, whose stop method ends forwarding.
+    """
+    device = Proxy(frontend, backend)
+    device.start()
+    return device
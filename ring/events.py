@@ -13,20 +13,26 @@
 # limitations under the License.
 
 
+import collections
 import threading
 
-from ring.connection_impl import Again
-from ring.pipes import Pipe
 from ring.utils import InconsistentStateError
 from ring.waker import Waker
 
 
 class Mail(object):
+    """A mailbox command.
 
-    def __init__(self, command, *args, **kwargs):
+    Mails that are posted repeatedly, like activations, are allocated once and reused. While
+    such a mail is still queued, posting it again is a no-op.
+    """
+
+    __slots__ = ('command', 'args', 'pending')
+
+    def __init__(self, command, *args):
         self.command = command
         self.args = args
-        self.kwargs = kwargs
+        self.pending = False
 
 
 class Mailbox(object):
@@ -34,20 +40,41 @@ class Mailbox(object):
 
     def __init__(self):
         self._waker = Waker()
-        self._pipe = Pipe()
+        self._queue = collections.deque()
+        self._readable = False
         self._active = False
         self._lock = threading.RLock()
 
     def send(self, msg):
+        is_mail = isinstance(msg, Mail)
         with self._lock:
-            if not self._pipe.write(msg):
+            if is_mail:
+                if msg.pending:
+                    # Coalesced with the same mail still queued
+                    return
+                msg.pending = True
+            self._queue.append(msg)
+            if not self._readable:
+                # Only the first mail of a batch needs to wake the receiver up
+                self._readable = True
                 self._waker.wake()
 
+    def _pop(self):
+        with self._lock:
+            try:
+                msg = self._queue.popleft()
+            except IndexError:
+                self._readable = False
+                raise
+            if isinstance(msg, Mail):
+                msg.pending = False
+            return msg
+
     def recv(self, timeout=None):
         if self._active:
             try:
-                return self._pipe.read()[0]
-            except Again:
+                return self._pop()
+            except IndexError:
                 self._active = False
 
         self._waker.wait(timeout)
@@ -56,10 +83,10 @@ class Mailbox(object):
         self._active = True
 
         try:
-            return self._pipe.read()[0]
-        except Again:
+            return self._pop()
+        except IndexError:
             # Should not happen, otherwise it's a bug
-            raise InconsistentStateError('Pipe is still empty after waiting for waker. BUG.')
+            raise InconsistentStateError('Mailbox is still empty after waiting for waker. BUG.')
 
     def close(self):
         with self._lock:
@@ -0,0 +1,79 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import errno
+import os
+import socket
+
+from ring.protocol import Control, generate_frames
+from ring.utils import SocketError
+
+# Control messages probing a quiet peer, and answering a probe. Never delivered to the user.
+PING = b'\x03'
+PONG = b'\x04'
+# Tells the peer that its messages are held back until the user catches up, so probes queued
+# behind them cannot be answered. Any other frame, e.g. a PONG, ends that.
+BUSY = b'\x05'
+
+PING_FRAME = b''.join(generate_frames(Control(PING)))
+PONG_FRAME = b''.join(generate_frames(Control(PONG)))
+BUSY_FRAME = b''.join(generate_frames(Control(BUSY)))
+
+
+class HeartbeatExpired(SocketError):
+
+    def __init__(self):
+        # Reported like a connection timed out by TCP
+        super(HeartbeatExpired, self).__init__(
+            'Peer missed its heartbeats',
+            socket.error(errno.ETIMEDOUT, os.strerror(errno.ETIMEDOUT)))
+
+
+class Heartbeat(object):
+    """Whether a peer is still heard from.
+
+    Ticked every ``interval`` seconds. A peer quiet since the previous tick is pinged, and
+    declared dead once ``liveness`` pings in a row go unanswered. Any frame received, and any
+    write the peer takes, counts, so peers exchanging messages are never pinged. Neither are
+    peers that said they are ``busy``.
+    """
+
+    __slots__ = ('interval', 'heard', 'busy', '_liveness', '_missed')
+
+    def __init__(self, interval, liveness):
+        self.interval = interval
+        # Set by the engine on every frame received
+        self.heard = False
+        # Set by the engine on BUSY, and cleared on any other frame
+        self.busy = False
+        self._liveness = liveness
+        self._missed = 0
+
+    def tick(self, listening, blocked=False):
+        """Returns whether to ping the peer, or raises HeartbeatExpired if it is dead. Ticks
+        while not ``listening``, e.g. as reading is paused by a full recv pipe, do not count.
+        Neither do ticks while writes are ``blocked``, as a ping would not get through, or while
+        the peer is busy: a peer slow to read is not dead.
+        """
+        if self.heard or not listening:
+            self.heard = False
+            self._missed = 0
+            return False
+        if blocked or self.busy:
+            return False
+        self._missed += 1
+        if self._missed > self._liveness:
+            raise HeartbeatExpired
+        return True
@@ -14,6 +14,7 @@
 # limitations under the License.
 
 
+import os
 import threading
 import errno
 import traceback
@@ -58,6 +59,8 @@ _COUNTER = _count()
 
 class Timeout(object):
 
+    __slots__ = ('time', 'callback')
+
     def __init__(self, time, cb):
         self.time = (time, next(_COUNTER))
         self.callback = cb
@@ -74,16 +77,33 @@ class IOLoop(object):
     _creation_lock = threading.RLock()
 
     _instances = {}
+    # Process the instances belong to. A forked child inherits them without their threads, and
+    # its threads may reuse their idents.
+    _pid = os.getpid()
+
+    @staticmethod
+    def _check_fork():
+        if IOLoop._pid != os.getpid():
+            for io_loop in IOLoop._instances.itervalues():
+                # Stopping them would unregister fds from the epoll instance shared with the
+                # parent. Let them go quietly.
+                io_loop._started = False
+            # The lock may have been held by another thread of the parent
+            IOLoop._creation_lock = threading.RLock()
+            IOLoop._instances = {}
+            IOLoop._pid = os.getpid()
 
     @staticmethod
     def get_thread_instance(*args, **kwargs):
+        IOLoop._check_fork()
         with IOLoop._creation_lock:
             identifier = threading.currentThread().ident
             if identifier not in IOLoop._instances:
                 IOLoop._instances[identifier] = IOLoop(*args, **kwargs)
-        return IOLoop._instances[identifier]
+            return IOLoop._instances[identifier]
 
     def set_as_thread_instance(self):
+        IOLoop._check_fork()
         IOLoop._instances[threading.currentThread().ident] = self
 
     def __init__(self, poller=None, no_waker=False):
@@ -199,7 +219,7 @@ class IOLoop(object):
             if num_cbs != 0:
                 poll_timeout = 0
             elif len(self._timeouts) != 0:
-                poll_timeout = max(0, min(_POLL_TIMEOUT, time.time() - self._timeouts[0].time[0]))
+                poll_timeout = max(0, min(_POLL_TIMEOUT, self._timeouts[0].time[0] - time.time()))
             else:
                 poll_timeout = _POLL_TIMEOUT
 
@@ -0,0 +1,50 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import mmap
+import os
+import tempfile
+
+
+class MappedWriter(object):
+    """Collects the frames of a large received message in a temporary file, mapped into memory
+    once complete. The file is unlinked right away, so its disk space is reclaimed as soon as
+    the map is closed or collected. The OS pages the message in and out of the file rather than
+    holding it on the heap.
+    """
+
+    __slots__ = ('_file', 'size')
+
+    def __init__(self, directory=None):
+        fd, path = tempfile.mkstemp(prefix='ring-recv-', suffix='.msg', dir=directory)
+        os.unlink(path)
+        self._file = os.fdopen(fd, 'w+b')
+        self.size = 0
+
+    def append(self, data):
+        self._file.write(data)
+        self.size += len(data)
+
+    def finish(self):
+        """Returns the message as a read-only mmap."""
+        self._file.flush()
+        try:
+            # The map outlives the file
+            return mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            self._file.close()
+
+    def close(self):
+        self._file.close()
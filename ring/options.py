@@ -0,0 +1,230 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from ring.constants import BACKLOG as DEFAULT_BACKLOG
+from ring.utils import RingError
+
+# Connection options, as passed to Connection.setsockopt()
+
+# Byte based high watermarks of each peer's send/recv pipe. None means unlimited.
+SNDHWM_BYTES = 1
+RCVHWM_BYTES = 2
+# Bytes all pipes of a connection may hold together. None means unlimited.
+MAXMEMORY = 3
+# Message count based high watermarks of each peer's send/recv pipe. None means unlimited.
+SNDHWM = 4
+RCVHWM = 5
+# What happens to a message written to a pipe above its watermarks, see OVERFLOW_*.
+OVERFLOW = 6
+# Bytes a pusher may keep in memory per peer before further messages spill to disk.
+# None disables spilling.
+SPILL_THRESHOLD = 7
+# Directory of spill segment files. None means the system's temporary directory.
+SPILL_DIR = 8
+# How a requester connected to several repliers picks one per request, see BALANCE_*.
+BALANCE = 9
+# Whether a requester may have many requests in flight, matched to replies by correlation id.
+PIPELINE = 10
+# Bytes a peer of a puller or replier is credited per round of fair queuing, times its weight.
+FAIR_QUANTUM = 11
+# Callable taking the address of a peer of a puller or replier, returning its weight in fair
+# queuing. None weighs every peer 1.
+PEER_WEIGHT = 12
+# Callable taking the address of a peer of a puller or replier, returning the bytes its recv
+# pipe may hold, in place of RCVHWM_BYTES. None applies RCVHWM_BYTES to every peer.
+PEER_QUOTA = 13
+# Messages a puller lets each pusher send ahead of what the user has received, granted over
+# the wire and replenished as the user receives. None means unlimited.
+CREDIT = 14
+# Like CREDIT, but counting bytes.
+CREDIT_BYTES = 15
+# Length of the listen queue of a bound connection, for clients waiting to be accepted.
+BACKLOG = 16
+# Peers a bound connection accepts at most. Further clients wait in the listen queue until a
+# peer goes. None means unlimited.
+MAX_CONNECTIONS = 17
+# Whether bind sets SO_REUSEPORT, so connections of several processes may bind the same port,
+# and the kernel spreads incoming clients among them.
+REUSEPORT = 18
+# TCP socket options, applied to connecting and accepted sockets. See ring.sockopt.
+# Whether TCP_NODELAY disables Nagle's algorithm, so small messages leave at once.
+NODELAY = 19
+# Kernel buffer sizes in bytes. None keeps the system's default.
+SNDBUF = 20
+RCVBUF = 21
+# Whether SO_KEEPALIVE probes idle peers, and the seconds idle before the first probe, the
+# seconds between probes and the unanswered probes before the peer is dropped. None keeps the
+# system's default.
+KEEPALIVE = 22
+KEEPALIVE_IDLE = 23
+KEEPALIVE_INTVL = 24
+KEEPALIVE_CNT = 25
+# Whether TCP_QUICKACK is set when the socket is set up. Linux clears it again on its own, so
+# it only speeds up the first acks, e.g. of a short exchange right after connecting.
+QUICKACK = 26
+# TCP_FASTOPEN queue length of a bound connection, letting clients send data with their SYN.
+# Connecting connections with any value try fast open. None disables it.
+FASTOPEN = 27
+# Bytes above which a received message is collected in a temporary file in SPILL_DIR, and
+# received as a read-only mmap of it. None keeps every message on the heap.
+MMAP_THRESHOLD = 28
+# Seconds a pusher or requester waits before redialing a lost peer, doubling on each failed
+# attempt up to RECONNECT_IVL_MAX, and jittered. None drops lost peers instead.
+RECONNECT_IVL = 29
+RECONNECT_IVL_MAX = 30
+# Seconds between heartbeats. A peer quiet for that long is pinged, and dropped once
+# HEARTBEAT_LIVENESS pings in a row go unanswered. None disables heartbeats.
+HEARTBEAT_IVL = 31
+HEARTBEAT_LIVENESS = 32
+
+# Overflow policies
+# Block the sender until the pipe drains, or raise Again if NONBLOCK is given
+OVERFLOW_BLOCK = 0
+# Always raise Again, even without NONBLOCK
+OVERFLOW_AGAIN = 1
+# Discard the message being written
+OVERFLOW_DROP_NEWEST = 2
+# Discard the oldest queued messages to make room
+OVERFLOW_DROP_OLDEST = 3
+
+# Balancing policies. BALANCE also takes a callable returning a ring.balancer.Balancer.
+# Take turns
+BALANCE_ROUND_ROBIN = 0
+# Pick the peer with the fewest requests awaiting replies
+BALANCE_LEAST_OUTSTANDING = 1
+# Pick the faster of two random peers, by moving average of their latency
+BALANCE_P2C_EWMA = 2
+
+_DEFAULTS = {
+    SNDHWM_BYTES: None,
+    RCVHWM_BYTES: None,
+    MAXMEMORY: None,
+    SNDHWM: None,
+    RCVHWM: None,
+    OVERFLOW: OVERFLOW_BLOCK,
+    SPILL_THRESHOLD: None,
+    SPILL_DIR: None,
+    BALANCE: BALANCE_ROUND_ROBIN,
+    PIPELINE: False,
+    FAIR_QUANTUM: 64 * 1024,
+    PEER_WEIGHT: None,
+    PEER_QUOTA: None,
+    CREDIT: None,
+    CREDIT_BYTES: None,
+    BACKLOG: DEFAULT_BACKLOG,
+    MAX_CONNECTIONS: None,
+    REUSEPORT: False,
+    NODELAY: True,
+    SNDBUF: None,
+    RCVBUF: None,
+    KEEPALIVE: False,
+    KEEPALIVE_IDLE: None,
+    KEEPALIVE_INTVL: None,
+    KEEPALIVE_CNT: None,
+    QUICKACK: False,
+    FASTOPEN: None,
+    MMAP_THRESHOLD: None,
+    RECONNECT_IVL: None,
+    RECONNECT_IVL_MAX: 30,
+    HEARTBEAT_IVL: None,
+    HEARTBEAT_LIVENESS: 3,
+}
+
+
+def _non_negative_or_none(value):
+    return value is None or (isinstance(value, (int, long)) and value >= 0)
+
+
+def _positive_or_none(value):
+    return value is None or (isinstance(value, (int, long)) and value > 0)
+
+
+def _seconds_or_none(value):
+    return value is None or (isinstance(value, (int, long, float)) and value > 0)
+
+
+def _one_of(*values):
+    return lambda value: value in values
+
+
+_VALIDATORS = {
+    SNDHWM_BYTES: _non_negative_or_none,
+    RCVHWM_BYTES: _non_negative_or_none,
+    MAXMEMORY: _non_negative_or_none,
+    SNDHWM: _non_negative_or_none,
+    RCVHWM: _non_negative_or_none,
+    OVERFLOW: _one_of(
+        OVERFLOW_BLOCK, OVERFLOW_AGAIN, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST),
+    SPILL_THRESHOLD: _non_negative_or_none,
+    SPILL_DIR: lambda value: value is None or isinstance(value, basestring),
+    BALANCE: lambda value: value in (
+        BALANCE_ROUND_ROBIN, BALANCE_LEAST_OUTSTANDING, BALANCE_P2C_EWMA) or callable(value),
+    PIPELINE: lambda value: isinstance(value, bool),
+    FAIR_QUANTUM: lambda value: isinstance(value, (int, long)) and value > 0,
+    PEER_WEIGHT: lambda value: value is None or callable(value),
+    PEER_QUOTA: lambda value: value is None or callable(value),
+    CREDIT: _positive_or_none,
+    CREDIT_BYTES: _positive_or_none,
+    BACKLOG: lambda value: isinstance(value, (int, long)) and value > 0,
+    MAX_CONNECTIONS: _positive_or_none,
+    REUSEPORT: lambda value: isinstance(value, bool),
+    NODELAY: lambda value: isinstance(value, bool),
+    SNDBUF: _positive_or_none,
+    RCVBUF: _positive_or_none,
+    KEEPALIVE: lambda value: isinstance(value, bool),
+    KEEPALIVE_IDLE: _positive_or_none,
+    KEEPALIVE_INTVL: _positive_or_none,
+    KEEPALIVE_CNT: _positive_or_none,
+    QUICKACK: lambda value: isinstance(value, bool),
+    FASTOPEN: _positive_or_none,
+    MMAP_THRESHOLD: _positive_or_none,
+    RECONNECT_IVL: _seconds_or_none,
+    RECONNECT_IVL_MAX: lambda value: isinstance(value, (int, long, float)) and value > 0,
+    HEARTBEAT_IVL: _seconds_or_none,
+    HEARTBEAT_LIVENESS: lambda value: isinstance(value, (int, long)) and value > 0,
+}
+
+
+class InvalidOptionError(RingError):
+
+    def __init__(self, option, value=None):
+        super(InvalidOptionError, self).__init__(
+            'Invalid value %r for option %r' % (value, option) if option in _DEFAULTS
+            else 'Unknown option %r' % (option,))
+
+
+class Options(object):
+
+    def __init__(self, values=None):
+        self._values = dict(_DEFAULTS)
+        if values:
+            for option, value in values.iteritems():
+                self.set(option, value)
+
+    def get(self, option):
+        try:
+            return self._values[option]
+        except KeyError:
+            raise InvalidOptionError(option)
+
+    def set(self, option, value):
+        if option not in _DEFAULTS:
+            raise InvalidOptionError(option)
+        if not _VALIDATORS[option](value):
+            raise InvalidOptionError(option, value)
+        self._values[option] = value
+
+    def copy(self):
+        return Options(self._values)
@@ -14,41 +14,236 @@
 
 
 import collections
+import mmap
+import os
+import tempfile
 import threading
+from struct import calcsize, pack, unpack_from
 
 from ring.connection_impl import Again, Done
+from ring.options import (
+    RCVHWM_BYTES, SNDHWM_BYTES, RCVHWM, SNDHWM, OVERFLOW, OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST,
+    OVERFLOW_DROP_OLDEST, SPILL_THRESHOLD, SPILL_DIR, PEER_QUOTA
+)
+from ring.protocol import LEN_FRAME_HEADER, Chunk, Control
+from ring.sendfile import FileRegion
+
+_FMT_RECORD_HEADER = '>I'
+_LEN_RECORD_HEADER = calcsize(_FMT_RECORD_HEADER)
+
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+
+def _essential(data):
+    # Done, control messages and the end of an aborted stream carry state the other side can
+    # not do without, e.g. credit grants. They are always queued.
+    if isinstance(data, (Done, Control)):
+        return True
+    return isinstance(data, Chunk) and data.aborted
+
+
+def _droppable(data):
+    # Dropping a chunk would corrupt its streamed message, so chunks wait for room instead
+    return not (_essential(data) or isinstance(data, Chunk))
+
+
+def sizeof(data):
+    try:
+        return len(data)
+    except TypeError:
+        # Done and the like
+        return 0
+
+
+def _footprint(data):
+    # Bytes a queued message holds in memory. A file region is sent straight from its file,
+    # so only its frame header counts.
+    if isinstance(data, FileRegion) or isinstance(getattr(data, 'data', None), FileRegion):
+        return LEN_FRAME_HEADER
+    return sizeof(data)
 
 
 class Pipe(object):
 
     # TODO: Change implementation to ring buffer
 
-    def __init__(self, hwm=None):
+    __slots__ = (
+        '_queue', '_lock', '_high_watermark', '_low_watermark', '_watermark', '_messages_read',
+        '_readable', '_high_watermark_bytes', '_low_watermark_bytes', '_bytes', '_budget',
+        '_writable_callback', '_resume_callback', '_empty_callback', '_track_bytes', '_overflow',
+        '_stats')
+
+    def __init__(self, hwm=None, hwm_bytes=None, budget=None, overflow=OVERFLOW_BLOCK,
+                 stats=None):
         self._queue = collections.deque()
         self._lock = threading.RLock()
         self._high_watermark = hwm
         if self._high_watermark is not None:
-            self._low_watermark = (self._high_watermark + 1) / 2
+            self._low_watermark = max(1, (self._high_watermark + 1) / 2)
         else:
             self._low_watermark = None
         self._watermark = 0
         self._messages_read = 0
         self._readable = False
 
+        self._high_watermark_bytes = hwm_bytes
+        if self._high_watermark_bytes is not None:
+            self._low_watermark_bytes = (self._high_watermark_bytes + 1) / 2
+        else:
+            self._low_watermark_bytes = None
+        self._bytes = 0
+        self._budget = budget
+        self._writable_callback = None
+        # Called once a writer that paused, see wait_writable(), may go on
+        self._resume_callback = None
+        # Called once the reader has read everything, see when_empty()
+        self._empty_callback = None
+        # Sizes are only needed for byte watermarks and budgets, e.g. not for mailboxes
+        self._track_bytes = hwm_bytes is not None or budget is not None
+
+        self._overflow = overflow
+        # Counters shared with the owning connection
+        self._stats = stats if stats is not None else collections.Counter()
+
+    def set_writable_callback(self, cb):
+        """Sets the callback fired when a budget that refused a write has room again."""
+        self._writable_callback = cb
+
     def write_available(self):
         with self._lock:
-            return not (self._high_watermark is not None and self._watermark > self._high_watermark)
+            return self._write_available() and (self._budget is None or self._budget.available())
+
+    def _write_available(self):
+        if self._high_watermark is not None and self._watermark > self._high_watermark:
+            return False
+        if self._high_watermark_bytes is not None and \
+                self._bytes > self._high_watermark_bytes:
+            return False
+        return True
+
+    def _bounded(self):
+        return self._high_watermark is not None or self._high_watermark_bytes is not None or \
+            (self._budget is not None and self._budget.limited())
+
+    def wait_writable(self, callback):
+        """Returns whether writes are welcome, i.e. the pipe is below its watermarks and the
+        budget has room. Without either, only an empty pipe welcomes writes, so a writer keeps
+        at most one message ahead of the reader.
+
+        If not, the writer is expected to pause, e.g. an engine to stop reading its socket.
+        ``callback`` is then called once the reader has drained the pipe to its low watermarks,
+        or the budget has room again.
+        """
+        with self._lock:
+            if not self._bounded():
+                if not self._queue:
+                    return True
+            elif self._write_available() and \
+                    (self._budget is None or self._budget.acquire(0, callback)):
+                return True
+            self._resume_callback = callback
+            return False
+
+    def when_empty(self, callback):
+        """Calls callback once the reader has read everything queued, right away if nothing
+        is.
+        """
+        with self._lock:
+            if self._queue:
+                self._empty_callback = callback
+                return
+        callback()
+
+    def write(self, data, force=False):
+        """Appends data to the pipe.
+
+        When a watermark or the memory budget is exceeded, the overflow policy decides: drop
+        policies discard a message, the others raise Again. With ``force`` set, the data is
+        appended anyway, but still counts against the budget. Control messages are never
+        dropped either.
 
-    def write(self, data):
+        Returns whether the pipe was readable before, i.e. whether the reader is already awake.
+        """
+        return self._write(data, force, force)
+
+    def deliver(self, data):
+        """Appends data read off a socket. It has nowhere else to go, so it is never refused,
+        but drop policies still apply. Returns like write().
+        """
+        return self._write(data, True, False)
+
+    def _write(self, data, force, keep):
         with self._lock:
-            if not isinstance(data, Done) and not self.write_available():
+            size = _footprint(data) if self._track_bytes else 0
+            if keep or _essential(data):
+                self._charge(size)
+            elif self._overflow == OVERFLOW_DROP_OLDEST and _droppable(data):
+                while not self._admit(size, None):
+                    if not self._evict():
+                        # The budget is held by others. Nothing we can drop would help.
+                        self._stats['dropped_newest'] += 1
+                        return True
+            elif self._overflow == OVERFLOW_DROP_NEWEST and _droppable(data):
+                if not self._admit(size, None):
+                    self._stats['dropped_newest'] += 1
+                    return True
+            elif force:
+                self._charge(size)
+            elif not self._admit(size, self._writable_callback):
+                self._stats['refused'] += 1
                 raise Again
 
+            return self._append(data, size)
+
+    def _append(self, data, size):
+        was_readable = self._readable
+        self._queue.append(data)
+        self._watermark += 1
+        self._bytes += size
+        self._readable = True
+        return was_readable
+
+    def write_many(self, items):
+        """Writes items until one is refused.
+
+        Returns the number written and whether the pipe was readable before. Raises Again if
+        the first one is refused already.
+        """
+        with self._lock:
             was_readable = self._readable
-            self._queue.append(data)
-            self._watermark += 1
-            self._readable = True
-            return was_readable
+            written = 0
+            for data in items:
+                try:
+                    self.write(data)
+                except Again:
+                    if written == 0:
+                        raise
+                    break
+                written += 1
+            return written, was_readable
+
+    def _charge(self, size):
+        if self._budget is not None:
+            self._budget.charge(size)
+
+    def _admit(self, size, waiter):
+        # Checks the watermarks, then charges the budget if it has room
+        if not self._write_available():
+            return False
+        return self._budget is None or self._budget.acquire(size, waiter)
+
+    def _evict(self):
+        if not self._queue or not _droppable(self._queue[0]):
+            return False
+        evicted = self._queue.popleft()
+        self._watermark -= 1
+        if self._track_bytes:
+            size = _footprint(evicted)
+            self._bytes -= size
+            if self._budget is not None:
+                self._budget.release(size)
+        self._stats['dropped_oldest'] += 1
+        return True
 
     def front(self):
         with self._lock:
@@ -67,21 +262,230 @@ class Pipe(object):
 
     def read(self):
         with self._lock:
-            if not self.read_available():
+            popped, low_watermark_reached = self._read()
+            callbacks = []
+            if self._resume_callback is not None and self._drained():
+                callbacks.append(self._resume_callback)
+                self._resume_callback = None
+            if self._empty_callback is not None and not self._queue:
+                callbacks.append(self._empty_callback)
+                self._empty_callback = None
+        for callback in callbacks:
+            callback()
+        return popped, low_watermark_reached
+
+    def _drained(self):
+        # Whether a paused writer may go on
+        if not self._bounded():
+            return not self._queue
+        if self._high_watermark is not None and self._watermark > self._low_watermark:
+            return False
+        if self._high_watermark_bytes is not None and \
+                self._bytes > self._low_watermark_bytes:
+            return False
+        return self._budget is None or self._budget.available()
+
+    def _read(self):
+        if not self.read_available():
+            raise Again
+
+        popped, size = self._pop()
+        self._watermark -= 1
+        self._messages_read += 1
+        if self._low_watermark is not None:
+            # To prevent overflow
+            self._messages_read %= self._low_watermark
+            low_watermark_reached = self._messages_read % self._low_watermark == 0
+        else:
+            low_watermark_reached = False
+
+        if size:
+            previous = self._bytes
+            self._bytes -= size
+            if self._budget is not None:
+                self._budget.release(size)
+            if self._low_watermark_bytes is not None and \
+                    previous > self._low_watermark_bytes >= self._bytes:
+                low_watermark_reached = True
+
+        return popped, low_watermark_reached
+
+    def read_many(self, max_count):
+        """Reads up to max_count messages. Returns them, and whether the low watermark was
+        reached on the way.
+        """
+        with self._lock:
+            items = []
+            low_watermark_reached = False
+            while len(items) < max_count and self.read_available():
+                item, reached = self.read()
+                items.append(item)
+                low_watermark_reached |= reached
+            if not items:
                 raise Again
+            return items, low_watermark_reached
 
-            popped = self._queue.popleft()
-            self._watermark -= 1
-            self._messages_read += 1
-            if self._low_watermark is not None:
-                # To prevent overflow
-                self._messages_read %= self._low_watermark
-                low_watermark_reached = self._messages_read % self._low_watermark == 0
-            else:
-                low_watermark_reached = False
-            return popped, low_watermark_reached
+    def _pop(self):
+        # Returns the front message and the bytes it was accounted for
+        popped = self._queue.popleft()
+        return popped, _footprint(popped) if self._track_bytes else 0
 
     def clear(self):
         with self._lock:
             self._queue.clear()
             self._watermark = 0
+            if self._budget is not None:
+                self._budget.release(self._bytes)
+            self._bytes = 0
+            self._resume_callback = self._empty_callback = None
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    @property
+    def depth(self):
+        """Number of messages queued."""
+        return self._watermark
+
+
+class _Segment(object):
+    """Append-only file of length prefixed messages.
+
+    Written sequentially until the reader reaches it, then sealed and read back through a
+    read-only memory map. The file is unlinked right away, so the disk space is reclaimed on
+    close, or when the process dies.
+    """
+
+    def __init__(self, directory):
+        fd, path = tempfile.mkstemp(prefix='ring-spill-', suffix='.seg', dir=directory)
+        os.unlink(path)
+        self._file = os.fdopen(fd, 'w+b')
+        self._map = None
+        self._offset = 0
+        self.size = 0
+        self.count = 0
+
+    @property
+    def sealed(self):
+        return self._map is not None
+
+    def append(self, data):
+        self._file.write(pack(_FMT_RECORD_HEADER, len(data)))
+        self._file.write(data)
+        self.size += _LEN_RECORD_HEADER + len(data)
+        self.count += 1
+
+    def read(self):
+        if self._map is None:
+            self._file.flush()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        length, = unpack_from(_FMT_RECORD_HEADER, self._map, self._offset)
+        start = self._offset + _LEN_RECORD_HEADER
+        self._offset = start + length
+        self.count -= 1
+        return self._map[start:self._offset]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+class SpillPipe(Pipe):
+    """Pipe that moves messages to disk instead of refusing them.
+
+    Once the queued bytes exceed ``threshold``, or a watermark or the budget would refuse a
+    message, the message is appended to a segment file instead. Segments take a single slot in
+    the queue, so order is kept however writes alternate between memory and disk.
+
+    Only plain strings spill. Spilling replaces the overflow policy, so there is none.
+    """
+
+    __slots__ = ('_threshold', '_directory')
+
+    def __init__(self, threshold, directory=None, hwm=None, hwm_bytes=None, budget=None,
+                 stats=None):
+        super(SpillPipe, self).__init__(hwm, hwm_bytes, budget, OVERFLOW_BLOCK, stats)
+        self._threshold = threshold
+        self._directory = directory
+        self._track_bytes = True
+
+    def write_available(self):
+        return True
+
+    def write(self, data, force=False):
+        with self._lock:
+            if not isinstance(data, str):
+                return super(SpillPipe, self).write(data, force)
+
+            size = len(data)
+            if self._bytes + size > self._threshold or not self._admit(size, None):
+                return self._spill(data)
+            return self._append(data, size)
+
+    def _spill(self, data):
+        tail = self._queue[-1] if self._queue else None
+        if not isinstance(tail, _Segment) or tail.sealed or tail.size >= SEGMENT_SIZE:
+            tail = _Segment(self._directory)
+            self._queue.append(tail)
+        tail.append(data)
+        self._stats['spilled'] += 1
+
+        was_readable = self._readable
+        self._watermark += 1
+        self._readable = True
+        return was_readable
+
+    def _pop(self):
+        front = self._queue[0]
+        if not isinstance(front, _Segment):
+            return super(SpillPipe, self)._pop()
+
+        popped = front.read()
+        if front.count == 0:
+            self._queue.popleft()
+            front.close()
+        # Spilled messages were never accounted in memory
+        return popped, 0
+
+    def clear(self):
+        with self._lock:
+            for item in self._queue:
+                if isinstance(item, _Segment):
+                    item.close()
+            super(SpillPipe, self).clear()
+
+
+def create_recv_pipe(options, budget, stats=None, address=None):
+    """Creates the recv pipe of a peer according to connection options. The address of the peer
+    is passed to PEER_QUOTA, if set.
+    """
+    if options.get(PEER_QUOTA) is not None and address is not None:
+        rcvhwm_bytes = options.get(PEER_QUOTA)(address)
+    else:
+        rcvhwm_bytes = options.get(RCVHWM_BYTES)
+    return Pipe(
+        hwm=options.get(RCVHWM), hwm_bytes=rcvhwm_bytes, budget=budget,
+        overflow=options.get(OVERFLOW), stats=stats)
+
+
+def create_send_pipe(options, budget, stats=None, spill=False):
+    """Creates the send pipe of a peer according to connection options. With ``spill``, it
+    spills to disk if SPILL_THRESHOLD is set.
+    """
+    if spill and options.get(SPILL_THRESHOLD) is not None:
+        return SpillPipe(
+            options.get(SPILL_THRESHOLD), options.get(SPILL_DIR), hwm=options.get(SNDHWM),
+            hwm_bytes=options.get(SNDHWM_BYTES), budget=budget, stats=stats)
+    return Pipe(
+        hwm=options.get(SNDHWM), hwm_bytes=options.get(SNDHWM_BYTES), budget=budget,
+        overflow=options.get(OVERFLOW), stats=stats)
+
+
+def create_pipes(options, budget, stats=None, spill=False, address=None):
+    """Creates the (recv_pipe, send_pipe) pair of a peer according to connection options."""
+    return (create_recv_pipe(options, budget, stats, address),
+            create_send_pipe(options, budget, stats, spill))
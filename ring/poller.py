@@ -154,7 +154,8 @@ class PollImpl(PollerImpl):
         self._poll.unregister(fd)
 
     def poll(self, timeout):
-        return self._poll.poll(timeout)
+        # Like the other pollers, take seconds. poll() wants milliseconds.
+        return self._poll.poll(timeout * 1000 if timeout is not None else None)
 
     def modify(self, fd, eventmask):
         return self._poll.modify(fd, eventmask)
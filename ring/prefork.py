@@ -0,0 +1,155 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import Queue
+import multiprocessing
+import socket
+import traceback
+
+from ring.connection import REPLIER, REUSEPORT
+from ring.context import Context
+from ring.server import handle
+from ring.utils import RingError, get_logger
+
+_logger = get_logger(__name__)
+
+# Seconds to wait for the workers to bind, or to exit once terminated
+_START_TIMEOUT = 10
+_STOP_TIMEOUT = 5
+
+
+class WorkerFailedError(RingError):
+
+    def __init__(self, reason):
+        super(WorkerFailedError, self).__init__('Prefork worker failed to start:\n%s' % (reason,))
+
+
+def _serve(address, handler, pyobj, started):
+    # Worker process. Forked from a parent which may run contexts of its own, so it starts a
+    # fresh one.
+    try:
+        ctx = Context()
+        replier = ctx.connection(REPLIER)
+        replier.setsockopt(REUSEPORT, True)
+        replier.bind(address)
+    except Exception:
+        started.put(traceback.format_exc())
+        return
+    started.put(None)
+
+    try:
+        while 1:
+            replier.send(handle(handler, replier.recv(), pyobj))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        replier.close()
+        ctx.stop()
+
+
+class Prefork(object):
+    """Serves requests with ``processes`` worker processes, each running its own context and
+    REPLIER bound to the same port with SO_REUSEPORT. The kernel spreads incoming clients
+    among them, so the handler runs on as many cores as there are workers.
+
+    ``handler`` maps a request to its reply, as with ``ring.server.Server``. It reaches the
+    workers by fork. A request whose handler raises gets the reply of ``ring.server.handle``.
+    """
+
+    def __init__(self, endpoint, handler, processes=None, pyobj=False):
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise NotImplementedError('SO_REUSEPORT is not supported on this platform')
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if processes < 1:
+            raise ValueError('At least one process is needed')
+
+        self._endpoint = endpoint
+        self._handler = handler
+        self._num_processes = processes
+        self._pyobj = pyobj
+
+        self._reserved = None
+        self._workers = []
+
+    def _reserve(self):
+        # Holds the port while workers come and go, and resolves port 0 so they all bind the
+        # same one. It never listens, so it gets no clients.
+        self._reserved = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._reserved.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self._reserved.bind(self._endpoint)
+
+    def start(self):
+        """Binds the endpoint and forks the workers. Returns once all of them are serving."""
+        self._reserve()
+        started = multiprocessing.Queue()
+        for _ in xrange(self._num_processes):
+            worker = multiprocessing.Process(
+                target=_serve, args=(self.address, self._handler, self._pyobj, started))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+        for _ in xrange(self._num_processes):
+            try:
+                reason = started.get(timeout=_START_TIMEOUT)
+            except Queue.Empty:
+                reason = 'Timed out binding %r' % (self.address,)
+            if reason is not None:
+                self.stop()
+                raise WorkerFailedError(reason)
+
+    def join(self):
+        """Waits for the workers to exit."""
+        for worker in self._workers:
+            worker.join()
+
+    def stop(self):
+        """Terminates the workers. Requests they were serving are lost."""
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in self._workers:
+            worker.join(_STOP_TIMEOUT)
+            if worker.is_alive():
+                _logger.warning('Prefork worker %d failed to stop within %d secs',
+                                worker.pid, _STOP_TIMEOUT)
+        self._workers = []
+
+        if self._reserved is not None:
+            self._reserved.close()
+            self._reserved = None
+
+    @property
+    def address(self):
+        return self._reserved.getsockname()
+
+    @property
+    def pids(self):
+        return [worker.pid for worker in self._workers]
+
+
+def prefork(endpoint, handler, processes=None, pyobj=False):
+    """Serves requests on endpoint with handler in worker processes until interrupted.
+    See Prefork.
+    """
+    server = Prefork(endpoint, handler, processes, pyobj)
+    server.start()
+    try:
+        server.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
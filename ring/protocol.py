@@ -15,9 +15,16 @@
 
 from struct import calcsize, pack
 
+from ring.sendfile import FileRegion
+
 LEN_MAX_PACKET = 128 * 1024  # KB
 
+# Each frame of a streamed message is delivered on its own, as a Chunk. With FLAG_CONTROL too,
+# the frame aborts the message.
+FLAG_STREAM = 1 << 3
 FLAG_CONTROL = 1 << 2
+# The frame header is followed by the correlation id of a pipelined request
+FLAG_ID = 1 << 1
 FLAG_MORE = 1
 
 MAJOR_VERSION = b'\x11'
@@ -33,18 +40,152 @@ LEN_REPLIER_GREETING = len(REPLIER_GREETING)
 FMT_FRAME_HEADER = '>BI'
 LEN_FRAME_HEADER = calcsize(FMT_FRAME_HEADER)
 
+FMT_ID = '>I'
+LEN_ID = calcsize(FMT_ID)
+ID_MAX = 1 << 32
+
+
+class Envelope(object):
+    """A message tagged with the correlation id of a pipelined request."""
+
+    __slots__ = ('id', 'data')
+
+    def __init__(self, id, data):
+        self.id = id
+        self.data = data
 
-def generate_payload_frame(data):
+    def __len__(self):
+        return len(self.data)
+
+
+def generate_payload_frame(data, id=None):
+    """Splits data into frames. With an id, the first frame carries it after its header."""
     data = memoryview(data)
     ptr = 0
+    # An empty message still takes a frame
+    first = True
+
+    while first or ptr < len(data):
+        first = False
+        extension = pack(FMT_ID, id) if id is not None else b''
+        id = None
 
-    while ptr < len(data):
-        max_allowable = LEN_MAX_PACKET - LEN_FRAME_HEADER
+        max_allowable = LEN_MAX_PACKET - LEN_FRAME_HEADER - len(extension)
         body = data[ptr:ptr+max_allowable].tobytes()
         ptr += len(body)
 
-        packet_length = LEN_FRAME_HEADER + len(body)
+        packet_length = LEN_FRAME_HEADER + len(extension) + len(body)
         flags = FLAG_MORE if ptr < len(data) else 0
-        header = pack(FMT_FRAME_HEADER, flags, packet_length)
+        if extension:
+            flags |= FLAG_ID
+        header = pack(FMT_FRAME_HEADER, flags, packet_length) + extension
 
         yield header + body
+
+
+def generate_file_frames(region, id=None):
+    """Like generate_payload_frame, but yields each frame's header followed by the FileRegion
+    of its body, which the stream sends from the file.
+    """
+    ptr = 0
+    first = True
+
+    while first or ptr < len(region):
+        first = False
+        extension = pack(FMT_ID, id) if id is not None else b''
+        id = None
+
+        max_allowable = LEN_MAX_PACKET - LEN_FRAME_HEADER - len(extension)
+        length = min(len(region) - ptr, max_allowable)
+        body = region.slice(ptr, length)
+        ptr += length
+
+        flags = FLAG_MORE if ptr < len(region) else 0
+        if extension:
+            flags |= FLAG_ID
+        yield pack(FMT_FRAME_HEADER, flags, LEN_FRAME_HEADER + len(extension) + length) + extension
+        if length:
+            yield body
+
+
+class Chunk(object):
+    """Part of a streamed message. ``more`` tells whether others follow. An ``aborted`` chunk
+    ends the message unfinished.
+    """
+
+    __slots__ = ('data', 'more', 'aborted')
+
+    def __init__(self, data, more, aborted=False):
+        self.data = data
+        self.more = more
+        self.aborted = aborted
+
+    def __len__(self):
+        return len(self.data)
+
+
+def generate_chunk_frames(chunk):
+    if chunk.aborted:
+        yield pack(FMT_FRAME_HEADER, FLAG_STREAM | FLAG_CONTROL, LEN_FRAME_HEADER)
+        return
+
+    data = memoryview(chunk.data)
+    ptr = 0
+    first = True
+
+    while first or ptr < len(data):
+        first = False
+        body = data[ptr:ptr + LEN_MAX_PACKET - LEN_FRAME_HEADER].tobytes()
+        ptr += len(body)
+
+        flags = FLAG_STREAM
+        if ptr < len(data) or chunk.more:
+            flags |= FLAG_MORE
+        yield pack(FMT_FRAME_HEADER, flags, LEN_FRAME_HEADER + len(body)) + body
+
+
+class Control(object):
+    """A control message, exchanged between connections rather than shown to the user."""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class Framed(object):
+    """A message framed once, whose frames are shared by the send pipes of several peers."""
+
+    __slots__ = ('frames',)
+
+    def __init__(self, data):
+        self.frames = b''.join(generate_payload_frame(data))
+
+    def __len__(self):
+        return len(self.frames)
+
+
+def generate_control_frame(data):
+    if len(data) > LEN_MAX_PACKET - LEN_FRAME_HEADER:
+        raise ValueError('Control message too long')
+    yield pack(FMT_FRAME_HEADER, FLAG_CONTROL, LEN_FRAME_HEADER + len(data)) + data
+
+
+def generate_frames(message):
+    """Frames a message as queued in a send pipe."""
+    if isinstance(message, Envelope):
+        if isinstance(message.data, FileRegion):
+            return generate_file_frames(message.data, message.id)
+        return generate_payload_frame(message.data, message.id)
+    if isinstance(message, FileRegion):
+        return generate_file_frames(message)
+    if isinstance(message, Chunk):
+        return generate_chunk_frames(message)
+    if isinstance(message, Framed):
+        return (message.frames,)
+    if isinstance(message, Control):
+        return generate_control_frame(message.data)
+    return generate_payload_frame(message)
@@ -0,0 +1,145 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+
+from ring.acceptor import AcceptMixin
+from ring.connection_impl import ConnectionImpl, Again, Done
+from ring.constants import TYPE_FINALIZE
+from ring.events import Mail
+from ring.pipes import create_pipes
+from ring.protocol import Control, Framed
+from ring.stream import SocketStream
+from ring.stream_engine import StreamEngine
+from ring.trie import PrefixTrie
+
+# Control messages of subscribers, followed by the topic prefix
+SUBSCRIBE = b'\x01'
+UNSUBSCRIBE = b'\x00'
+
+
+class PublisherConnectionImpl(AcceptMixin, ConnectionImpl):
+    """Sends every message to the subscribers of a prefix of it.
+
+    Subscriptions arrive as control messages through each peer's recv pipe, and are applied
+    before each send. A message is framed once, and the same buffer is queued to every
+    matching peer. Peers above their watermarks miss the message, the publisher never
+    blocks.
+    """
+
+    def __init__(self, socket, ctx, mailbox, options=None):
+        super(PublisherConnectionImpl, self).__init__(socket, ctx, mailbox, options)
+        self._connections = {}
+        # Engine id -> prefixes it subscribed to, with counts
+        self._subscriptions = {}
+        self._trie = PrefixTrie()
+        self._closing = False
+        self._start_accepting()
+
+    def close(self):
+        super(PublisherConnectionImpl, self).close()
+        self._closing = True
+        self._stop_accepting()
+
+        if not self._connections:
+            # If there's no connection at all, trigger finalize immediately
+            self._mailbox.send(Mail(TYPE_FINALIZE))
+            return
+
+        for engine, stream, recv_pipe, send_pipe in self._connections.itervalues():
+            if not send_pipe.write(Done()):
+                engine.activate_send()
+
+    def _add_connection(self, conn, addr):
+        stream = SocketStream(conn, io_loop=self._context.io_loop)
+        recv_pipe, send_pipe = create_pipes(self._options, self._budget, self._stats)
+        engine = StreamEngine(
+            self._context, stream, recv_pipe, send_pipe, self._mailbox, **self._engine_options())
+        self._connections[engine.id] = (engine, stream, recv_pipe, send_pipe)
+        self._subscriptions[engine.id] = collections.Counter()
+        engine.activate_recv()
+
+    def connect(self, addr):
+        raise NotImplementedError('Publisher does not have connection method')
+
+    def recv(self):
+        raise NotImplementedError('Publisher does not receive')
+
+    def send(self, data):
+        peers = self._trie.match(data)
+        if not peers:
+            return
+
+        framed = Framed(data)
+        for engine_id in peers:
+            engine, x, y, send_pipe = self._connections[engine_id]
+            try:
+                if not send_pipe.write(framed):
+                    engine.activate_send()
+            except Again:
+                # The subscriber is too slow. It misses this message.
+                self._stats['dropped_newest'] += 1
+
+    def send_many(self, items):
+        for data in items:
+            self.send(data)
+        return len(items)
+
+    def recv_available(self):
+        return False
+
+    def send_available(self):
+        return True
+
+    def activate_send(self, engine_id):
+        pass
+
+    def activate_recv(self, engine_id):
+        if engine_id not in self._connections:
+            return
+
+        engine, x, recv_pipe, y = self._connections[engine_id]
+        subscriptions = self._subscriptions[engine_id]
+        while recv_pipe.read_available():
+            message = recv_pipe.read()[0]
+            if not isinstance(message, Control) or not message.data:
+                # Subscribers only send subscriptions
+                continue
+            command, prefix = message.data[0], message.data[1:]
+            if command == SUBSCRIBE:
+                self._trie.add(prefix, engine_id)
+                subscriptions[prefix] += 1
+            elif command == UNSUBSCRIBE and subscriptions[prefix] > 0:
+                self._trie.remove(prefix, engine_id)
+                subscriptions[prefix] -= 1
+        engine.activate_recv()
+
+    def connection_close(self, engine_id, err):
+        if engine_id == -1:
+            # -1 means the master socket. See ReplierConnectionImpl.
+            self._stop_accepting()
+        else:
+            for prefix, count in self._subscriptions.pop(engine_id).iteritems():
+                for _ in xrange(count):
+                    self._trie.remove(prefix, engine_id)
+            x, y, recv_pipe, send_pipe = self._connections.pop(engine_id)
+            recv_pipe.clear()
+            send_pipe.clear()
+            self._update_accepting()
+
+        if self._closing and not self._connections:
+            self._mailbox.send(Mail(TYPE_FINALIZE))
+
+    def connection_finalize(self):
+        self._connections = self._subscriptions = self._trie = None
@@ -13,25 +13,37 @@
 # limitations under the License.
 
 
-import collections
-
-from ring.connection_impl import ConnectionImpl, Again, Done
+from ring.acceptor import AcceptMixin
+from ring.connection_impl import ConnectionImpl, Again, Done, JoinChunksMixin, StreamInterrupted
 from ring.constants import TYPE_FINALIZE
+from ring.credit import Window
 from ring.events import Mail
-from ring.pipes import Pipe
-from ring.poller import READ
+from ring.options import CREDIT, CREDIT_BYTES
+from ring.pipes import create_recv_pipe, sizeof
+from ring.protocol import Chunk
+from ring.scheduler import FairRecvMixin
 from ring.stream import SocketStream
 from ring.stream_engine import StreamEngine
 
 
-class PullerConnectionImpl(ConnectionImpl):
+class PullerConnectionImpl(AcceptMixin, FairRecvMixin, JoinChunksMixin, ConnectionImpl):
+    """Receives the messages of every connected pusher, fair queued.
+
+    With CREDIT or CREDIT_BYTES set, each pusher is granted that much on connect, and granted
+    again what the user receives, so no pusher gets further ahead of the user than that.
+    """
 
-    def __init__(self, socket, ctx, mailbox):
-        super(PullerConnectionImpl, self).__init__(socket, ctx, mailbox)
+    def __init__(self, socket, ctx, mailbox, options=None):
+        super(PullerConnectionImpl, self).__init__(socket, ctx, mailbox, options)
         self._connections = {}
-        self._recv_queue = collections.deque()
-        self._context.io_loop.register(self._socket.fileno(), READ, self._on_accept)
+        # Engine id -> Window, if flow controlled
+        self._windows = {}
+        self._initialize_fair_queue()
+        # Engine id of the peer in the middle of a streamed message, which is read to its end
+        # before any other
+        self._streaming = None
         self._closing = False
+        self._start_accepting()
 
     def close(self):
         if self._closing:
@@ -39,24 +51,30 @@ class PullerConnectionImpl(ConnectionImpl):
 
         super(PullerConnectionImpl, self).close()
         self._closing = True
-        self._context.io_loop.unregister(self._socket.fileno())
+        self._stop_accepting()
 
         if not self._connections:
             # If there's no connection at all, trigger finalize immediately
             self._mailbox.send(Mail(TYPE_FINALIZE))
             return
 
-        for engine, stream, recv_pipe, send_pipe in self._connections.itervalues():
-            if not send_pipe.write(Done()):
-                engine.activate_send()
+        for engine_id in self._connections.keys():
+            if not self._send_pipe(engine_id).write(Done()):
+                self._connections[engine_id][0].activate_send()
 
-    def _on_accept(self, fd, events):
-        conn, addr = self._socket.accept()
+    def _add_connection(self, conn, addr):
         stream = SocketStream(conn, io_loop=self._context.io_loop)
-        recv_pipe = Pipe()
-        send_pipe = Pipe()
-        engine = StreamEngine(self._context, stream, recv_pipe, send_pipe, self._mailbox)
-        self._connections[engine.id] = (engine, stream, recv_pipe, send_pipe)
+        recv_pipe = create_recv_pipe(self._options, self._budget, self._stats, address=addr)
+        engine = StreamEngine(
+            self._context, stream, recv_pipe, None, self._mailbox, **self._recv_options())
+        self._add_peer(engine.id, addr)
+        self._connections[engine.id] = (engine, stream, recv_pipe, None)
+
+        if self._options.get(CREDIT) is not None or self._options.get(CREDIT_BYTES) is not None:
+            window = Window(self._options.get(CREDIT), self._options.get(CREDIT_BYTES))
+            self._windows[engine.id] = window
+            self._send_pipe(engine.id).write(window.initial_grant(), force=True)
+            engine.activate_send()
         engine.activate_recv()
 
     def connect(self, addr):
@@ -65,22 +83,53 @@ class PullerConnectionImpl(ConnectionImpl):
     def send(self, data):
         raise NotImplementedError('Puller does not send')
 
-    def recv(self):
-        if len(self._recv_queue) == 0:
-            raise Again
-
-        engine_id = self._recv_queue[0]
-        engine, x, recv_pipe, y = self._connections[engine_id]
-        assert recv_pipe.read_available()
-        read = recv_pipe.read()[0]
-
-        if not recv_pipe.read_available():
-            self._recv_queue.popleft()
-            engine.activate_recv()
-
-        return read
+    def recv_chunk(self):
+        engine_id = self._streaming
+        if engine_id is None:
+            engine_id, read = self._read_fair()
+        elif engine_id in self._connections:
+            read = self._read_from(engine_id)
+        else:
+            self._streaming = None
+            raise StreamInterrupted
+
+        more = False
+        if isinstance(read, Chunk):
+            if read.aborted:
+                self._streaming = None
+                self._consume(engine_id, 0, True)
+                raise StreamInterrupted
+            more = read.more
+            self._streaming = engine_id if more else None
+            read = read.data
+
+        self._consume(engine_id, sizeof(read), not more)
+        return read, more
+
+    def _consume(self, engine_id, size, message):
+        window = self._windows.get(engine_id)
+        if window is not None:
+            grant = window.consume(size, message)
+            if grant is not None:
+                if not self._send_pipe(engine_id).write(grant, force=True):
+                    self._connections[engine_id][0].activate_send()
+
+    def recv_many(self, max_count):
+        result = [self.recv()]
+        while len(result) < max_count and self._streaming is None and \
+                len(self._recv_queue) != 0:
+            try:
+                result.append(self.recv())
+            except Again:
+                # The rest of a streamed message is yet to come
+                break
+        return result
 
     def recv_available(self):
+        if self._streaming is not None:
+            # Ready to raise StreamInterrupted if the peer is gone
+            return self._streaming not in self._connections or \
+                self._connections[self._streaming][2].read_available()
         return len(self._recv_queue) != 0
 
     def send_available(self):
@@ -90,7 +139,8 @@ class PullerConnectionImpl(ConnectionImpl):
         raise RuntimeError('Puller does not receive send events')
 
     def activate_recv(self, engine_id):
-        self._recv_queue.append(engine_id)
+        if engine_id in self._connections:
+            self._recv_queue.push(engine_id)
 
     def connection_close(self, engine_id, err):
         if engine_id == -1:
@@ -98,16 +148,21 @@ class PullerConnectionImpl(ConnectionImpl):
             # wait for the user to terminate the connection.
             # Terminating connection autonomously brings many hard to find bugs and sometimes
             # subtle race conditions
-            self._context.io_loop.unregister(self._socket.fileno())
+            self._stop_accepting()
         else:
             # Erase the connection from cache
             x, y, recv_pipe, send_pipe = self._connections[engine_id]
             recv_pipe.clear()
-            send_pipe.clear()
+            if send_pipe is not None:
+                send_pipe.clear()
             del self._connections[engine_id]
+            self._windows.pop(engine_id, None)
+            self._remove_peer(engine_id)
+            self._update_accepting()
 
         if self._closing and not self._connections:
             self._mailbox.send(Mail(TYPE_FINALIZE))
 
     def connection_finalize(self):
-        self._recv_queue = self._connections = None
+        self._recv_queue = self._connections = self._addresses = self._served = None
+        self._windows = None
@@ -12,37 +12,87 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 
-from ring.connection_impl import ConnectionImpl, Again, Done
+from ring.connection_impl import ConnectionImpl, Again, Done, StreamInterrupted
 from ring.constants import TYPE_FINALIZE
+from ring.credit import Credit, parse_grant
 from ring.events import Mail
-from ring.pipes import Pipe
+from ring.pipes import create_pipes, sizeof
+from ring.protocol import Chunk
 from ring.stream import SocketStream
 from ring.stream_engine import StreamEngine
+from ring.utils import InconsistentStateError
+
+
+# In place of the engine id of a peer lost in the middle of a streamed message
+_INTERRUPTED = -1
 
 
 class PusherConnectionImpl(ConnectionImpl):
+    """Pushes messages to every connected puller in turn.
 
-    def __init__(self, socket, ctx, waker):
-        super(PusherConnectionImpl, self).__init__(socket, ctx, waker)
-        self._stream = SocketStream(self._socket, io_loop=self._context.io_loop)
+    Each connect adds a peer with its own engine and send pipe. Messages are distributed round
+    robin, skipping peers whose pipe is above its watermarks, or who are out of the credit they
+    granted, so a slow puller only slows down its own share.
 
-        self._recv_pipe = Pipe()
-        self._send_pipe = Pipe()
+    With RECONNECT_IVL set, lost peers are redialed and keep their unsent messages. They are
+    skipped until connected again, unless every peer is lost.
+    """
 
-        self._stream_engine = StreamEngine(
-            self._context, self._stream, self._recv_pipe, self._send_pipe, self._mailbox)
+    def __init__(self, socket, ctx, waker, options=None):
+        super(PusherConnectionImpl, self).__init__(socket, ctx, waker, options)
+        self._peers = {}
+        # Engine ids in the order they take turns
+        self._rotation = collections.deque()
+        # Engine id -> Credit
+        self._credit = {}
+        self._addresses = {}
+        # Engine id of the peer in the middle of a streamed message, which takes the rest of it
+        self._streaming = None
+        # Engine ids of the peers being redialed
+        self._lost = set()
 
         self._send_activated = True
+        self._closing = False
 
     def close(self):
         super(PusherConnectionImpl, self).close()
-        if not self._send_pipe.write(Done()):
-            self._stream_engine.activate_send()
+        self._closing = True
         self._send_activated = False
 
+        if not self._peers:
+            # If there's no peer at all, trigger finalize immediately
+            self._mailbox.send(Mail(TYPE_FINALIZE))
+            return
+
+        for engine, stream, recv_pipe, send_pipe in self._peers.itervalues():
+            if not send_pipe.write(Done()):
+                engine.activate_send()
+            engine.stop_redialing()
+
     def connect(self, addr):
-        self._stream_engine.activate_connect(addr)
+        if self._peers:
+            # The first peer takes the connection's socket, the others get their own
+            so = self._connecting_socket()
+        else:
+            so = self._socket
+
+        stream = SocketStream(so, io_loop=self._context.io_loop)
+        recv_pipe, send_pipe = create_pipes(self._options, self._budget, self._stats, spill=True)
+        engine = StreamEngine(
+            self._context, stream, recv_pipe, send_pipe, self._mailbox,
+            **self._reconnect_options())
+        send_pipe.set_writable_callback(engine.post_activate_send)
+        self._peers[engine.id] = (engine, stream, recv_pipe, send_pipe)
+        self._rotation.append(engine.id)
+        self._credit[engine.id] = Credit()
+        self._addresses[engine.id] = addr
+        self._send_activated = True
+
+        engine.activate_connect(addr)
+        # Pullers only ever send credit grants
+        engine.activate_recv()
 
     def recv(self):
         raise NotImplementedError('Pusher does not receive')
@@ -50,32 +100,214 @@ class PusherConnectionImpl(ConnectionImpl):
     def send(self, data):
         if not self._send_activated:
             raise Again
+        if self._streaming is not None:
+            return self._send_more(data)
 
+        skip_lost = self._skip_lost()
+        # Give every peer one chance, starting with the one whose turn it is
+        for _ in xrange(len(self._rotation)):
+            engine_id = self._rotation[0]
+            self._rotation.rotate(-1)
+            engine, x, y, send_pipe = self._peers[engine_id]
+            credit = self._credit[engine_id]
+            if not credit.available() or (skip_lost and engine_id in self._lost):
+                continue
+            try:
+                if not send_pipe.write(data):
+                    # If the pipe returns false, it was previously empty.
+                    # We would need to resubmit the task
+                    engine.activate_send()
+            except Again:
+                continue
+            credit.take(sizeof(data))
+            if isinstance(data, Chunk) and data.more:
+                self._streaming = engine_id
+            return
+
+        self._send_activated = False
+        raise Again
+
+    def _skip_lost(self):
+        # Lost peers only queue messages while no peer is connected
+        return len(self._lost) < len(self._peers)
+
+    def _send_more(self, chunk):
+        if not isinstance(chunk, Chunk):
+            raise InconsistentStateError('Should not send in the middle of a stream')
+        if self._streaming not in self._peers:
+            self._streaming = None
+            raise StreamInterrupted
+
+        engine, x, y, send_pipe = self._peers[self._streaming]
+        credit = self._credit[self._streaming]
+        if not credit.bytes_available():
+            self._send_activated = False
+            raise Again
         try:
-            if not self._send_pipe.write(data):
-                # If the pipe returns false, it was previously empty.
-                # We would need to resubmit the task
-                self._stream_engine.activate_send()
+            if not send_pipe.write(chunk):
+                engine.activate_send()
         except Again:
             self._send_activated = False
+            raise
+        credit.take(sizeof(chunk), message=False)
+        if not chunk.more:
+            self._streaming = None
+
+    def send_many(self, items):
+        if not self._send_activated:
+            raise Again
+        if self._streaming is not None or isinstance(items[0], Chunk):
+            # Streamed messages go chunk by chunk
+            self.send(items[0])
+            return 1
+
+        # Chunks are left to the next call
+        end = next((i for i, data in enumerate(items) if isinstance(data, Chunk)), len(items))
+        skip_lost = self._skip_lost()
+        turns = list(self._rotation)
+        sent = 0
+        refused = set()
+        last = None
+        while sent < end:
+            targets = [
+                engine_id for engine_id in turns
+                if engine_id not in refused and self._credit[engine_id].available() and
+                not (skip_lost and engine_id in self._lost)]
+            if not targets:
+                break
+            # Each peer takes its share of what is left with one write_many, i.e. one lock of
+            # its pipe and one activation of its engine. What one refuses goes to the next, so
+            # a prefix of items is sent.
+            for i, engine_id in enumerate(targets):
+                if sent == end:
+                    break
+                # Even shares, rounded up
+                peers_left = len(targets) - i
+                stop = sent + (end - sent + peers_left - 1) / peers_left
+                stop = self._share(engine_id, items, sent, stop)
+                engine, x, y, send_pipe = self._peers[engine_id]
+                try:
+                    written, was_readable = send_pipe.write_many(items[sent:stop])
+                except Again:
+                    refused.add(engine_id)
+                    continue
+                if not was_readable:
+                    engine.activate_send()
+                credit = self._credit[engine_id]
+                if credit.messages is not None or credit.bytes is not None:
+                    for data in items[sent:sent + written]:
+                        credit.take(sizeof(data))
+                if sent + written < stop:
+                    refused.add(engine_id)
+                sent += written
+                last = engine_id
+
+        if last is not None:
+            # The peer after the last one served takes the next turn
+            self._rotation.rotate(-turns.index(last) - 1)
+        if sent < end:
+            self._send_activated = False
+            if sent == 0:
+                raise Again
+        return sent
+
+    def _share(self, engine_id, items, start, end):
+        # Cuts items[start:end] short to what the credit of engine_id allows
+        credit = self._credit[engine_id]
+        if credit.messages is not None:
+            end = min(end, start + credit.messages)
+        if credit.bytes is not None:
+            left = credit.bytes
+            for i in xrange(start, end):
+                if left <= 0:
+                    return i
+                left -= sizeof(items[i])
+        return end
 
     def recv_available(self):
         return False
 
     def send_available(self):
-        self._send_activated = self._send_pipe.write_available()
+        if self._streaming is not None:
+            if self._streaming not in self._peers:
+                # Ready to raise StreamInterrupted
+                self._send_activated = True
+            else:
+                send_pipe = self._peers[self._streaming][3]
+                self._send_activated = send_pipe.write_available() and \
+                    self._credit[self._streaming].bytes_available()
+            return self._send_activated
+
+        skip_lost = self._skip_lost()
+        self._send_activated = any(
+            send_pipe.write_available() and self._credit[engine_id].available() and
+            not (skip_lost and engine_id in self._lost)
+            for engine_id, (x, y, z, send_pipe) in self._peers.iteritems())
         return self._send_activated
 
+    def peer_stats(self):
+        """Per puller: its ``address``, whether it is ``connected``, the messages (``depth``)
+        and ``bytes`` queued for it, and the ``credit`` and ``credit_bytes`` it granted that are
+        left, None if unlimited.
+        """
+        return [{
+            'address': self._addresses[engine_id],
+            'connected': engine_id not in self._lost,
+            'depth': send_pipe.depth,
+            'bytes': send_pipe.bytes,
+            'credit': self._credit[engine_id].messages,
+            'credit_bytes': self._credit[engine_id].bytes,
+        } for engine_id, (x, y, z, send_pipe) in self._peers.iteritems()]
+
     def activate_send(self, engine_id):
-        self._send_activated = True
+        if engine_id in self._peers:
+            self._send_activated = True
 
     def activate_recv(self, engine_id):
-        raise RuntimeError('Pusher does not receive recv events')
+        if engine_id not in self._peers:
+            return
+
+        engine, x, recv_pipe, y = self._peers[engine_id]
+        credit = self._credit[engine_id]
+        while recv_pipe.read_available():
+            grant = parse_grant(recv_pipe.read()[0])
+            if grant is not None:
+                credit.grant(*grant)
+        if credit.available():
+            self._send_activated = True
+        engine.activate_recv()
+
+    def connection_lost(self, engine_id):
+        self._lost.add(engine_id)
+        # The puller grants credit anew once redialed
+        self._credit[engine_id] = Credit()
+        if self._streaming == engine_id:
+            # The puller is told about the rest of the message once redialed
+            self._peers[engine_id][3].write(Chunk(b'', False, aborted=True), force=True)
+            self._streaming = _INTERRUPTED
+        if not self._closing:
+            self.send_available()
+
+    def connection_open(self, engine_id):
+        if engine_id in self._lost:
+            self._lost.discard(engine_id)
+            if not self._closing:
+                self.send_available()
 
     def connection_close(self, engine_id, err):
-        self._recv_pipe.clear()
-        self._send_pipe.clear()
-        self._mailbox.send(Mail(TYPE_FINALIZE))
+        # Only the failed peer is dropped, the others keep taking turns
+        x, y, recv_pipe, send_pipe = self._peers.pop(engine_id)
+        self._rotation.remove(engine_id)
+        self._lost.discard(engine_id)
+        del self._credit[engine_id]
+        del self._addresses[engine_id]
+        recv_pipe.clear()
+        send_pipe.clear()
+
+        if not self._peers:
+            self._mailbox.send(Mail(TYPE_FINALIZE))
+            return False
+        return True
 
     def connection_finalize(self):
-        self._recv_pipe = self._send_pipe = None
+        self._peers = self._rotation = self._credit = self._addresses = self._lost = None
@@ -15,6 +15,8 @@
 
 class BufferReader(object):
 
+    __slots__ = ('buffer', 'read_ptr', 'buffer_size')
+
     def __init__(self, buf):
         self.buffer = buf
         self.read_ptr = 0
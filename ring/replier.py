@@ -13,51 +13,55 @@
 # limitations under the License.
 
 
-import collections
-
-from ring.connection_impl import ConnectionImpl, Again, Done
+from ring.acceptor import AcceptMixin
+from ring.connection_impl import ConnectionImpl, Again, Done, StreamInterrupted
 from ring.constants import TYPE_FINALIZE
 from ring.events import Mail
-from ring.pipes import Pipe
-from ring.poller import READ
+from ring.pipes import create_recv_pipe
+from ring.protocol import Chunk, Envelope
+from ring.scheduler import FairRecvMixin
 from ring.stream import SocketStream
 from ring.stream_engine import StreamEngine
 from ring.utils import InconsistentStateError
 
 
-class ReplierConnectionImpl(ConnectionImpl):
+class ReplierConnectionImpl(AcceptMixin, FairRecvMixin, ConnectionImpl):
 
-    def __init__(self, socket, ctx, mailbox):
-        super(ReplierConnectionImpl, self).__init__(socket, ctx, mailbox)
+    def __init__(self, socket, ctx, mailbox, options=None):
+        super(ReplierConnectionImpl, self).__init__(socket, ctx, mailbox, options)
         self._connections = {}
-        self._recv_queue = collections.deque()
+        self._initialize_fair_queue()
         self._out_active = {}
         self._last_received_engine_id = -1
-        self._context.io_loop.register(self._socket.fileno(), READ, self._on_accept)
+        # Correlation id of the last request, if the requester pipelines
+        self._last_request_id = None
         self._should_recv = True
+        # Whether a streamed reply is under way
+        self._streaming = False
         self._closing = False
+        self._start_accepting()
 
     def close(self):
         super(ReplierConnectionImpl, self).close()
         self._closing = True
-        self._context.io_loop.unregister(self._socket.fileno())
+        self._stop_accepting()
 
         if not self._connections:
             # If there's no connection at all, trigger finalize immediately
             self._mailbox.send(Mail(TYPE_FINALIZE))
             return
 
-        for engine, stream, recv_pipe, send_pipe in self._connections.itervalues():
-            if not send_pipe.write(Done()):
-                engine.activate_send()
+        for engine_id in self._connections.keys():
+            if not self._send_pipe(engine_id).write(Done()):
+                self._connections[engine_id][0].activate_send()
 
-    def _on_accept(self, fd, events):
-        conn, addr = self._socket.accept()
+    def _add_connection(self, conn, addr):
         stream = SocketStream(conn, io_loop=self._context.io_loop)
-        recv_pipe = Pipe()
-        send_pipe = Pipe()
-        engine = StreamEngine(self._context, stream, recv_pipe, send_pipe, self._mailbox)
-        self._connections[engine.id] = (engine, stream, recv_pipe, send_pipe)
+        recv_pipe = create_recv_pipe(self._options, self._budget, self._stats, address=addr)
+        engine = StreamEngine(
+            self._context, stream, recv_pipe, None, self._mailbox, **self._recv_options())
+        self._add_peer(engine.id, addr)
+        self._connections[engine.id] = (engine, stream, recv_pipe, None)
         self._out_active[engine.id] = True
         engine.activate_recv()
 
@@ -66,36 +70,43 @@ class ReplierConnectionImpl(ConnectionImpl):
 
     def send(self, data):
         if self._should_recv:
+            if self._streaming:
+                # The requester went in the middle of the reply
+                self._streaming = False
+                raise StreamInterrupted
             raise InconsistentStateError('Should not send before recv')
 
         assert self._last_received_engine_id in self._connections
-        engine, x, y, send_pipe = self._connections[self._last_received_engine_id]
+        engine = self._connections[self._last_received_engine_id][0]
+        send_pipe = self._send_pipe(self._last_received_engine_id)
         if not self._out_active[self._last_received_engine_id]:
             raise Again
 
+        streamed = isinstance(data, Chunk)
+        if self._last_request_id is not None:
+            if streamed:
+                raise NotImplementedError('Replies to pipelined requests may not be streamed')
+            data = Envelope(self._last_request_id, data)
         try:
             if not send_pipe.write(data):
                 engine.activate_send()
-            self._should_recv = True
+            self._streaming = streamed and data.more
+            self._should_recv = not self._streaming
         except Again:
             self._out_active[self._last_received_engine_id] = False
+            raise
 
     def recv(self):
         if not self._should_recv:
             raise InconsistentStateError('Should not recv again')
 
-        if len(self._recv_queue) == 0:
-            raise Again
-
-        engine_id = self._recv_queue[0]
-        engine, x, recv_pipe, y = self._connections[engine_id]
-        assert recv_pipe.read_available()
-        read = recv_pipe.read()[0]
+        engine_id, read = self._read_fair()
         self._last_received_engine_id = engine_id
-
-        if not recv_pipe.read_available():
-            self._recv_queue.popleft()
-            engine.activate_recv()
+        if isinstance(read, Envelope):
+            self._last_request_id = read.id
+            read = read.data
+        else:
+            self._last_request_id = None
 
         self._should_recv = False
 
@@ -105,15 +116,16 @@ class ReplierConnectionImpl(ConnectionImpl):
         return len(self._recv_queue) != 0
 
     def send_available(self):
-        return self._out_active[self._last_received_engine_id]
+        return self._out_active.get(self._last_received_engine_id, False)
 
     def activate_send(self, engine_id):
-        assert engine_id in self._out_active
-        assert not self._out_active[engine_id]
-        self._out_active[engine_id] = True
+        # Watermark and budget activations may both arrive, and may outlive the engine
+        if engine_id in self._out_active:
+            self._out_active[engine_id] = True
 
     def activate_recv(self, engine_id):
-        self._recv_queue.append(engine_id)
+        if engine_id in self._connections:
+            self._recv_queue.push(engine_id)
 
     def connection_close(self, engine_id, err):
         if engine_id == -1:
@@ -121,7 +133,7 @@ class ReplierConnectionImpl(ConnectionImpl):
             # wait for the user to terminate the connection.
             # Terminating connection autonomously brings many hard to find bugs and sometimes
             # subtle race conditions
-            self._context.io_loop.unregister(self._socket.fileno())
+            self._stop_accepting()
         else:
             if engine_id == self._last_received_engine_id:
                 # Reset state
@@ -130,11 +142,16 @@ class ReplierConnectionImpl(ConnectionImpl):
             # Erase the connection from cache
             x, y, recv_pipe, send_pipe = self._connections[engine_id]
             recv_pipe.clear()
-            send_pipe.clear()
+            if send_pipe is not None:
+                send_pipe.clear()
             del self._connections[engine_id]
+            del self._out_active[engine_id]
+            self._remove_peer(engine_id)
+            self._update_accepting()
 
             if self._closing and not self._connections:
                 self._mailbox.send(Mail(TYPE_FINALIZE))
 
     def connection_finalize(self):
         self._recv_queue = self._connections = self._out_active = None
+        self._addresses = self._served = None
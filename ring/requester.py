@@ -12,60 +12,121 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import time
 
-from ring.connection_impl import ConnectionImpl, Again, Done
+from ring.balancer import create_balancer
+from ring.connection_impl import (
+    ConnectionImpl, Again, Done, JoinChunksMixin, RequestFailed, StreamInterrupted
+)
 from ring.constants import TYPE_FINALIZE
 from ring.events import Mail
-from ring.pipes import Pipe
+from ring.options import BALANCE
+from ring.pipes import create_pipes
+from ring.protocol import ID_MAX, Chunk, Envelope
 from ring.stream import SocketStream
 from ring.stream_engine import StreamEngine
-from ring.utils import InconsistentStateError
+from ring.utils import InconsistentStateError, ProtocolError
 
 
-class RequesterConnectionImpl(ConnectionImpl):
+class RequesterConnectionImpl(JoinChunksMixin, ConnectionImpl):
+    """Sends each request to one of the connected repliers and waits for its reply.
 
-    def __init__(self, socket, ctx, waker):
-        super(RequesterConnectionImpl, self).__init__(socket, ctx, waker)
-        self._stream = SocketStream(self._socket, io_loop=self._context.io_loop)
+    The replier is picked by the BALANCE policy among those whose send pipe has room. A
+    replier that fails is ejected, and the other ones keep serving.
 
-        self._recv_pipe = Pipe()
-        self._send_pipe = Pipe()
+    With RECONNECT_IVL set, a lost replier is redialed instead. The request awaiting its reply
+    fails all the same, and it is skipped until connected again, unless every replier is lost.
+    """
 
-        self._stream_engine = StreamEngine(
-            self._context, self._stream, self._recv_pipe, self._send_pipe, self._mailbox)
+    def __init__(self, socket, ctx, waker, options=None):
+        super(RequesterConnectionImpl, self).__init__(socket, ctx, waker, options)
+        self._peers = {}
+        # Engine ids in the order they were connected
+        self._order = []
+        self._balancer = create_balancer(self._options.get(BALANCE))
+        # Engine ids of the peers being redialed
+        self._lost = set()
 
-        self._recv_activated = True
+        self._recv_activated = False
         self._send_activated = True
 
         self._should_send = True
+        # The peer of the request awaiting reply, and when it was sent
+        self._pending = None
+        self._sent_at = None
+        self._failed = False
 
     def close(self):
         super(RequesterConnectionImpl, self).close()
-        if not self._send_pipe.write(Done()):
-            self._stream_engine.activate_send()
         self._send_activated = False
 
+        if not self._peers:
+            # If there's no peer at all, trigger finalize immediately
+            self._mailbox.send(Mail(TYPE_FINALIZE))
+            return
+
+        for engine, stream, recv_pipe, send_pipe in self._peers.itervalues():
+            if not send_pipe.write(Done()):
+                engine.activate_send()
+            engine.stop_redialing()
+
     def connect(self, addr):
-        self._stream_engine.activate_connect(addr)
+        if self._peers:
+            # The first peer takes the connection's socket, the others get their own
+            so = self._connecting_socket()
+        else:
+            so = self._socket
+
+        stream = SocketStream(so, io_loop=self._context.io_loop)
+        recv_pipe, send_pipe = create_pipes(self._options, self._budget, self._stats)
+        options = self._recv_options()
+        options.update(self._reconnect_options())
+        engine = StreamEngine(self._context, stream, recv_pipe, send_pipe, self._mailbox, **options)
+        send_pipe.set_writable_callback(engine.post_activate_send)
+        self._peers[engine.id] = (engine, stream, recv_pipe, send_pipe)
+        self._order.append(engine.id)
+        self._balancer.add(engine.id)
+        self._send_activated = True
+
+        engine.activate_connect(addr)
+
+    def recv_chunk(self):
+        if self._failed:
+            self._failed = False
+            self._should_send = True
+            raise RequestFailed
 
-    def recv(self):
         if self._should_send:
             raise InconsistentStateError('Should not recv without send')
 
         if not self._recv_activated:
             raise Again
 
+        engine, x, recv_pipe, y = self._peers[self._pending]
         try:
-            result, _ = self._recv_pipe.read()
-            self._should_send = True
-            return result
+            result, _ = recv_pipe.read()
         except Again:
             self._recv_activated = False
 
             # Submit read task
-            self._stream_engine.activate_recv()
+            engine.activate_recv()
             raise
 
+        aborted = False
+        if isinstance(result, Chunk):
+            if result.more:
+                # The rest of the reply follows
+                return result.data, True
+            aborted, result = result.aborted, result.data
+
+        self._balancer.on_reply(self._pending, time.time() - self._sent_at)
+        self._should_send = True
+        self._pending = None
+        if aborted:
+            raise StreamInterrupted
+        return result, False
+
     def send(self, data):
         if not self._should_send:
             raise InconsistentStateError('Should not send again')
@@ -73,33 +134,199 @@ class RequesterConnectionImpl(ConnectionImpl):
         if not self._send_activated:
             raise Again
 
+        engine_id = self._choose_peer()
+        self._write(engine_id, data)
+        self._should_send = False
+        self._pending = engine_id
+        self._sent_at = time.time()
+        # Only a reply of this peer can activate recv
+        self._recv_activated = True
+
+    def _choose_peer(self):
+        # Lost peers only queue requests while no peer is connected
+        skip_lost = len(self._lost) < len(self._peers)
+        candidates = [
+            engine_id for engine_id in self._order
+            if self._peers[engine_id][3].write_available() and
+            not (skip_lost and engine_id in self._lost)]
+        if not candidates:
+            self._send_activated = False
+            raise Again
+        return self._balancer.choose(candidates)
+
+    def _write(self, engine_id, data):
+        engine, x, y, send_pipe = self._peers[engine_id]
         try:
-            if not self._send_pipe.write(data):
+            if not send_pipe.write(data):
                 # If the pipe returns false, it was previously empty.
                 # We would need to resubmit the task
-                self._stream_engine.activate_send()
-            self._should_send = False
+                engine.activate_send()
         except Again:
+            # Refused by the shared memory budget
             self._send_activated = False
+            raise
+        self._balancer.on_sent(engine_id)
 
     def recv_available(self):
-        self._recv_activated = self._recv_pipe.read_available()
+        if self._failed:
+            return True
+        if self._pending is None:
+            return False
+        self._recv_activated = self._peers[self._pending][2].read_available()
         return self._recv_activated
 
     def send_available(self):
-        self._send_activated = self._send_pipe.write_available()
+        skip_lost = len(self._lost) < len(self._peers)
+        self._send_activated = any(
+            send_pipe.write_available() and not (skip_lost and engine_id in self._lost)
+            for engine_id, (x, y, z, send_pipe) in self._peers.iteritems())
         return self._send_activated
 
     def activate_send(self, engine_id):
-        self._send_activated = True
+        if engine_id in self._peers:
+            self._send_activated = True
 
     def activate_recv(self, engine_id):
-        self._recv_activated = True
+        if engine_id == self._pending:
+            self._recv_activated = True
+
+    def connection_lost(self, engine_id):
+        self._lost.add(engine_id)
+        if engine_id == self._pending:
+            # Its reply would never come. What came of it so far is dropped, and the request
+            # too if it is yet to be sent.
+            self._clear_pipes(engine_id)
+            self._balancer.on_failed(engine_id)
+            self._pending = None
+            self._failed = True
+
+    def connection_open(self, engine_id):
+        self._lost.discard(engine_id)
+
+    def _clear_pipes(self, engine_id):
+        x, y, recv_pipe, send_pipe = self._peers[engine_id]
+        recv_pipe.clear()
+        send_pipe.clear()
+
+    def connection_close(self, engine_id, err):
+        # Eject the peer. Its request awaiting reply, if any, fails.
+        x, y, recv_pipe, send_pipe = self._peers.pop(engine_id)
+        self._order.remove(engine_id)
+        self._lost.discard(engine_id)
+        self._balancer.remove(engine_id)
+        recv_pipe.clear()
+        send_pipe.clear()
+
+        if engine_id == self._pending:
+            self._pending = None
+            self._failed = True
+
+        if not self._peers:
+            self._mailbox.send(Mail(TYPE_FINALIZE))
+            return False
+        return True
+
+    def connection_finalize(self):
+        self._peers = self._order = self._balancer = self._lost = None
+
+
+class PipelinedRequesterConnectionImpl(RequesterConnectionImpl):
+    """Requester with any number of requests in flight.
+
+    Each request carries a correlation id in its frame header, which the replier echoes in the
+    reply. send returns the id, and recv returns (id, reply) pairs as replies arrive, in any
+    order.
+    """
+
+    def __init__(self, socket, ctx, waker, options=None):
+        super(PipelinedRequesterConnectionImpl, self).__init__(socket, ctx, waker, options)
+        self._next_id = 0
+        # Request id -> (engine id, time sent)
+        self._in_flight = {}
+        # Engine ids with replies queued in their recv pipes
+        self._recv_queue = collections.deque()
+        # Engines reading replies. Reading starts with the first request sent to a peer.
+        self._reading = set()
+        # Ids of requests lost with their peer
+        self._failed_ids = collections.deque()
+
+    def send(self, data):
+        if not self._send_activated:
+            raise Again
+
+        engine_id = self._choose_peer()
+        request_id = self._next_id
+        self._write(engine_id, Envelope(request_id, data))
+        self._next_id = (self._next_id + 1) % ID_MAX
+        self._in_flight[request_id] = (engine_id, time.time())
+
+        if engine_id not in self._reading:
+            self._reading.add(engine_id)
+            self._peers[engine_id][0].activate_recv()
+        return request_id
+
+    def recv_chunk(self):
+        raise NotImplementedError('Pipelined requesters do not receive streams')
+
+    def recv(self):
+        if self._failed_ids:
+            raise RequestFailed(self._failed_ids.popleft())
+
+        if len(self._recv_queue) == 0:
+            raise Again
+
+        engine_id = self._recv_queue[0]
+        engine, x, recv_pipe, y = self._peers[engine_id]
+        assert recv_pipe.read_available()
+        reply = recv_pipe.read()[0]
+
+        if not recv_pipe.read_available():
+            self._recv_queue.popleft()
+            engine.activate_recv()
+
+        if not isinstance(reply, Envelope) or reply.id not in self._in_flight:
+            raise ProtocolError('Reply does not match any request in flight')
+        sent_by, sent_at = self._in_flight.pop(reply.id)
+        self._balancer.on_reply(engine_id, time.time() - sent_at)
+        return reply.id, reply.data
+
+    def recv_many(self, max_count):
+        result = [self.recv()]
+        while len(result) < max_count and self._recv_queue and not self._failed_ids:
+            result.append(self.recv())
+        return result
+
+    def recv_available(self):
+        return len(self._failed_ids) != 0 or len(self._recv_queue) != 0
+
+    def activate_recv(self, engine_id):
+        if engine_id in self._peers:
+            self._recv_queue.append(engine_id)
+
+    def _fail_in_flight(self, engine_id):
+        # Returns whether any request was in flight
+        failed = sorted(
+            request_id for request_id, (sent_to, x) in self._in_flight.iteritems()
+            if sent_to == engine_id)
+        for request_id in failed:
+            del self._in_flight[request_id]
+            self._balancer.on_failed(engine_id)
+        self._failed_ids.extend(failed)
+
+        while engine_id in self._recv_queue:
+            self._recv_queue.remove(engine_id)
+        return len(failed) != 0
+
+    def connection_lost(self, engine_id):
+        self._lost.add(engine_id)
+        if self._fail_in_flight(engine_id):
+            self._clear_pipes(engine_id)
 
     def connection_close(self, engine_id, err):
-        self._recv_pipe.clear()
-        self._send_pipe.clear()
-        self._mailbox.send(Mail(TYPE_FINALIZE))
+        self._fail_in_flight(engine_id)
+        self._reading.discard(engine_id)
+        return super(PipelinedRequesterConnectionImpl, self).connection_close(engine_id, err)
 
     def connection_finalize(self):
-        self._recv_pipe = self._send_pipe = None
+        super(PipelinedRequesterConnectionImpl, self).connection_finalize()
+        self._in_flight = self._recv_queue = self._reading = None
@@ -0,0 +1,117 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from ring.connection_impl import Again
+from ring.protocol import Envelope
+from ring.replier import ReplierConnectionImpl
+
+
+class RouterConnectionImpl(ReplierConnectionImpl):
+    """Replier that holds any number of requests and replies to them in any order.
+
+    recv returns (token, request) pairs, and send takes (token, reply) pairs. The token routes
+    the reply back to the requester, and to the request it answers if the requester pipelines.
+    send may be called from any thread.
+
+    A reply to a requester whose send pipe is full raises Again. The sender may then wait for
+    room with wait_writable, without the mailbox, which is left to the receiving thread.
+    """
+
+    def __init__(self, socket, ctx, mailbox, options=None):
+        super(RouterConnectionImpl, self).__init__(socket, ctx, mailbox, options)
+        # Guards the connections against replies sent from other threads
+        self._lock = threading.RLock()
+        # Counts the times a full send pipe had room again, or the peers changed. It has a lock
+        # of its own, as pipes report room while holding theirs.
+        self._writable = threading.Condition(threading.Lock())
+        self._writable_count = 0
+
+    def send(self, data):
+        (engine_id, request_id), reply = data
+        if request_id is not None:
+            reply = Envelope(request_id, reply)
+
+        with self._lock:
+            if self._connections is None or engine_id not in self._connections:
+                # The requester went away. Nobody is left to reply to.
+                self._stats['unroutable'] += 1
+                return
+            send_pipe = self._send_pipe(engine_id)
+            try:
+                if not send_pipe.write(reply):
+                    self._connections[engine_id][0].activate_send()
+            except Again:
+                if send_pipe.wait_writable(self._on_writable):
+                    # Drained in the meantime
+                    self._on_writable()
+                raise
+
+    def send_many(self, items):
+        sent = 0
+        for data in items:
+            try:
+                self.send(data)
+            except Again:
+                if sent:
+                    return sent
+                raise
+            sent += 1
+        return sent
+
+    def _on_writable(self):
+        with self._writable:
+            self._writable_count += 1
+            self._writable.notify_all()
+
+    def writable_count(self):
+        """Taken before a send, and passed to wait_writable if it raises Again."""
+        with self._writable:
+            return self._writable_count
+
+    def wait_writable(self, count, timeout=None):
+        """Waits up to ``timeout`` seconds for a send pipe to have room, or the peers to change,
+        since writable_count returned ``count``. Returns early at times, so callers retry.
+        """
+        with self._writable:
+            if self._writable_count == count:
+                self._writable.wait(timeout)
+
+    def recv(self):
+        engine_id, request = self._read_fair()
+        if isinstance(request, Envelope):
+            return (engine_id, request.id), request.data
+        return (engine_id, None), request
+
+    def recv_many(self, max_count):
+        result = [self.recv()]
+        while len(result) < max_count and len(self._recv_queue) != 0:
+            result.append(self.recv())
+        return result
+
+    def send_available(self):
+        return True
+
+    def connection_close(self, engine_id, err):
+        with self._lock:
+            result = super(RouterConnectionImpl, self).connection_close(engine_id, err)
+        # Replies waiting for the peer are now unroutable
+        self._on_writable()
+        return result
+
+    def connection_finalize(self):
+        with self._lock:
+            super(RouterConnectionImpl, self).connection_finalize()
+        self._on_writable()
@@ -0,0 +1,136 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+
+from ring.connection_impl import Again
+from ring.options import FAIR_QUANTUM, PEER_WEIGHT, InvalidOptionError
+from ring.pipes import sizeof
+
+DEFAULT_QUANTUM = 64 * 1024
+
+
+class FairQueue(object):
+    """Deficit round robin over the peers that have messages queued.
+
+    Each turn, a peer is credited ``quantum`` times its weight in bytes, and is served while its
+    credit covers the next message. So every peer gets a share of bytes in proportion to its
+    weight, however deep its queue or large its messages.
+    """
+
+    def __init__(self, quantum=DEFAULT_QUANTUM):
+        self._quantum = quantum
+        self._active = collections.deque()
+        self._deficit = {}
+        self._weights = {}
+        # Whether the peer at the head was already credited for its current turn
+        self._in_turn = False
+
+    def __len__(self):
+        return len(self._active)
+
+    def set_weight(self, peer, weight):
+        # The peer would never be credited enough to be served otherwise, and next() would spin
+        if not isinstance(weight, (int, long, float)) or weight <= 0:
+            raise InvalidOptionError(PEER_WEIGHT, weight)
+        self._weights[peer] = weight
+
+    def push(self, peer):
+        """Marks peer as having messages queued."""
+        if peer not in self._deficit:
+            self._deficit[peer] = 0
+            self._active.append(peer)
+
+    def remove(self, peer):
+        """Marks peer as drained, or gone. Credit left is not kept for later."""
+        if peer not in self._deficit:
+            return
+        if self._active[0] == peer:
+            self._in_turn = False
+        self._active.remove(peer)
+        del self._deficit[peer]
+
+    def forget(self, peer):
+        self.remove(peer)
+        self._weights.pop(peer, None)
+
+    def next(self, front_size):
+        """Returns the peer to serve next. front_size(peer) gives the size of its next message."""
+        while 1:
+            peer = self._active[0]
+            if not self._in_turn:
+                self._deficit[peer] += self._quantum * self._weights.get(peer, 1)
+                self._in_turn = True
+            size = front_size(peer)
+            if size <= self._deficit[peer]:
+                self._deficit[peer] -= size
+                return peer
+            # Credit used up for this turn
+            self._active.rotate(-1)
+            self._in_turn = False
+
+
+class FairRecvMixin(object):
+    """Fair receiving for impls accepting peers into ``self._connections``, which maps engine
+    ids to (engine, stream, recv_pipe, send_pipe). The send pipe may be None, see AcceptMixin.
+    """
+
+    def _initialize_fair_queue(self):
+        self._recv_queue = FairQueue(self._options.get(FAIR_QUANTUM))
+        self._addresses = {}
+        self._served = collections.Counter()
+
+    def _add_peer(self, engine_id, address):
+        # Raises InvalidOptionError for a weight that is not a positive number. Called before
+        # the peer is taken into self._connections, so the acceptor can reject it cleanly.
+        weight = self._options.get(PEER_WEIGHT)
+        if weight is not None:
+            self._recv_queue.set_weight(engine_id, weight(address))
+        self._addresses[engine_id] = address
+
+    def _remove_peer(self, engine_id):
+        self._recv_queue.forget(engine_id)
+        self._addresses.pop(engine_id, None)
+        self._served.pop(engine_id, None)
+
+    def _front_size(self, engine_id):
+        return sizeof(self._connections[engine_id][2].front())
+
+    def _read_fair(self):
+        """Reads the next message by fair queuing. Returns the engine id and the message."""
+        if len(self._recv_queue) == 0:
+            raise Again
+
+        engine_id = self._recv_queue.next(self._front_size)
+        return engine_id, self._read_from(engine_id)
+
+    def _read_from(self, engine_id):
+        """Reads the next message of a peer, out of turn. Raises Again if it has none."""
+        engine, x, recv_pipe, y = self._connections[engine_id]
+        read = recv_pipe.read()[0]
+        self._served[engine_id] += sizeof(read)
+
+        if not recv_pipe.read_available():
+            self._recv_queue.remove(engine_id)
+            engine.activate_recv()
+
+        return read
+
+    def peer_stats(self):
+        return [{
+            'address': self._addresses.get(engine_id),
+            'depth': recv_pipe.depth,
+            'bytes': recv_pipe.bytes,
+            'served': self._served[engine_id],
+        } for engine_id, (x, y, recv_pipe, z) in self._connections.iteritems()]
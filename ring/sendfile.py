@@ -0,0 +1,111 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import socket
+import sys
+
+# Bytes a single fallback read takes from the file
+_READ_SIZE = 128 * 1024
+
+
+def _load_sendfile():
+    # Python 2 lacks os.sendfile. Linux has the same sendfile(2) behind it.
+    if hasattr(os, 'sendfile'):
+        return os.sendfile
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        function = libc.sendfile64
+    except (OSError, AttributeError):
+        return None
+    function.argtypes = [
+        ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t]
+    function.restype = ctypes.c_ssize_t
+
+    def sendfile(out_fd, in_fd, offset, count):
+        position = ctypes.c_int64(offset)
+        sent = function(out_fd, in_fd, ctypes.byref(position), count)
+        if sent < 0:
+            error = ctypes.get_errno()
+            raise socket.error(error, os.strerror(error))
+        return sent
+
+    return sendfile
+
+
+_sendfile = _load_sendfile()
+
+
+class FileRegion(object):
+    """Bytes of a file sent as one message. The kernel copies them straight from the file to
+    the socket where it can, and the file is closed once the region and its slices are gone.
+    """
+
+    __slots__ = ('file', 'offset', 'count')
+
+    def __init__(self, file, offset, count):
+        self.file = file
+        self.offset = offset
+        self.count = count
+
+    @staticmethod
+    def open(source, offset=0, count=None):
+        """Creates a region of source, a path or a file descriptor, which is duplicated so the
+        caller may close it. ``count`` defaults to the rest of the file.
+        """
+        if isinstance(source, (int, long)):
+            file = os.fdopen(os.dup(source), 'rb')
+        else:
+            file = open(source, 'rb')
+
+        size = os.fstat(file.fileno()).st_size
+        if count is None:
+            count = size - offset
+        if offset < 0 or count < 0 or offset + count > size:
+            file.close()
+            raise ValueError('Region of %d bytes at %d exceeds file of %d bytes' %
+                             (count, offset, size))
+        return FileRegion(file, offset, count)
+
+    def __len__(self):
+        return self.count
+
+    def slice(self, start, count):
+        return FileRegion(self.file, self.offset + start, count)
+
+    def send(self, sock):
+        """Sends what it can of the region to a nonblocking socket, and advances past it.
+        Returns the bytes sent.
+        """
+        if _sendfile is not None:
+            try:
+                sent = _sendfile(sock.fileno(), self.file.fileno(), self.offset, self.count)
+            except OSError as e:
+                raise socket.error(e.errno, e.strerror)
+        else:
+            self.file.seek(self.offset)
+            data = self.file.read(min(self.count, _READ_SIZE))
+            sent = sock.send(data) if data else 0
+
+        if not sent and self.count:
+            raise socket.error(errno.EIO, 'File ended before the region sent')
+        self.offset += sent
+        self.count -= sent
+        return sent
@@ -0,0 +1,202 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import Queue
+import cPickle
+import itertools
+import multiprocessing
+import threading
+import traceback
+
+from ring.connection import ROUTER
+from ring.context import Context
+from ring.utils import RingError, get_logger
+
+_logger = get_logger(__name__)
+
+MODE_THREAD = 'thread'
+MODE_PROCESS = 'process'
+
+# Requests taken off the router per pass
+_RECV_BATCH = 64
+# How often the dispatcher checks whether it was stopped, in seconds
+_STOP_INTERVAL = 0.1
+
+
+class HandlerError(RingError):
+    """Replied with ``pyobj`` to a request whose handler raised. Its message is the handler's
+    traceback.
+    """
+
+
+def handle(handler, request, pyobj=False):
+    """Returns the reply of handler to request, pickling both with ``pyobj``.
+
+    A requester is owed a reply to every request. If the handler raises, the error is logged
+    and the reply is empty, or a HandlerError with ``pyobj``, so it can be told apart from
+    any reply of the handler.
+    """
+    try:
+        if pyobj:
+            return cPickle.dumps(handler(cPickle.loads(request)))
+        return handler(request)
+    except Exception:
+        error = traceback.format_exc()
+        _logger.error('Handler raised error:\n%s', error)
+        if pyobj:
+            return cPickle.dumps(HandlerError(error))
+        return b''
+
+
+def _work(handler, pyobj, requests, replies):
+    # Worker loop of both modes. None in requests stops it.
+    while 1:
+        item = requests.get()
+        if item is None:
+            break
+        token, request = item
+        replies(token, handle(handler, request, pyobj))
+
+
+def _process_work(handler, pyobj, requests, replies):
+    _work(handler, pyobj, requests, lambda token, reply: replies.put((token, reply)))
+
+
+class Server(object):
+    """Serves requests on a ROUTER with a pool of workers.
+
+    ``handler`` maps a request to its reply, as strings, or as objects if ``pyobj`` is set.
+    Workers are threads, or processes for CPU bound handlers, which then receive the handler
+    by fork. Replies go straight from the workers to the router, except that processes hand
+    them to a collecting thread first.
+
+    Requests of a pipelined requester always go to the same worker, so they are answered in
+    order. The others go to the workers in turn. A request whose handler raises gets the reply
+    of handle().
+    """
+
+    def __init__(self, endpoint, handler, workers=1, mode=MODE_THREAD, pyobj=False):
+        if mode not in (MODE_THREAD, MODE_PROCESS):
+            raise ValueError('Unknown mode %r' % (mode,))
+        if workers < 1:
+            raise ValueError('At least one worker is needed')
+
+        self._endpoint = endpoint
+        self._handler = handler
+        self._num_workers = workers
+        self._mode = mode
+        self._pyobj = pyobj
+
+        self._ctx = None
+        self._router = None
+        self._queues = []
+        self._workers = []
+        self._collector = None
+        self._turns = itertools.cycle(xrange(workers))
+        self._stopped = threading.Event()
+
+    def _start_workers(self):
+        if self._mode == MODE_PROCESS:
+            # Forked before the context starts its threads
+            self._replies = multiprocessing.Queue()
+            for _ in xrange(self._num_workers):
+                requests = multiprocessing.Queue()
+                worker = multiprocessing.Process(
+                    target=_process_work,
+                    args=(self._handler, self._pyobj, requests, self._replies))
+                worker.daemon = True
+                worker.start()
+                self._queues.append(requests)
+                self._workers.append(worker)
+        else:
+            for _ in xrange(self._num_workers):
+                requests = Queue.Queue()
+                worker = threading.Thread(
+                    target=_work,
+                    args=(self._handler, self._pyobj, requests, self._reply),
+                    name='Ring server worker')
+                worker.daemon = True
+                worker.start()
+                self._queues.append(requests)
+                self._workers.append(worker)
+
+    def _reply(self, token, reply):
+        self._router.send((token, reply))
+
+    def _collect(self):
+        while 1:
+            item = self._replies.get()
+            if item is None:
+                break
+            self._reply(*item)
+
+    def start(self):
+        """Binds the endpoint and starts the workers. Requests are served by serve_forever."""
+        self._start_workers()
+        self._ctx = Context()
+        self._router = self._ctx.connection(ROUTER)
+        self._router.bind(self._endpoint)
+
+        if self._mode == MODE_PROCESS:
+            self._collector = threading.Thread(target=self._collect, name='Ring server collector')
+            self._collector.daemon = True
+            self._collector.start()
+
+    def _dispatch(self, token, request):
+        engine_id, request_id = token
+        if request_id is not None:
+            # Keep the requests of a pipelined requester in order
+            index = engine_id % self._num_workers
+        else:
+            index = next(self._turns)
+        self._queues[index].put((token, request))
+
+    def serve_forever(self):
+        """Dispatches requests to the workers until stop is called."""
+        try:
+            while not self._stopped.is_set():
+                for token, request in self._router.recv_many(_RECV_BATCH, _STOP_INTERVAL):
+                    self._dispatch(token, request)
+        finally:
+            self._shutdown()
+
+    def stop(self):
+        """Makes serve_forever return. May be called from any thread."""
+        self._stopped.set()
+
+    def _shutdown(self):
+        for requests in self._queues:
+            requests.put(None)
+        for worker in self._workers:
+            worker.join()
+        if self._collector is not None:
+            self._replies.put(None)
+            self._collector.join()
+
+        self._router.close()
+        self._ctx.stop()
+
+    @property
+    def address(self):
+        return self._router.getsockname()
+
+
+def serve(endpoint, handler, workers=1, mode=MODE_THREAD, pyobj=False):
+    """Serves requests on endpoint with handler until interrupted. See Server."""
+    server = Server(endpoint, handler, workers, mode, pyobj)
+    server.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
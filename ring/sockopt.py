@@ -0,0 +1,95 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import socket
+import sys
+
+from ring.options import (
+    NODELAY, SNDBUF, RCVBUF, KEEPALIVE, KEEPALIVE_IDLE, KEEPALIVE_INTVL, KEEPALIVE_CNT, QUICKACK,
+    FASTOPEN
+)
+
+_LINUX = sys.platform.startswith('linux')
+
+# Python 2 lacks the constants of the newer options
+_TCP_FASTOPEN = getattr(socket, 'TCP_FASTOPEN', 23 if _LINUX else None)
+# Linux 4.11
+_TCP_FASTOPEN_CONNECT = getattr(socket, 'TCP_FASTOPEN_CONNECT', 30 if _LINUX else None)
+
+# Option to its (level, name), None where the platform lacks it. Those set on both ends of a
+# connection.
+_PEER_OPTIONS = [
+    (NODELAY, socket.IPPROTO_TCP, getattr(socket, 'TCP_NODELAY', None)),
+    (SNDBUF, socket.SOL_SOCKET, socket.SO_SNDBUF),
+    (RCVBUF, socket.SOL_SOCKET, socket.SO_RCVBUF),
+    (KEEPALIVE, socket.SOL_SOCKET, socket.SO_KEEPALIVE),
+    (KEEPALIVE_IDLE, socket.IPPROTO_TCP, getattr(socket, 'TCP_KEEPIDLE', None)),
+    (KEEPALIVE_INTVL, socket.IPPROTO_TCP, getattr(socket, 'TCP_KEEPINTVL', None)),
+    (KEEPALIVE_CNT, socket.IPPROTO_TCP, getattr(socket, 'TCP_KEEPCNT', None)),
+    # One-shot: set once here, not re-armed after reads
+    (QUICKACK, socket.IPPROTO_TCP, getattr(socket, 'TCP_QUICKACK', None)),
+]
+
+_SUPPORTED = dict((option, name is not None) for option, level, name in _PEER_OPTIONS)
+_SUPPORTED[FASTOPEN] = _TCP_FASTOPEN is not None
+
+
+def supported(option, value):
+    """Whether option may be set to value on this platform."""
+    if value is None or value is False:
+        # Leaves the socket alone
+        return True
+    return _SUPPORTED.get(option, True)
+
+
+def set_option(options, option, value):
+    """Sets option on options, refusing socket options the platform lacks."""
+    if not supported(option, value):
+        raise NotImplementedError('Option %r is not supported on this platform' % (option,))
+    options.set(option, value)
+
+
+def _set(sock, options, option, level, name):
+    # None and False keep the system's default
+    value = options.get(option)
+    if value is None or value is False or name is None:
+        return
+    sock.setsockopt(level, name, int(value))
+
+
+def configure_peer(sock, options):
+    """Applies the options to a socket before it connects, or once it is accepted."""
+    for option, level, name in _PEER_OPTIONS:
+        _set(sock, options, option, level, name)
+
+
+def configure_connecting(sock, options):
+    configure_peer(sock, options)
+    if options.get(FASTOPEN) is not None and _TCP_FASTOPEN_CONNECT is not None:
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, _TCP_FASTOPEN_CONNECT, 1)
+        except socket.error:
+            # Older kernels only take fast open through sendto, which streams do not use
+            pass
+
+
+def configure_listening(sock, options):
+    """Applies the options to a socket before it listens. Buffer sizes are set here too, so the
+    window scale offered in the handshake fits them.
+    """
+    _set(sock, options, SNDBUF, socket.SOL_SOCKET, socket.SO_SNDBUF)
+    _set(sock, options, RCVBUF, socket.SOL_SOCKET, socket.SO_RCVBUF)
+    if options.get(FASTOPEN) is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, _TCP_FASTOPEN, options.get(FASTOPEN))
@@ -29,6 +29,7 @@ from ring.constants import (
 )
 from ring.utils import errno_from_exception, get_logger
 from ring.reader import BufferReader
+from ring.sendfile import FileRegion
 
 
 logger = get_logger(__name__)
@@ -46,6 +47,12 @@ class StreamClosedError(SocketError):
 
 class SocketStream(object):
 
+    __slots__ = (
+        'socket', 'eventmask', 'callbacks', 'read_buffer', 'write_buffer', 'read_buffer_reader',
+        'read_length', 'read_delimiter', 'io_loop', 'read_callback', 'read_future',
+        'write_callback', 'write_future', 'connect_callback', 'connect_future', 'close_callback',
+        'error', 'stopping', 'stopped', 'connecting')
+
     def __init__(self, socket, on_close=None, io_loop=None):
         self.socket = socket
         self.socket.setblocking(0)
@@ -135,6 +142,11 @@ class SocketStream(object):
     def closed(self):
         return self.stopping
 
+    @property
+    def writing(self):
+        """Whether written data is still waiting for the socket to take it."""
+        return bool(self.write_buffer)
+
     def _on_connect(self):
         error = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
         if error != 0:
@@ -165,6 +177,11 @@ class SocketStream(object):
                     if next_read_length <= self.read_buffer_reader.buffer_size:
                         self._read_once()
                         next_read_length = 2 * self.read_buffer_reader.buffer_size
+
+                if not self.read_callback and not self.read_future:
+                    # Nobody is waiting for more. Leave the rest in the kernel, so its
+                    # window pushes back on the sender.
+                    break
             except socket.error as e:
                 if errno_from_exception(e) in ERR_WOULD_BLOCK:
                     break
@@ -181,9 +198,14 @@ class SocketStream(object):
             if len(self.write_buffer) == 0:
                 break
             try:
-                bytes_written = self.socket.send(self.write_buffer[0])
-                self.write_buffer[0] = self.write_buffer[0][bytes_written:]
-                if len(self.write_buffer[0]) == 0:
+                front = self.write_buffer[0]
+                if isinstance(front, FileRegion):
+                    # Advances in place
+                    front.send(self.socket)
+                else:
+                    bytes_written = self.socket.send(front)
+                    self.write_buffer[0] = front = front[bytes_written:]
+                if len(front) == 0:
                     self.write_buffer.popleft()
             except socket.error as e:
                 if errno_from_exception(e) in ERR_WOULD_BLOCK:
@@ -222,7 +244,9 @@ class SocketStream(object):
             if event & ERROR:
                 self._on_error()
                 return
-            eventmask = READ | ERROR
+            eventmask = ERROR
+            if self.read_callback or self.read_future:
+                eventmask |= READ
             if (self.write_callback
                     or self.write_future
                     or self.connect_callback
@@ -382,8 +406,11 @@ class SocketStream(object):
                 raise InconsistentStateError('SocketStream closed')
 
         # Append to buffer
-        for i in range(0, len(data), _MAX_BLOCK_SIZE):
-            self.write_buffer.append(data[i:i + _MAX_BLOCK_SIZE])
+        if isinstance(data, FileRegion):
+            self.write_buffer.append(data)
+        else:
+            for i in range(0, len(data), _MAX_BLOCK_SIZE):
+                self.write_buffer.append(data[i:i + _MAX_BLOCK_SIZE])
 
         try:
             self._on_write()
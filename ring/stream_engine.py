@@ -19,22 +19,58 @@ from struct import unpack
 import itertools
 import threading
 
-from ring.co import Return, coroutine
+from ring.co import Future, Return, coroutine
 from ring.connection_impl import Again, Done
 from ring.constants import (
-    TYPE_CONNECT_SUCCESS, TYPE_ACTIVATE_RECV, TYPE_ACTIVATE_SEND, TYPE_ERROR, TYPE_CLOSED,
-    TYPE_FINALIZE
+    TYPE_CONNECT_SUCCESS, TYPE_ACTIVATE_RECV, TYPE_ACTIVATE_SEND, TYPE_DISCONNECTED, TYPE_ERROR,
+    TYPE_CLOSED, TYPE_FINALIZE
 )
 from ring.events import Mail
-from ring.protocol import LEN_FRAME_HEADER, FMT_FRAME_HEADER, FLAG_MORE, generate_payload_frame
+from ring.heartbeat import (
+    BUSY, BUSY_FRAME, PING, PING_FRAME, PONG, PONG_FRAME, HeartbeatExpired
+)
+from ring.mapped import MappedWriter
+from ring.protocol import (
+    LEN_FRAME_HEADER, FMT_FRAME_HEADER, FLAG_MORE, FLAG_ID, FLAG_CONTROL, FLAG_STREAM, FMT_ID,
+    LEN_ID, Chunk, Control, Envelope, Framed, generate_frames
+)
+from ring.sendfile import FileRegion
+from ring.stream import SocketStream
 
 _lock = threading.RLock()
 _counter = itertools.count()
 
+_MAX_BATCH_SIZE = 64 * 1024
+_BATCHABLE = (str, Envelope, Framed, Control, Chunk)
+
+
+def _batchable(message):
+    # Files are sent from the file, and large messages frame by frame, not joined into a batch
+    return isinstance(message, _BATCHABLE) and not isinstance(
+        getattr(message, 'data', None), FileRegion) and len(message) < _MAX_BATCH_SIZE
+
 
 class StreamEngine(object):
 
-    def __init__(self, ctx, stream, recv_pipe, send_pipe, mailbox):
+    __slots__ = (
+        '_id', '_context', '_stream', '_recv_pipe', '_send_pipe', '_mailbox',
+        '_activate_recv_mail', '_activate_send_mail', '_background_sending',
+        '_background_receiving', '_closed', '_mmap_threshold', '_mmap_dir', '_addr',
+        '_backoff', '_new_socket', '_redial_timeout', '_heartbeat', '_heartbeat_timeout',
+        '_peeking', '_peeked', '_held_back', '_pinged', '_greeted')
+
+    def __init__(self, ctx, stream, recv_pipe, send_pipe, mailbox, mmap_threshold=None,
+                 mmap_dir=None, backoff=None, new_socket=None, heartbeat=None):
+        """Messages received above ``mmap_threshold`` bytes are collected in a temporary file in
+        ``mmap_dir`` and delivered as a memory map of it.
+
+        With a ``backoff``, a connecting engine whose peer is lost, or fails to connect, redials
+        it after the delays the backoff gives, on a socket from ``new_socket``. Its pipes are
+        kept meanwhile, but what was being written when the peer was lost is gone.
+
+        With a ``heartbeat``, a peer that is quiet while being read from is pinged, and the
+        engine fails with HeartbeatExpired once it stops answering.
+        """
         with _lock:
             self._id = next(_counter)
         self._context = ctx
@@ -42,8 +78,30 @@ class StreamEngine(object):
         self._recv_pipe = recv_pipe
         self._send_pipe = send_pipe
         self._mailbox = mailbox
+        self._mmap_threshold = mmap_threshold
+        self._mmap_dir = mmap_dir
+        self._addr = None
+        self._backoff = backoff
+        self._new_socket = new_socket
+        self._redial_timeout = None
+        self._heartbeat = heartbeat
+        self._heartbeat_timeout = None
+
+        # Activations are posted over and over, and coalesce while queued
+        self._activate_recv_mail = Mail(TYPE_ACTIVATE_RECV, self._id)
+        self._activate_send_mail = Mail(TYPE_ACTIVATE_SEND, self._id)
 
         self._background_sending = False
+        self._background_receiving = False
+        # While reading is paused, frames are still read up to the next message, which is kept
+        # for when reading resumes. Whether the peer was told it is held back, see BUSY, which
+        # only peers that ping are.
+        self._peeking = False
+        self._peeked = None
+        self._held_back = False
+        self._pinged = False
+        # Whether the first message was preceded by a ping
+        self._greeted = False
 
         self._closed = False
 
@@ -58,6 +116,7 @@ class StreamEngine(object):
             return
 
         self._closed = True
+        self._stop_heartbeat()
         self._stream.close()
         result = Mail(TYPE_CLOSED, self._id, None)
         self._mailbox.send(result)
@@ -71,9 +130,102 @@ class StreamEngine(object):
             return
 
         self._closed = True
+        self._stop_heartbeat()
         self._stream.close()
+        if self._backoff is not None and self._addr is not None:
+            self._mailbox.send(Mail(TYPE_DISCONNECTED, self._id))
+            self._redial_timeout = self._context.io_loop.set_timeout(
+                self._backoff.next(), self._redial)
+            return
+
         result = Mail(TYPE_ERROR, self._id, sys.exc_info())
-        self._mailbox.send(result)
+        # Messages read ahead before the error are still delivered. The peer is only reported
+        # lost once the reader got them all.
+        self._recv_pipe.when_empty(lambda: self._mailbox.send(result))
+
+    def _redial(self):
+        self._redial_timeout = None
+        self._stream = SocketStream(self._new_socket(), io_loop=self._context.io_loop)
+        self._closed = False
+        # Their loops ended with the lost stream
+        self._background_sending = self._background_receiving = self._peeking = False
+        self._peeked = None
+        self._held_back = self._pinged = self._greeted = False
+        self._attempt_connect(self._addr)
+
+    def _stop_redialing(self):
+        self._backoff = None
+        if self._redial_timeout is not None:
+            # Nothing queued is going to be sent
+            self._context.io_loop.clear_timeout(self._redial_timeout)
+            self._redial_timeout = None
+            self._mailbox.send(Mail(TYPE_CLOSED, self._id, None))
+
+    def _start_heartbeat(self):
+        if self._heartbeat is not None and self._heartbeat_timeout is None:
+            self._heartbeat_timeout = self._context.io_loop.set_timeout(
+                self._heartbeat.interval, self._on_heartbeat)
+
+    def _stop_heartbeat(self):
+        if self._heartbeat_timeout is not None:
+            self._context.io_loop.clear_timeout(self._heartbeat_timeout)
+            self._heartbeat_timeout = None
+
+    def _on_heartbeat(self):
+        self._heartbeat_timeout = None
+        if self._closed:
+            return
+        try:
+            # Only judged while reading, as a peer is not heard from otherwise, and while a ping
+            # can be written
+            ping = self._heartbeat.tick(
+                self._background_receiving or self._peeking,
+                self._background_sending or self._stream.writing)
+        except HeartbeatExpired:
+            self._error()
+            return
+        if ping:
+            self._beat(PING_FRAME)
+        self._start_heartbeat()
+
+    def _heard(self):
+        if self._heartbeat is not None:
+            self._heartbeat.heard = True
+
+    def _heard_frame(self):
+        if self._heartbeat is not None:
+            self._heartbeat.heard = True
+            self._heartbeat.busy = False
+
+    def _on_heartbeat_frame(self, body):
+        # Returns whether the control message in body was a heartbeat one, and handles it
+        if body == PING:
+            # Answered whether or not heartbeats are enabled here
+            self._pinged = True
+            self._beat(PONG_FRAME)
+        elif body == BUSY:
+            if self._heartbeat is not None:
+                self._heartbeat.busy = True
+        elif body != PONG:
+            return False
+        return True
+
+    def _beat(self, frame):
+        # Written straight to the stream between messages. While one is being sent, the peer
+        # hears from us anyway.
+        if self._background_sending or self._closed:
+            return
+        stream = self._stream
+
+        def on_done(f):
+            if stream is not self._stream:
+                return
+            try:
+                f.result()
+            except:
+                self._error()
+
+        stream.write(frame).add_done_callback(on_done)
 
     @coroutine
     def _connect(self, addr):
@@ -89,106 +241,287 @@ class StreamEngine(object):
         #     raise ProtocolError('Major version does not match')
 
     @coroutine
-    def _recv(self):
+    def _peek(self):
+        # Reads on while reading is paused, answering heartbeats, up to the next message.
+        # Returns the header of its first frame, or the message itself for a control message.
+        while 1:
+            header = yield self._stream.read_with_length(LEN_FRAME_HEADER)
+            flags, length = unpack(FMT_FRAME_HEADER, memoryview(header))
+            self._heard_frame()
+            if not flags & FLAG_CONTROL or flags & FLAG_STREAM:
+                raise Return(header)
+            body = yield self._read_body(length - LEN_FRAME_HEADER)
+            if not self._on_heartbeat_frame(body):
+                raise Return(Control(body))
+
+    @coroutine
+    def _recv(self, header=None):
+        """Receives the next message. ``header`` is the one of its first frame if already read,
+        see _peek().
+        """
         buf = []
+        size = 0
+        mapped = None
+        request_id = None
 
         while 1:
-            header = yield self._stream.read_with_length(LEN_FRAME_HEADER)
-            header = memoryview(header)
-            flags, length = unpack(FMT_FRAME_HEADER, header)
+            if header is None:
+                header = yield self._stream.read_with_length(LEN_FRAME_HEADER)
+                self._heard_frame()
+            flags, length = unpack(FMT_FRAME_HEADER, memoryview(header))
+            header = None
             length_remaining = length - LEN_FRAME_HEADER
             more = True if flags & FLAG_MORE else False
 
-            body = yield self._stream.read_with_length(length_remaining)
-            buf.append(body)
+            if flags & FLAG_STREAM:
+                # Delivered as it arrives
+                body = yield self._read_body(length_remaining)
+                if flags & FLAG_CONTROL:
+                    raise Return(Chunk(b'', False, aborted=True))
+                raise Return(Chunk(body, more))
+
+            if flags & FLAG_CONTROL:
+                body = yield self._read_body(length_remaining)
+                if self._on_heartbeat_frame(body):
+                    continue
+                raise Return(Control(body))
+
+            if flags & FLAG_ID:
+                extension = yield self._stream.read_with_length(LEN_ID)
+                request_id, = unpack(FMT_ID, extension)
+                length_remaining -= LEN_ID
+
+            body = yield self._read_body(length_remaining)
+            if mapped is not None:
+                mapped.append(body)
+            else:
+                buf.append(body)
+                size += len(body)
+                if self._mmap_threshold is not None and size > self._mmap_threshold:
+                    # Move what came so far to the file. Only one frame is on the heap from now.
+                    mapped = MappedWriter(self._mmap_dir)
+                    for body in buf:
+                        mapped.append(body)
+                    buf = []
 
             if not more:
                 break
 
-        raise Return(''.join(buf))
+        data = mapped.finish() if mapped is not None else ''.join(buf)
+        if request_id is not None:
+            raise Return(Envelope(request_id, data))
+        raise Return(data)
+
+    def _read_body(self, length):
+        if not length:
+            # Empty messages take a frame of just the header
+            future = Future()
+            future.set_result(b'')
+            return future
+        return self._stream.read_with_length(length)
 
     @coroutine
     def _send(self, data):
-        for chunk in generate_payload_frame(data):
+        for chunk in generate_frames(data):
             yield self._stream.write(chunk)
 
     def _attempt_connect(self, addr):
+        stream = self._stream
 
         def on_done(f):
+            if stream is not self._stream:
+                # Lost and redialed since
+                return
             try:
                 f.result()
-                result = Mail(TYPE_CONNECT_SUCCESS)
+                result = Mail(TYPE_CONNECT_SUCCESS, self._id)
                 self._mailbox.send(result)
             except:
                 self._error()
-
+                return
+            if self._backoff is not None:
+                self._backoff.reset()
+                # Resume what the lost stream was doing. Reading goes on anyway, replies and
+                # credit grants only come for what was sent.
+                self._attempt_recv()
+                self._attempt_send()
+
+        self._addr = addr
         future = self._connect(addr)
         future.add_done_callback(on_done)
 
     def _attempt_recv(self):
+        stream = self._stream
+
+        def deliver(message):
+            if not self._recv_pipe.deliver(message):
+                self._mailbox.send(self._activate_recv_mail)
+
+        def recv_next():
+            # Read ahead until the pipe is full. The socket is then left unread, so the
+            # kernel's TCP window pushes back on the sender, until the reader drains the pipe
+            # and resumes us.
+            while 1:
+                if not self._recv_pipe.wait_writable(self.activate_recv):
+                    self._background_receiving = False
+                    self._attempt_peek()
+                    return
+                if self._held_back:
+                    # Any frame tells the peer we caught up
+                    self._held_back = False
+                    self._beat(PONG_FRAME)
+                peeked, self._peeked = self._peeked, None
+                if isinstance(peeked, Control):
+                    deliver(peeked)
+                    continue
+                future = self._recv(peeked)
+                if not future.done:
+                    future.add_done_callback(on_done)
+                    return
+                deliver(future.result())
 
         def on_done(f):
+            if stream is not self._stream:
+                return
             try:
-                working = self._recv_pipe.write(f.result())
-                if not working:
-                    self._mailbox.send(Mail(TYPE_ACTIVATE_RECV, self._id))
+                deliver(f.result())
+                recv_next()
             except:
                 self._error()
 
-        future = self._recv()
-        if future.done:
-            on_done(future)
-        else:
-            future.add_done_callback(on_done)
+        if self._background_receiving or self._peeking or self._closed:
+            # Already running. A peek resumes reading once done.
+            return
 
-    def _attempt_send(self):
+        self._start_heartbeat()
+        self._background_receiving = True
+        try:
+            recv_next()
+        except:
+            self._error()
+
+    def _attempt_peek(self):
+        if self._peeking or self._peeked is not None or self._closed:
+            return
+        stream = self._stream
 
         def on_done(f):
+            if stream is not self._stream:
+                return
+            self._peeking = False
             try:
-                f.result()
+                self._peeked = f.result()
+            except:
+                self._error()
+                return
+            if self._pinged and not self._held_back:
+                # Pings behind the message can not be answered until the user catches up
+                self._held_back = True
+                self._beat(BUSY_FRAME)
+            self._attempt_recv()
+
+        self._peeking = True
+        self._peek().add_done_callback(on_done)
+
+    def _read_batch(self):
+        # Small messages queued back to back are framed together and written at once
+        front, lwm_reached = self._send_pipe.read()
+        if not _batchable(front):
+            return front, lwm_reached
+
+        batch = [front]
+        size = len(front)
+        while size < _MAX_BATCH_SIZE:
+            try:
+                following = self._send_pipe.front()
+            except Again:
+                break
+            if not _batchable(following) or size + len(following) > _MAX_BATCH_SIZE:
+                break
+            data, reached = self._send_pipe.read()
+            lwm_reached |= reached
+            batch.append(data)
+            size += len(data)
+        return batch, lwm_reached
 
+    def _attempt_send(self):
+        stream = self._stream
+
+        def send_next():
+            # Loop as long as writes complete right away. Chaining them through callbacks would
+            # recurse once per queued message.
+            while 1:
                 try:
-                    front, lwm_reached = self._send_pipe.read()
-                    if isinstance(front, Done):
-                        self._close()
-                        return
-                    if lwm_reached:
-                        # If low watermark reached, activate peer
-                        self._mailbox.send(Mail(TYPE_ACTIVATE_SEND, self._id))
-                    future = self._send(front)
-                    future.add_done_callback(on_done)
+                    front, lwm_reached = self._read_batch()
                 except Again:
                     # Queue empty. Pause.
                     self._background_sending = False
+                    return
+                if isinstance(front, Done):
+                    self._close()
+                    return
+                if lwm_reached:
+                    # If low watermark reached, activate peer
+                    self.post_activate_send()
+                if self._heartbeat is not None and not self._greeted:
+                    # Pinged before the first message, so the peer knows to tell us once it
+                    # holds back what follows, see BUSY
+                    self._greeted = True
+                    self._stream.write(PING_FRAME)
+                if isinstance(front, list):
+                    future = self._stream.write(
+                        b''.join(chunk for data in front for chunk in generate_frames(data)))
+                else:
+                    future = self._send(front)
+                if not future.done:
+                    future.add_done_callback(on_done)
+                    return
+                future.result()
+                # The peer taking writes is alive, however slowly it reads
+                self._heard()
+
+        def on_done(f):
+            if stream is not self._stream:
+                return
+            try:
+                f.result()
+                self._heard()
+                send_next()
             except:
                 self._error()
 
-        if self._background_sending:
-            # Already running
+        if self._background_sending or self._redial_timeout is not None:
+            # Already running, or waiting to redial
             return
 
-        # Trigger once
+        self._background_sending = True
         try:
-            front, lwm_reached = self._send_pipe.read()
-            if isinstance(front, Done):
-                self._close()
-                return
-            if lwm_reached:
-                # If low watermark reached, activate peer
-                self._mailbox.send(Mail(TYPE_ACTIVATE_SEND, self._id))
-            self._background_sending = True
-            future = self._send(front)
-            future.add_done_callback(on_done)
-        except Again:
-            pass
+            send_next()
+        except:
+            self._error()
 
     @property
     def id(self):
         return self._id
 
+    def set_send_pipe(self, send_pipe):
+        """Gives an engine created without a send pipe one. Call before activating send."""
+        self._send_pipe = send_pipe
+
+    def post_activate_send(self):
+        """Tells the connection that the send pipe can take messages again."""
+        self._mailbox.send(self._activate_send_mail)
+
     def activate_connect(self, addr):
         self._context.run_in_background(self._attempt_connect, addr)
 
+    def stop_redialing(self):
+        """Lets the peer go for good once lost, and right away if it is already. Call when
+        closing.
+        """
+        if self._backoff is not None:
+            self._context.run_in_background(self._stop_redialing)
+
     def activate_send(self):
         self._context.run_in_background(self._attempt_send)
 
@@ -0,0 +1,154 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+
+from ring.connection_impl import ConnectionImpl, Again, Done
+from ring.constants import TYPE_FINALIZE
+from ring.events import Mail
+from ring.pipes import create_pipes
+from ring.protocol import Control
+from ring.publisher import SUBSCRIBE, UNSUBSCRIBE
+from ring.stream import SocketStream
+from ring.stream_engine import StreamEngine
+
+
+class SubscriberConnectionImpl(ConnectionImpl):
+    """Receives the messages of one or more publishers that start with subscribed prefixes.
+
+    Subscriptions are sent upstream as control messages, and replayed to publishers connected
+    later.
+    """
+
+    def __init__(self, socket, ctx, mailbox, options=None):
+        super(SubscriberConnectionImpl, self).__init__(socket, ctx, mailbox, options)
+        self._peers = {}
+        self._recv_queue = collections.deque()
+        # Prefix -> number of times subscribed
+        self._subscriptions = collections.Counter()
+        self._closing = False
+
+    def close(self):
+        super(SubscriberConnectionImpl, self).close()
+        self._closing = True
+
+        if not self._peers:
+            # If there's no peer at all, trigger finalize immediately
+            self._mailbox.send(Mail(TYPE_FINALIZE))
+            return
+
+        for engine, stream, recv_pipe, send_pipe in self._peers.itervalues():
+            if not send_pipe.write(Done()):
+                engine.activate_send()
+
+    def connect(self, addr):
+        if self._peers:
+            # The first peer takes the connection's socket, the others get their own
+            so = self._connecting_socket()
+        else:
+            so = self._socket
+
+        stream = SocketStream(so, io_loop=self._context.io_loop)
+        recv_pipe, send_pipe = create_pipes(self._options, self._budget, self._stats)
+        engine = StreamEngine(
+            self._context, stream, recv_pipe, send_pipe, self._mailbox, **self._recv_options())
+        self._peers[engine.id] = (engine, stream, recv_pipe, send_pipe)
+
+        engine.activate_connect(addr)
+        for prefix, count in self._subscriptions.iteritems():
+            for _ in xrange(count):
+                send_pipe.write(Control(SUBSCRIBE + prefix), force=True)
+        if self._subscriptions:
+            engine.activate_send()
+        engine.activate_recv()
+
+    def _post(self, control):
+        for engine, x, y, send_pipe in self._peers.itervalues():
+            # Subscriptions are tiny and must not get lost
+            if not send_pipe.write(control, force=True):
+                engine.activate_send()
+
+    def subscribe(self, prefix):
+        self._subscriptions[prefix] += 1
+        self._post(Control(SUBSCRIBE + prefix))
+
+    def unsubscribe(self, prefix):
+        if self._subscriptions[prefix] == 0:
+            return
+        self._subscriptions[prefix] -= 1
+        if self._subscriptions[prefix] == 0:
+            del self._subscriptions[prefix]
+        self._post(Control(UNSUBSCRIBE + prefix))
+
+    def send(self, data):
+        raise NotImplementedError('Subscriber does not send')
+
+    def recv(self):
+        if len(self._recv_queue) == 0:
+            raise Again
+
+        engine_id = self._recv_queue[0]
+        engine, x, recv_pipe, y = self._peers[engine_id]
+        assert recv_pipe.read_available()
+        read = recv_pipe.read()[0]
+
+        if not recv_pipe.read_available():
+            self._recv_queue.popleft()
+            engine.activate_recv()
+
+        return read
+
+    def recv_many(self, max_count):
+        result = []
+        while len(result) < max_count and self._recv_queue:
+            engine_id = self._recv_queue[0]
+            engine, x, recv_pipe, y = self._peers[engine_id]
+            result.extend(recv_pipe.read_many(max_count - len(result))[0])
+
+            if not recv_pipe.read_available():
+                self._recv_queue.popleft()
+                engine.activate_recv()
+
+        if not result:
+            raise Again
+        return result
+
+    def recv_available(self):
+        return len(self._recv_queue) != 0
+
+    def send_available(self):
+        return False
+
+    def activate_send(self, engine_id):
+        pass
+
+    def activate_recv(self, engine_id):
+        if engine_id in self._peers:
+            self._recv_queue.append(engine_id)
+
+    def connection_close(self, engine_id, err):
+        # Only the failed publisher is dropped
+        x, y, recv_pipe, send_pipe = self._peers.pop(engine_id)
+        while engine_id in self._recv_queue:
+            self._recv_queue.remove(engine_id)
+        recv_pipe.clear()
+        send_pipe.clear()
+
+        if not self._peers:
+            self._mailbox.send(Mail(TYPE_FINALIZE))
+            return False
+        return True
+
+    def connection_finalize(self):
+        self._peers = self._recv_queue = None
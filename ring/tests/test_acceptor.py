@@ -0,0 +1,135 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import errno
+import socket
+import time
+import unittest
+
+from ring.connection import BACKLOG, MAX_CONNECTIONS, PEER_WEIGHT, PULLER
+from ring.context import Context
+from ring.protocol import generate_payload_frame
+from ring.tests.utils import blocking_send
+
+
+class _ExhaustedSocket(object):
+    # Fails the first accept as if out of file descriptors
+
+    def __init__(self, sock):
+        self._socket = sock
+        self._failed = False
+
+    def __getattr__(self, name):
+        return getattr(self._socket, name)
+
+    def accept(self):
+        if not self._failed:
+            self._failed = True
+            raise socket.error(errno.EMFILE, 'Too many open files')
+        return self._socket.accept()
+
+
+class TestAcceptor(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+        self._clients = []
+
+    def tearDown(self):
+        for client in self._clients:
+            client.close()
+        self._ctx.stop()
+
+    def _client(self, port, data=None):
+        client = socket.socket()
+        client.connect(('localhost', port))
+        if data is not None:
+            for frame in generate_payload_frame(data):
+                blocking_send(client, frame)
+        self._clients.append(client)
+        return client
+
+    def test_accept_storm(self):
+        connection = self._ctx.connection(PULLER)
+        connection.setsockopt(BACKLOG, 512)
+        connection.bind(('', 0))
+        port = connection.getsockname()[1]
+
+        for _ in xrange(300):
+            self._client(port)
+
+        deadline = time.time() + 5
+        while connection.stats().get('accepted', 0) < 300:
+            self.assertTrue(time.time() < deadline)
+            time.sleep(0.01)
+        self.assertEqual(len(connection.peer_stats()), 300)
+        connection.close()
+
+    def test_max_connections(self):
+        connection = self._ctx.connection(PULLER)
+        connection.setsockopt(MAX_CONNECTIONS, 2)
+        connection.bind(('', 0))
+        port = connection.getsockname()[1]
+
+        first = self._client(port, 'first')
+        self._client(port, 'second')
+        # Waits in the listen queue
+        self._client(port, 'third')
+
+        self.assertEqual(sorted(connection.recv() for _ in xrange(2)), ['first', 'second'])
+        self.assertEqual(connection.recv_many(1, timeout=0.2), [])
+        stats = connection.stats()
+        self.assertEqual(stats['accepted'], 2)
+        self.assertEqual(stats['accept_paused'], 1)
+
+        # Accepting resumes once a peer goes
+        first.close()
+        self.assertEqual(connection.recv(), 'third')
+        self.assertEqual(connection.stats()['accepted'], 3)
+        connection.close()
+
+    def test_retry_without_file_descriptors(self):
+        connection = self._ctx.connection(PULLER)
+        connection.bind(('', 0))
+        connection._impl._socket = _ExhaustedSocket(connection._impl._socket)
+
+        # No peer goes, accepting resumes all the same
+        self._client(connection.getsockname()[1], 'a')
+        self.assertEqual(connection.recv_many(1, timeout=5), ['a'])
+        stats = connection.stats()
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['accept_paused'], 1)
+        connection.close()
+
+    def test_invalid_weight_rejected(self):
+        connection = self._ctx.connection(PULLER)
+        connection.setsockopt(PEER_WEIGHT, lambda address: 0)
+        connection.bind(('', 0))
+        port = connection.getsockname()[1]
+
+        client = self._client(port)
+        # Closed on our side
+        client.settimeout(5)
+        self.assertEqual(client.recv(1), b'')
+        self.assertEqual(connection.stats()['rejected'], 1)
+
+        # Accepting goes on
+        connection.setsockopt(PEER_WEIGHT, lambda address: 1)
+        self._client(port, 'a')
+        self.assertEqual(connection.recv(), 'a')
+        connection.close()
+
+if __name__ == '__main__':
+    unittest.main()
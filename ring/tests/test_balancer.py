@@ -0,0 +1,65 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from ring.balancer import (
+    LeastOutstandingBalancer, P2CEWMABalancer, RoundRobinBalancer, create_balancer
+)
+from ring.options import BALANCE_P2C_EWMA
+
+
+class TestBalancer(unittest.TestCase):
+
+    def _create(self, balancer_class, peers):
+        balancer = balancer_class()
+        for peer_id in peers:
+            balancer.add(peer_id)
+        return balancer
+
+    def test_round_robin(self):
+        balancer = self._create(RoundRobinBalancer, [1, 2, 3])
+        self.assertEqual([balancer.choose([1, 2, 3]) for _ in xrange(6)], [1, 2, 3, 1, 2, 3])
+
+    def test_least_outstanding(self):
+        balancer = self._create(LeastOutstandingBalancer, [1, 2, 3])
+        balancer.on_sent(1)
+        balancer.on_sent(1)
+        balancer.on_sent(2)
+        self.assertEqual(balancer.choose([1, 2, 3]), 3)
+        balancer.on_sent(3)
+        self.assertEqual(balancer.choose([1, 2, 3]), 2)
+        self.assertEqual(balancer.choose([1]), 1)
+
+    def test_p2c_ewma_prefers_faster_peer(self):
+        balancer = self._create(P2CEWMABalancer, [1, 2])
+        balancer.on_sent(1)
+        balancer.on_reply(1, 0.5)
+        balancer.on_sent(2)
+        balancer.on_reply(2, 0.01)
+        self.assertEqual([balancer.choose([1, 2]) for _ in xrange(10)], [2] * 10)
+
+        for _ in xrange(20):
+            balancer.on_sent(2)
+            balancer.on_reply(2, 1.0)
+        self.assertTrue(balancer.latency(2) > balancer.latency(1))
+        self.assertEqual(balancer.choose([1, 2]), 1)
+
+    def test_create_balancer(self):
+        self.assertTrue(isinstance(create_balancer(BALANCE_P2C_EWMA), P2CEWMABalancer))
+        self.assertTrue(isinstance(create_balancer(RoundRobinBalancer), RoundRobinBalancer))
+
+if __name__ == '__main__':
+    unittest.main()
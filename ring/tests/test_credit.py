@@ -0,0 +1,91 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import time
+import unittest
+
+from ring.connection import CREDIT, NONBLOCK, PULLER, PUSHER
+from ring.connection_impl import Again
+from ring.context import Context
+from ring.credit import UNLIMITED, Credit, Window, parse_grant
+
+
+class TestWindow(unittest.TestCase):
+
+    def test_grants_at_half_window(self):
+        window = Window(4, None)
+        self.assertEqual(parse_grant(window.initial_grant()), (4, UNLIMITED))
+        self.assertEqual(window.consume(10), None)
+        self.assertEqual(parse_grant(window.consume(10)), (2, UNLIMITED))
+        self.assertEqual(window.consume(10), None)
+
+    def test_bytes(self):
+        window = Window(None, 100)
+        self.assertEqual(window.consume(30), None)
+        self.assertEqual(parse_grant(window.consume(30)), (UNLIMITED, 60))
+
+    def test_credit(self):
+        credit = Credit()
+        self.assertTrue(credit.available())
+        credit.take(10)
+
+        credit.grant(UNLIMITED, 15)
+        credit.take(10)
+        self.assertTrue(credit.available())
+        # A message larger than what is left still goes, the debt is paid by later grants
+        credit.take(10)
+        self.assertFalse(credit.available())
+        credit.grant(UNLIMITED, 10)
+        self.assertEqual(credit.bytes, 5)
+        self.assertEqual(credit.messages, None)
+
+
+class TestCreditFlow(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+
+    def tearDown(self):
+        self._ctx.stop()
+
+    def test_pusher_waits_for_credit(self):
+        puller = self._ctx.connection(PULLER)
+        puller.setsockopt(CREDIT, 2)
+        puller.bind(('', 0))
+
+        pusher = self._ctx.connection(PUSHER)
+        pusher.connect(('localhost', puller.getsockname()[1]))
+
+        deadline = time.time() + 5
+        while pusher.peer_stats()[0]['credit'] is None:
+            self.assertTrue(time.time() < deadline)
+            pusher._process_commands(0.01)
+
+        pusher.send('a', NONBLOCK)
+        pusher.send('b', NONBLOCK)
+        self.assertRaises(Again, pusher.send, 'c', NONBLOCK)
+        self.assertEqual(pusher.peer_stats()[0]['credit'], 0)
+
+        # Receiving grants the pusher credit again
+        self.assertEqual(puller.recv(), 'a')
+        pusher.send('c')
+        self.assertEqual(puller.recv(), 'b')
+        self.assertEqual(puller.recv(), 'c')
+
+        pusher.close()
+        puller.close()
+
+if __name__ == '__main__':
+    unittest.main()
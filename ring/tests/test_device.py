@@ -0,0 +1,61 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from ring.connection import PULLER, PUSHER, SNDHWM
+from ring.context import Context
+from ring.device import proxy
+
+
+class TestProxy(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+
+    def tearDown(self):
+        self._ctx.stop()
+
+    def _test_forward(self, message, count, hwm=None):
+        frontend = self._ctx.connection(PULLER)
+        frontend.bind(('', 0))
+        sink = self._ctx.connection(PULLER)
+        sink.bind(('', 0))
+
+        backend = self._ctx.connection(PUSHER)
+        backend.setsockopt(SNDHWM, hwm)
+        backend.connect(('localhost', sink.getsockname()[1]))
+        device = proxy(frontend, backend)
+
+        source = self._ctx.connection(PUSHER)
+        source.connect(('localhost', frontend.getsockname()[1]))
+        for i in xrange(count):
+            source.send('%d:%s' % (i, message))
+
+        for i in xrange(count):
+            self.assertEqual(sink.recv(), '%d:%s' % (i, message))
+
+        device.stop()
+        for connection in (source, frontend, backend, sink):
+            connection.close()
+
+    def test_forward(self):
+        self._test_forward('a' * 10, 1000)
+
+    def test_forward_with_backend_watermark(self):
+        self._test_forward('a' * 1024 * 1024, 50, hwm=1)
+
+if __name__ == '__main__':
+    unittest.main()
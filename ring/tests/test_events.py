@@ -0,0 +1,46 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from ring import Again
+from ring.events import Mail, Mailbox
+
+
+class TestMailbox(unittest.TestCase):
+
+    def setUp(self):
+        self._mailbox = Mailbox()
+
+    def tearDown(self):
+        self._mailbox.close()
+
+    def test_coalesce_pending_mail(self):
+        first = Mail(1, 'a')
+        second = Mail(2, 'b')
+        self._mailbox.send(first)
+        self._mailbox.send(second)
+        self._mailbox.send(first)
+
+        self.assertTrue(self._mailbox.recv(0) is first)
+        self.assertTrue(self._mailbox.recv(0) is second)
+        self.assertRaises(Again, self._mailbox.recv, 0)
+
+        # Once received, the same mail can be posted again
+        self._mailbox.send(first)
+        self.assertTrue(self._mailbox.recv(0) is first)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import errno
+import socket
+import time
+import unittest
+from struct import unpack
+
+from ring.connection import (
+    HEARTBEAT_IVL, HEARTBEAT_LIVENESS, PULLER, PUSHER, RCVHWM, REQUESTER, RequestFailed
+)
+from ring.context import Context
+from ring.heartbeat import PING, Heartbeat, HeartbeatExpired
+from ring.protocol import FLAG_CONTROL, FMT_FRAME_HEADER, LEN_FRAME_HEADER
+from ring.tests.utils import blocking_recv
+
+
+def _read_frame(conn):
+    flags, length = unpack(FMT_FRAME_HEADER, blocking_recv(conn, LEN_FRAME_HEADER))
+    return flags, blocking_recv(conn, length - LEN_FRAME_HEADER)
+
+
+class TestHeartbeat(unittest.TestCase):
+
+    def test_pings_quiet_peer(self):
+        heartbeat = Heartbeat(1, 2)
+        heartbeat.heard = True
+        self.assertFalse(heartbeat.tick(True))
+        self.assertTrue(heartbeat.tick(True))
+        self.assertTrue(heartbeat.tick(True))
+        self.assertRaises(HeartbeatExpired, heartbeat.tick, True)
+
+    def test_answer_resets(self):
+        heartbeat = Heartbeat(1, 2)
+        self.assertTrue(heartbeat.tick(True))
+        self.assertTrue(heartbeat.tick(True))
+        heartbeat.heard = True
+        self.assertFalse(heartbeat.tick(True))
+        self.assertTrue(heartbeat.tick(True))
+        # Not reading, so nothing is heard either
+        self.assertFalse(heartbeat.tick(False))
+        self.assertTrue(heartbeat.tick(True))
+
+    def test_blocked_writes_do_not_count(self):
+        heartbeat = Heartbeat(1, 1)
+        self.assertTrue(heartbeat.tick(True))
+        # The ping could not be written, so the peer is not expected to answer
+        for _ in range(3):
+            self.assertFalse(heartbeat.tick(True, True))
+        self.assertRaises(HeartbeatExpired, heartbeat.tick, True)
+
+    def test_expired_is_a_timeout(self):
+        self.assertEqual(HeartbeatExpired().errno, errno.ETIMEDOUT)
+
+
+class TestDeadPeers(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+        self._ctx.setsockopt(HEARTBEAT_IVL, 0.05)
+        self._ctx.setsockopt(HEARTBEAT_LIVENESS, 2)
+
+    def tearDown(self):
+        self._ctx.stop()
+
+    def _wait_until(self, predicate, connection):
+        deadline = time.time() + 5
+        while not predicate():
+            self.assertTrue(time.time() < deadline, 'Timed out')
+            connection._process_commands(0)
+            time.sleep(0.01)
+
+    def test_puller_drops_silent_peer(self):
+        puller = self._ctx.connection(PULLER)
+        puller.bind(('', 0))
+        # Connects, then neither sends nor answers, like a host gone without a word
+        client = socket.create_connection(('localhost', puller.getsockname()[1]))
+        self._wait_until(lambda: len(puller.peer_stats()) == 1, puller)
+
+        flags, body = _read_frame(client)
+        self.assertTrue(flags & FLAG_CONTROL)
+        self.assertEqual(body, PING)
+        self._wait_until(lambda: len(puller.peer_stats()) == 0, puller)
+        puller.close()
+        client.close()
+
+    def test_quiet_peer_answers(self):
+        puller = self._ctx.connection(PULLER)
+        puller.bind(('', 0))
+        # Heartbeats are answered even where they are disabled
+        ctx = Context()
+        pusher = ctx.connection(PUSHER)
+        pusher.connect(('localhost', puller.getsockname()[1]))
+        self._wait_until(lambda: len(puller.peer_stats()) == 1, puller)
+
+        time.sleep(0.5)
+        pusher.send(b'still there')
+        self.assertEqual(puller.recv(), b'still there')
+        self.assertEqual(len(puller.peer_stats()), 1)
+        pusher.close()
+        puller.close()
+        ctx.stop()
+
+    def test_slow_puller_kept(self):
+        # Heartbeats on the pusher only, facing a puller that stops reading
+        ctx = Context()
+        puller = ctx.connection(PULLER)
+        puller.setsockopt(RCVHWM, 2)
+        puller.bind(('', 0))
+        pusher = self._ctx.connection(PUSHER)
+        pusher.connect(('localhost', puller.getsockname()[1]))
+
+        message = b'a' * 64 * 1024
+        for _ in xrange(400):
+            pusher.send(message)
+        # Writes block on the full socket buffers meanwhile
+        time.sleep(1)
+        for _ in xrange(400):
+            self.assertEqual(puller.recv(timeout=5), message)
+        self.assertTrue(pusher.peer_stats()[0]['connected'])
+        pusher.close()
+        puller.close()
+        ctx.stop()
+
+    def _check_idle_pusher_kept(self, count):
+        # Heartbeats on the pusher only, facing a puller whose user is busy with a message
+        ctx = Context()
+        puller = ctx.connection(PULLER)
+        puller.bind(('', 0))
+        pusher = self._ctx.connection(PUSHER)
+        pusher.connect(('localhost', puller.getsockname()[1]))
+
+        for i in xrange(count):
+            pusher.send(b'%d' % i)
+        time.sleep(1)
+        pusher._process_commands(0)
+        self.assertEqual(len(pusher.peer_stats()), 1)
+        for i in xrange(count):
+            self.assertEqual(puller.recv(timeout=5), b'%d' % i)
+        pusher.send(b'more')
+        self.assertEqual(puller.recv(timeout=5), b'more')
+        pusher.close()
+        puller.close()
+        ctx.stop()
+
+    def test_idle_pusher_kept(self):
+        # The queued message pauses reading, pings are still answered
+        self._check_idle_pusher_kept(1)
+
+    def test_idle_pusher_kept_behind_messages(self):
+        # Pings queue behind the messages held back, the puller says it is busy instead
+        self._check_idle_pusher_kept(3)
+
+    def test_requester_fails_on_silent_replier(self):
+        server_socket = socket.socket()
+        server_socket.bind(('', 0))
+        server_socket.listen(128)
+        requester = self._ctx.connection(REQUESTER)
+        requester.connect(('localhost', server_socket.getsockname()[1]))
+        conn, addr = server_socket.accept()
+        conn.setblocking(1)
+
+        requester.send(b'request')
+        # Greeted with a ping first
+        self.assertEqual(_read_frame(conn)[1], PING)
+        self.assertEqual(_read_frame(conn)[1], b'request')
+        # Never replies
+        self.assertRaises(RequestFailed, requester.recv)
+        conn.close()
+        server_socket.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+
+from ring.connection import (
+    MMAP_THRESHOLD, PIPELINE, PULLER, PUSHER, REPLIER, REQUESTER, SPILL_DIR
+)
+from ring.context import Context
+
+
+class TestMappedMessages(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+        self._dir = tempfile.mkdtemp(prefix='ring-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+        self._ctx.stop()
+
+    def test_large_messages_mapped(self):
+        puller = self._ctx.connection(PULLER)
+        puller.setsockopt(MMAP_THRESHOLD, 200 * 1024)
+        puller.setsockopt(SPILL_DIR, self._dir)
+        puller.bind(('', 0))
+        pusher = self._ctx.connection(PUSHER)
+        pusher.connect(('localhost', puller.getsockname()[1]))
+
+        large = os.urandom(1024 * 1024 + 3)
+        pusher.send(large)
+        pusher.send(b'small')
+        pusher.send_pyobj(large)
+
+        received = puller.recv()
+        self.assertTrue(isinstance(received, mmap.mmap))
+        self.assertEqual(len(received), len(large))
+        self.assertEqual(received[:], large)
+        self.assertEqual(puller.recv(), b'small')
+        self.assertEqual(puller.recv_pyobj(), large)
+        # The file is unlinked while mapped
+        self.assertEqual(os.listdir(self._dir), [])
+        received.close()
+
+        pusher.close()
+        puller.close()
+
+    def test_pipelined_request(self):
+        replier = self._ctx.connection(REPLIER)
+        replier.setsockopt(MMAP_THRESHOLD, 1024)
+        replier.bind(('', 0))
+        requester = self._ctx.connection(REQUESTER)
+        requester.setsockopt(PIPELINE, True)
+        requester.setsockopt(MMAP_THRESHOLD, 1024)
+        requester.connect(('localhost', replier.getsockname()[1]))
+
+        request = b'a' * 300 * 1024
+        request_id = requester.send(request)
+        received = replier.recv()
+        self.assertEqual(received[:], request)
+        replier.send(received[:10])
+        # Below the threshold
+        self.assertEqual(requester.recv(), (request_id, b'a' * 10))
+        requester.close()
+        replier.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,234 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from ring.budget import MemoryBudget
+from ring.connection_impl import Again, Done
+from ring.options import OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST
+from ring.pipes import Pipe, SpillPipe
+from ring.protocol import Chunk, Control
+
+
+class TestPipe(unittest.TestCase):
+
+    def test_byte_watermarks(self):
+        pipe = Pipe(hwm_bytes=100)
+        pipe.write('a' * 60)
+        pipe.write('a' * 60)
+        self.assertFalse(pipe.write_available())
+        self.assertRaises(Again, pipe.write, 'a')
+
+        # Done always goes through
+        pipe.write(Done())
+
+        self.assertEqual(pipe.read(), ('a' * 60, False))
+        # 60 bytes left, still above the 50 bytes low watermark
+        self.assertTrue(pipe.write_available())
+        self.assertEqual(pipe.read(), ('a' * 60, True))
+        self.assertEqual(pipe.bytes, 0)
+
+    def test_forced_write_ignores_watermarks(self):
+        pipe = Pipe(hwm_bytes=10)
+        pipe.write('a' * 20)
+        pipe.write('a' * 20, force=True)
+        self.assertEqual(pipe.bytes, 40)
+
+    def test_clear_releases_budget(self):
+        budget = MemoryBudget()
+        pipe = Pipe(budget=budget)
+        pipe.write('a' * 10)
+        pipe.write('a' * 10)
+        self.assertEqual(budget.usage, 20)
+        pipe.clear()
+        self.assertEqual(budget.usage, 0)
+
+    def test_wait_writable(self):
+        resumed = []
+        pipe = Pipe(hwm=2)
+        for i in xrange(3):
+            self.assertTrue(pipe.wait_writable(lambda: resumed.append(True)))
+            pipe.write(str(i), force=True)
+        self.assertFalse(pipe.wait_writable(lambda: resumed.append(True)))
+
+        # Resumed at the low watermark, not as soon as the high one is cleared
+        pipe.read()
+        self.assertEqual(resumed, [])
+        pipe.read()
+        self.assertEqual(resumed, [True])
+        self.assertTrue(pipe.wait_writable(lambda: resumed.append(True)))
+
+    def test_wait_writable_without_watermarks(self):
+        resumed = []
+        # A budget without a limit does not bound the pipe either
+        pipe = Pipe(budget=MemoryBudget())
+        self.assertTrue(pipe.wait_writable(lambda: resumed.append(True)))
+        pipe.write('0', force=True)
+        self.assertFalse(pipe.wait_writable(lambda: resumed.append(True)))
+        pipe.read()
+        self.assertEqual(resumed, [True])
+
+    def test_when_empty(self):
+        emptied = []
+        pipe = Pipe()
+        pipe.write('a')
+        pipe.when_empty(lambda: emptied.append(True))
+        self.assertEqual(emptied, [])
+        pipe.read()
+        self.assertEqual(emptied, [True])
+        pipe.when_empty(lambda: emptied.append(True))
+        self.assertEqual(emptied, [True, True])
+
+    def test_drop_newest(self):
+        pipe = Pipe(hwm=1, overflow=OVERFLOW_DROP_NEWEST)
+        for i in xrange(4):
+            pipe.write(str(i))
+        self.assertEqual(pipe.read()[0], '0')
+        self.assertEqual(pipe.read()[0], '1')
+        self.assertRaises(Again, pipe.read)
+        self.assertEqual(pipe._stats['dropped_newest'], 2)
+
+    def test_drop_oldest(self):
+        pipe = Pipe(hwm=1, overflow=OVERFLOW_DROP_OLDEST)
+        for i in xrange(4):
+            pipe.write(str(i))
+        self.assertEqual(pipe.read()[0], '2')
+        self.assertEqual(pipe.read()[0], '3')
+        self.assertRaises(Again, pipe.read)
+        self.assertEqual(pipe._stats['dropped_oldest'], 2)
+
+    def test_drop_keeps_forced_and_control(self):
+        for overflow in (OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST):
+            pipe = Pipe(hwm=1, overflow=overflow)
+            for i in xrange(3):
+                pipe.write(Control(str(i)))
+            pipe.write('forced', force=True)
+            read = [pipe.read()[0] for _ in xrange(4)]
+            self.assertEqual([control.data for control in read[:3]], ['0', '1', '2'])
+            self.assertEqual(read[3], 'forced')
+
+    def test_drop_keeps_chunks(self):
+        for overflow in (OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST):
+            pipe = Pipe(hwm=0, overflow=overflow)
+            pipe.write(Chunk('a', True))
+            self.assertRaises(Again, pipe.write, Chunk('b', True))
+            pipe.deliver(Chunk('b', False))
+            self.assertEqual([pipe.read()[0].data for _ in xrange(2)], ['a', 'b'])
+
+    def test_deliver_drops(self):
+        pipe = Pipe(hwm=1, overflow=OVERFLOW_DROP_NEWEST)
+        for i in xrange(3):
+            pipe.deliver(str(i))
+        self.assertEqual(pipe._stats['dropped_newest'], 1)
+
+    def test_drop_oldest_keeps_done(self):
+        pipe = Pipe(hwm_bytes=0, overflow=OVERFLOW_DROP_OLDEST)
+        pipe.write(Done())
+        pipe.write('a')
+        pipe.write('b')
+        self.assertTrue(isinstance(pipe.read()[0], Done))
+        self.assertEqual(pipe.read()[0], 'a')
+        self.assertEqual(pipe._stats['dropped_newest'], 1)
+
+
+class TestSpillPipe(unittest.TestCase):
+
+    def test_spill_keeps_order(self):
+        budget = MemoryBudget()
+        pipe = SpillPipe(100, budget=budget)
+        for i in xrange(10):
+            pipe.write('%02d' % i * 20)
+        self.assertEqual(pipe._stats['spilled'], 8)
+        self.assertEqual(budget.usage, 80)
+
+        # Memory has room again, but these still queue up behind the spilled ones
+        pipe.read()
+        pipe.write('x')
+        self.assertEqual(pipe._stats['spilled'], 8)
+
+        for i in xrange(1, 10):
+            self.assertEqual(pipe.read()[0], '%02d' % i * 20)
+        # The first segment was sealed when reading reached it, so this one went to a new one
+        for i in xrange(10):
+            pipe.write('%02d' % i * 20)
+        pipe.write(Done())
+        self.assertEqual(pipe.read()[0], 'x')
+        for i in xrange(10):
+            self.assertEqual(pipe.read()[0], '%02d' % i * 20)
+        self.assertTrue(isinstance(pipe.read()[0], Done))
+        self.assertEqual(budget.usage, 0)
+
+    def test_spill_after_sealing(self):
+        pipe = SpillPipe(0)
+        pipe.write('a')
+        pipe.write('b')
+        self.assertEqual(pipe.read()[0], 'a')
+        pipe.write('c')
+        self.assertEqual(pipe.read()[0], 'b')
+        self.assertEqual(pipe.read()[0], 'c')
+        self.assertRaises(Again, pipe.read)
+
+    def test_clear(self):
+        pipe = SpillPipe(0)
+        pipe.write('a')
+        pipe.clear()
+        self.assertRaises(Again, pipe.read)
+        self.assertEqual(pipe._watermark, 0)
+
+
+class TestMemoryBudget(unittest.TestCase):
+
+    def test_shared_budget(self):
+        parent = MemoryBudget(100)
+        first = Pipe(budget=MemoryBudget(parent=parent))
+        second = Pipe(budget=MemoryBudget(parent=parent))
+
+        first.write('a' * 101)
+        self.assertEqual(parent.usage, 101)
+        self.assertFalse(second.write_available())
+        self.assertRaises(Again, second.write, 'a')
+
+        first.read()
+        self.assertEqual(parent.usage, 0)
+        second.write('a')
+
+    def test_waiter_called_at_low_watermark(self):
+        woken = []
+        budget = MemoryBudget(100)
+        pipe = Pipe(budget=budget)
+        pipe.set_writable_callback(lambda: woken.append(True))
+
+        for _ in xrange(3):
+            pipe.write('a' * 40)
+        # Retried writes wait once
+        for _ in xrange(3):
+            self.assertRaises(Again, pipe.write, 'a')
+
+        pipe.read()
+        self.assertEqual(woken, [])
+        pipe.read()
+        self.assertEqual(woken, [True])
+
+    def test_raising_limit_wakes_waiters(self):
+        woken = []
+        budget = MemoryBudget(10)
+        budget.charge(20)
+        self.assertFalse(budget.acquire(1, lambda: woken.append(True)))
+        budget.limit = None
+        self.assertEqual(woken, [True])
+        self.assertTrue(budget.acquire(1))
+
+if __name__ == '__main__':
+    unittest.main()
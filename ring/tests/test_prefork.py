@@ -0,0 +1,137 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import multiprocessing
+import os
+import socket
+import unittest
+
+from ring.connection import PULLER, PUSHER, REPLIER, REQUESTER, REUSEPORT
+from ring.context import Context, ContextForkedError
+from ring.prefork import Prefork
+from ring.server import HandlerError
+
+
+def pid(x):
+    return os.getpid()
+
+
+def fail(x):
+    raise ValueError(x)
+
+
+def use_after_fork(parent_ctx, results):
+    try:
+        parent_ctx.connection(PULLER)
+    except ContextForkedError:
+        results.put('forked')
+    # Inherited contexts are left alone
+    parent_ctx.stop()
+
+    ctx = Context()
+    puller = ctx.connection(PULLER)
+    puller.bind(('', 0))
+    pusher = ctx.connection(PUSHER)
+    pusher.connect(('localhost', puller.getsockname()[1]))
+    pusher.send(b'child')
+    results.put(puller.recv())
+    pusher.close()
+    puller.close()
+    ctx.stop()
+
+
+@unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT'), 'SO_REUSEPORT is not supported')
+class TestReusePort(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+
+    def tearDown(self):
+        self._ctx.stop()
+
+    def test_bind_same_port(self):
+        first = self._ctx.connection(REPLIER)
+        first.setsockopt(REUSEPORT, True)
+        first.bind(('', 0))
+        second = self._ctx.connection(REPLIER)
+        second.setsockopt(REUSEPORT, True)
+        second.bind(('', first.getsockname()[1]))
+
+        third = self._ctx.connection(REPLIER)
+        self.assertRaises(socket.error, third.bind, ('', first.getsockname()[1]))
+        first.close()
+        second.close()
+
+    def test_context_after_fork(self):
+        # The parent's IO threads are running while it forks
+        puller = self._ctx.connection(PULLER)
+        puller.bind(('', 0))
+        results = multiprocessing.Queue()
+        child = multiprocessing.Process(target=use_after_fork, args=(self._ctx, results))
+        child.start()
+        self.assertEqual(results.get(timeout=10), 'forked')
+        self.assertEqual(results.get(timeout=10), b'child')
+        child.join()
+        self.assertEqual(child.exitcode, 0)
+
+        # The parent's context is unharmed
+        pusher = self._ctx.connection(PUSHER)
+        pusher.connect(('localhost', puller.getsockname()[1]))
+        pusher.send(b'parent')
+        self.assertEqual(puller.recv(), b'parent')
+        pusher.close()
+        puller.close()
+
+
+@unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT'), 'SO_REUSEPORT is not supported')
+class TestPrefork(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+        self._server = None
+
+    def tearDown(self):
+        self._server.stop()
+        self._ctx.stop()
+
+    def _start(self, handler, processes):
+        self._server = Prefork(('', 0), handler, processes, pyobj=True)
+        self._server.start()
+
+    def _requester(self):
+        connection = self._ctx.connection(REQUESTER)
+        connection.connect(('localhost', self._server.address[1]))
+        return connection
+
+    def test_spread_across_processes(self):
+        self._start(pid, 2)
+        requesters = [self._requester() for _ in xrange(20)]
+        for i, requester in enumerate(requesters):
+            requester.send_pyobj(i)
+        pids = set(requester.recv_pyobj() for requester in requesters)
+        # Each client lands on one worker, picked by the kernel from a hash of its address
+        self.assertEqual(pids, set(self._server.pids))
+        for requester in requesters:
+            requester.close()
+
+    def test_handler_error(self):
+        self._start(fail, 1)
+        requester = self._requester()
+        requester.send_pyobj(1)
+        self.assertTrue(isinstance(requester.recv_pyobj(), HandlerError))
+        requester.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from ring.connection import PUBLISHER, SUBSCRIBER
+from ring.context import Context
+from ring.trie import PrefixTrie
+
+
+class TestPrefixTrie(unittest.TestCase):
+
+    def test_match(self):
+        trie = PrefixTrie()
+        trie.add('', 1)
+        trie.add('ab', 2)
+        trie.add('abc', 3)
+        trie.add('b', 3)
+        self.assertEqual(trie.match('abcd'), set([1, 2, 3]))
+        self.assertEqual(trie.match('ab'), set([1, 2]))
+        self.assertEqual(trie.match('c'), set([1]))
+
+    def test_remove(self):
+        trie = PrefixTrie()
+        trie.add('ab', 1)
+        trie.add('ab', 1)
+        trie.add('abc', 2)
+        self.assertTrue(trie.remove('ab', 1))
+        self.assertEqual(trie.match('abc'), set([1, 2]))
+        self.assertTrue(trie.remove('ab', 1))
+        self.assertFalse(trie.remove('ab', 1))
+        self.assertTrue(trie.remove('abc', 2))
+        self.assertEqual(trie.match('abc'), set())
+        self.assertEqual(trie._root.children, {})
+
+
+class TestPubSub(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+        self._publisher = self._ctx.connection(PUBLISHER)
+        self._publisher.bind(('', 0))
+        self._subscribers = []
+
+    def tearDown(self):
+        for subscriber in self._subscribers:
+            subscriber.close()
+        self._publisher.close()
+        self._ctx.stop()
+
+    def _subscriber(self, *prefixes):
+        subscriber = self._ctx.connection(SUBSCRIBER)
+        for prefix in prefixes:
+            subscriber.subscribe(prefix)
+        subscriber.connect(('localhost', self._publisher.getsockname()[1]))
+        self._subscribers.append(subscriber)
+        return subscriber
+
+    def _sync(self, subscriber, topic):
+        # Subscriptions travel asynchronously. Publish until the first message comes through.
+        while not subscriber.recv_many(1, timeout=0.01):
+            self._publisher.send(topic)
+        # Drain the surplus sync messages
+        while subscriber.recv_many(100, timeout=0.05):
+            pass
+
+    def test_prefix_filtering(self):
+        weather = self._subscriber('weather.')
+        everything = self._subscriber('')
+        self._sync(weather, 'weather.sync')
+        self._sync(everything, 'sync')
+
+        for message in ['weather.rain', 'sports.tennis', 'weather.sun']:
+            self._publisher.send(message)
+
+        self.assertEqual(weather.recv(), 'weather.rain')
+        self.assertEqual(weather.recv(), 'weather.sun')
+        self.assertEqual([everything.recv() for _ in xrange(3)],
+                         ['weather.rain', 'sports.tennis', 'weather.sun'])
+
+    def test_unsubscribe(self):
+        subscriber = self._subscriber('a', 'b')
+        self._sync(subscriber, 'async')
+        subscriber.unsubscribe('a')
+        # Still subscribed to b, so once b arrives the unsubscription has gone through
+        self._sync(subscriber, 'bsync')
+
+        self._publisher.send('a1')
+        self._publisher.send('b1')
+        self.assertEqual(subscriber.recv(), 'b1')
+        self.assertEqual(subscriber.recv_many(1, timeout=0.1), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,11 +13,13 @@
 # limitations under the License.
 
 
+import cPickle
 import socket
+import time
 import unittest
 from threading import Thread
 
-from ring.connection import PULLER
+from ring.connection import PEER_WEIGHT, PULLER, RCVHWM
 from ring.connection_impl import Again
 from ring.constants import TYPE_ACTIVATE_RECV, TYPE_ERROR, ERR_CONNRESET, TYPE_CLOSED, TYPE_FINALIZE
 from ring.context import Context
@@ -115,6 +117,99 @@ class TestPuller(unittest.TestCase):
 
         connection.close()
 
+    def test_recv_many(self):
+        connection = self._ctx.connection(PULLER)
+        connection.bind(('', 0))
+        port = connection.getsockname()[1]
+
+        self.assertEqual(connection.recv_many(10, timeout=0.1), [])
+
+        def send():
+            conn = socket.socket()
+            conn.connect(('localhost', port))
+            for i in xrange(100):
+                for frame in generate_payload_frame(cPickle.dumps(i)):
+                    blocking_send(conn, frame)
+            conn.close()
+
+        th = Thread(target=send)
+        th.daemon = True
+        th.start()
+
+        received = []
+        while len(received) < 100:
+            batch = connection.recv_pyobj_many(100 - len(received))
+            self.assertTrue(batch)
+            received.extend(batch)
+        self.assertEqual(received, range(100))
+
+        connection.close()
+
+    def test_peer_stats(self):
+        connection = self._ctx.connection(PULLER)
+        connection.setsockopt(PEER_WEIGHT, lambda address: 2)
+        connection.bind(('', 0))
+
+        conn = socket.socket()
+        conn.connect(('localhost', connection.getsockname()[1]))
+        for frame in generate_payload_frame('a' * 10):
+            blocking_send(conn, frame)
+        self.assertEqual(connection.recv(), 'a' * 10)
+
+        stats, = connection.peer_stats()
+        self.assertEqual(stats['address'][1], conn.getsockname()[1])
+        self.assertEqual(stats['served'], 10)
+        self.assertEqual(stats['depth'], 0)
+        conn.close()
+        connection.close()
+
+    def test_empty_message(self):
+        connection = self._ctx.connection(PULLER)
+        connection.bind(('', 0))
+
+        conn = socket.socket()
+        conn.connect(('localhost', connection.getsockname()[1]))
+        for data in ('', 'a', ''):
+            for frame in generate_payload_frame(data):
+                blocking_send(conn, frame)
+        self.assertEqual([connection.recv() for _ in xrange(3)], ['', 'a', ''])
+        conn.close()
+        connection.close()
+
+    def test_pause_above_watermark(self):
+        connection = self._ctx.connection(PULLER)
+        connection.setsockopt(RCVHWM, 2)
+        self._check_paused(connection, 3)
+
+    def test_pause_without_watermark(self):
+        # Reads one message ahead only
+        self._check_paused(self._ctx.connection(PULLER), 1)
+
+    def _check_paused(self, connection, max_depth):
+        connection.bind(('', 0))
+        port = connection.getsockname()[1]
+        data = 'a' * 100 * 1024
+
+        def send():
+            conn = socket.socket()
+            conn.connect(('localhost', port))
+            for i in xrange(50):
+                for frame in generate_payload_frame(str(i) + data):
+                    blocking_send(conn, frame)
+            conn.close()
+
+        th = Thread(target=send)
+        th.daemon = True
+        th.start()
+
+        self.assertEqual(connection.recv(), '0' + data)
+        time.sleep(0.2)
+        # The rest waits in the socket buffers, or the sender
+        self.assertTrue(connection.peer_stats()[0]['depth'] <= max_depth)
+        for i in xrange(1, 50):
+            self.assertEqual(connection.recv(), str(i) + data)
+        connection.close()
+
     def test_unidirectional_recv_1M_with_100_iterations(self):
         self._test_unidirectional_recv('a' * 1024 * 1024, 1, 100)
 
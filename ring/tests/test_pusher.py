@@ -13,17 +13,19 @@
 # limitations under the License.
 
 
+import cPickle
 import socket
 import threading
 import unittest
+from struct import unpack
 from threading import Thread
 
-from ring.connection import PUSHER
+from ring.connection import PUSHER, SNDHWM
 from ring.connection_impl import Again
 from ring.constants import TYPE_ACTIVATE_SEND, TYPE_ERROR, TYPE_CLOSED, TYPE_CONNECT_SUCCESS
 from ring.context import Context
 from ring.events import Mailbox
-from ring.protocol import generate_payload_frame
+from ring.protocol import FLAG_MORE, FMT_FRAME_HEADER, LEN_FRAME_HEADER, generate_payload_frame
 from ring.pusher import PusherConnectionImpl
 from ring.tests.utils import blocking_recv, skip_on_ci
 from ring.utils import raise_exc_info
@@ -162,6 +164,110 @@ class TestPusher(unittest.TestCase):
 
         done_mailbox.close()
 
+    def test_send_many(self):
+        messages = [str(i) * 100 for i in xrange(1000)]
+        connection = self._ctx.connection(PUSHER)
+        connection.connect(('localhost', self._port))
+        conn, addr = self._server_socket.accept()
+
+        self.assertEqual(connection.send_many(messages[:500]), 500)
+        self.assertEqual(connection.send_pyobj_many(messages[500:]), 500)
+
+        for message in messages[:500]:
+            for expected in generate_payload_frame(message):
+                self.assertEqual(blocking_recv(conn, len(expected)), expected)
+        for message in messages[500:]:
+            for expected in generate_payload_frame(cPickle.dumps(message)):
+                self.assertEqual(blocking_recv(conn, len(expected)), expected)
+
+        conn.close()
+        connection.close()
+
+    def _listen(self):
+        server_socket = socket.socket()
+        server_socket.bind(('', 0))
+        server_socket.listen(128)
+        return server_socket
+
+    def _recv_until_closed(self, conn):
+        # Returns the payloads received until the peer closes
+        conn.setblocking(1)
+        received = []
+        while 1:
+            buf = []
+            while 1:
+                header = conn.recv(LEN_FRAME_HEADER, socket.MSG_WAITALL)
+                if not header:
+                    conn.close()
+                    return received
+                flags, length = unpack(FMT_FRAME_HEADER, header)
+                buf.append(blocking_recv(conn, length - LEN_FRAME_HEADER))
+                if not flags & FLAG_MORE:
+                    break
+            received.append(''.join(buf))
+
+    def test_round_robin(self):
+        other_socket = self._listen()
+        connection = self._ctx.connection(PUSHER)
+        connection.connect(('localhost', self._port))
+        connection.connect(('localhost', other_socket.getsockname()[1]))
+        first, x = self._server_socket.accept()
+        second, x = other_socket.accept()
+
+        for i in xrange(10):
+            connection.send('%d' % i)
+        connection.close()
+
+        self.assertEqual(self._recv_until_closed(first), ['0', '2', '4', '6', '8'])
+        self.assertEqual(self._recv_until_closed(second), ['1', '3', '5', '7', '9'])
+        other_socket.close()
+
+    def test_send_many_round_robin(self):
+        other_socket = self._listen()
+        connection = self._ctx.connection(PUSHER)
+        connection.connect(('localhost', self._port))
+        connection.connect(('localhost', other_socket.getsockname()[1]))
+        first, x = self._server_socket.accept()
+        second, x = other_socket.accept()
+
+        # Each peer takes an even share in one go
+        self.assertEqual(connection.send_many(['%d' % i for i in xrange(9)]), 9)
+        # And the turn goes on from there
+        connection.send('9')
+        connection.close()
+
+        self.assertEqual(self._recv_until_closed(first), ['0', '1', '2', '3', '4', '9'])
+        self.assertEqual(self._recv_until_closed(second), ['5', '6', '7', '8'])
+        other_socket.close()
+
+    def test_skip_peer_above_watermark(self):
+        message = 'a' * 1024 * 1024
+        iterations = 40
+        slow_socket = self._listen()
+        connection = self._ctx.connection(PUSHER)
+        connection.setsockopt(SNDHWM, 1)
+        connection.connect(('localhost', self._port))
+        connection.connect(('localhost', slow_socket.getsockname()[1]))
+        fast, x = self._server_socket.accept()
+
+        received = []
+        th = Thread(target=lambda: received.extend(self._recv_until_closed(fast)))
+        th.daemon = True
+        th.start()
+
+        # Would block forever without skipping the peer that does not read at all
+        for _ in xrange(iterations):
+            connection.send(message)
+        connection.close()
+        th.join()
+
+        slow, x = slow_socket.accept()
+        slow_received = self._recv_until_closed(slow)
+        self.assertEqual(len(received) + len(slow_received), iterations)
+        self.assertTrue(len(received) > iterations / 2)
+        self.assertTrue(all(data == message for data in received + slow_received))
+        slow_socket.close()
+
     def test_unidirectional_send_1M_with_100_iterations(self):
         self._test_unidirectional_send('a' * 1024 * 1024, 100, 1)
 
@@ -0,0 +1,162 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import select
+import socket
+import time
+import unittest
+from struct import unpack
+
+from ring.backoff import Backoff
+from ring.connection import (
+    PIPELINE, PUSHER, REQUESTER, RECONNECT_IVL, RequestFailed, _closed
+)
+from ring.context import Context
+from ring.protocol import FMT_FRAME_HEADER, LEN_FRAME_HEADER, generate_payload_frame
+from ring.tests.utils import blocking_recv, blocking_send
+
+
+def _read_message(conn):
+    # Single frame messages only
+    flags, length = unpack(FMT_FRAME_HEADER, blocking_recv(conn, LEN_FRAME_HEADER))
+    return blocking_recv(conn, length - LEN_FRAME_HEADER)
+
+
+def _wait_until(predicate, process=None):
+    deadline = time.time() + 5
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError('Timed out')
+        if process is not None:
+            process._process_commands(0)
+        time.sleep(0.01)
+
+
+class TestBackoff(unittest.TestCase):
+
+    def test_doubles_up_to_maximum(self):
+        low = Backoff(0.1, 0.5, random=lambda: 0.0)
+        self.assertEqual([round(low.next(), 3) for _ in xrange(5)],
+                         [0.05, 0.1, 0.2, 0.25, 0.25])
+        high = Backoff(0.1, 0.5, random=lambda: 1.0)
+        self.assertEqual([round(high.next(), 3) for _ in xrange(5)], [0.1, 0.2, 0.4, 0.5, 0.5])
+        high.reset()
+        self.assertEqual(round(high.next(), 3), 0.1)
+
+    def test_jittered(self):
+        delays = set(Backoff(1, 1).next() for _ in xrange(10))
+        self.assertTrue(len(delays) > 1)
+        self.assertTrue(all(0.5 <= delay <= 1 for delay in delays))
+
+
+class TestReconnect(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+        self._ctx.setsockopt(RECONNECT_IVL, 0.01)
+        self._server_socket = socket.socket()
+        self._server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server_socket.bind(('', 0))
+        self._server_socket.listen(128)
+        self._addr = ('localhost', self._server_socket.getsockname()[1])
+
+    def tearDown(self):
+        self._server_socket.close()
+        self._ctx.stop()
+
+    def _accept(self):
+        conn, addr = self._server_socket.accept()
+        conn.setblocking(1)
+        return conn
+
+    def test_pusher_keeps_queue(self):
+        pusher = self._ctx.connection(PUSHER)
+        pusher.connect(self._addr)
+        conn = self._accept()
+        pusher.send(b'first')
+        self.assertEqual(_read_message(conn), b'first')
+
+        # The puller restarts. Once redialed, the lost peer was noticed.
+        conn.close()
+        self.assertTrue(select.select([self._server_socket], [], [], 5)[0])
+        for i in xrange(10):
+            pusher.send(str(i))
+        conn = self._accept()
+        self.assertEqual([_read_message(conn) for _ in xrange(10)], map(str, xrange(10)))
+        _wait_until(lambda: pusher.peer_stats()[0]['connected'], pusher)
+        pusher.close()
+        conn.close()
+
+    def test_connect_before_bind(self):
+        self._server_socket.close()
+        pusher = self._ctx.connection(PUSHER)
+        pusher.connect(self._addr)
+        pusher.send(b'early')
+
+        self._server_socket = socket.socket()
+        self._server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server_socket.bind(('', self._addr[1]))
+        self._server_socket.listen(128)
+        conn = self._accept()
+        self.assertEqual(_read_message(conn), b'early')
+        pusher.close()
+        conn.close()
+
+    def test_close_while_redialing(self):
+        self._server_socket.close()
+        pusher = self._ctx.connection(PUSHER)
+        pusher.connect(self._addr)
+        pusher.send(b'never sent')
+        pusher.close()
+        _wait_until(lambda: pusher._state == _closed)
+
+    def test_requester_fails_in_flight(self):
+        requester = self._ctx.connection(REQUESTER)
+        requester.connect(self._addr)
+        conn = self._accept()
+        requester.send(b'lost')
+        self.assertEqual(_read_message(conn), b'lost')
+        conn.close()
+        self.assertRaises(RequestFailed, requester.recv)
+
+        requester.send(b'request')
+        conn = self._accept()
+        self.assertEqual(_read_message(conn), b'request')
+        for frame in generate_payload_frame(b'reply'):
+            blocking_send(conn, frame)
+        self.assertEqual(requester.recv(), b'reply')
+        requester.close()
+        conn.close()
+
+    def test_pipelined_requester_fails_in_flight(self):
+        requester = self._ctx.connection(REQUESTER)
+        requester.setsockopt(PIPELINE, True)
+        requester.connect(self._addr)
+        conn = self._accept()
+        ids = [requester.send(b'lost') for _ in xrange(3)]
+        for _ in ids:
+            _read_message(conn)
+        conn.close()
+
+        failed = []
+        for _ in ids:
+            with self.assertRaises(RequestFailed) as context:
+                requester.recv()
+            failed.append(context.exception.request_id)
+        self.assertEqual(failed, ids)
+        requester.close()
+
+if __name__ == '__main__':
+    unittest.main()
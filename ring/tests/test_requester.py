@@ -15,16 +15,18 @@
 
 import socket
 import threading
+import time
 import unittest
+from struct import unpack
 from threading import Thread
 
-from ring.connection import REQUESTER
-from ring.connection_impl import Again
+from ring.connection import PIPELINE, REPLIER, REQUESTER
+from ring.connection_impl import Again, RequestFailed
 from ring.constants import TYPE_ACTIVATE_RECV, TYPE_ACTIVATE_SEND, TYPE_ERROR, TYPE_CLOSED, \
     TYPE_CONNECT_SUCCESS
 from ring.context import Context
 from ring.events import Mailbox
-from ring.protocol import generate_payload_frame
+from ring.protocol import FMT_FRAME_HEADER, LEN_FRAME_HEADER, generate_payload_frame
 from ring.requester import RequesterConnectionImpl
 from ring.tests.utils import blocking_recv, blocking_send, skip_on_ci
 from ring.utils import raise_exc_info
@@ -137,7 +139,8 @@ class TestRequester(unittest.TestCase):
                 requester.close()
                 while 1:
                     result = mailbox.recv()
-                    if result.command == TYPE_CLOSED:
+                    # The replier's close may be noticed first, as replies are read ahead
+                    if result.command in (TYPE_CLOSED, TYPE_ERROR):
                         requester.connection_close(*result.args)
                         break
                 done_mailbox.send(None)
@@ -199,6 +202,120 @@ class TestRequester(unittest.TestCase):
 
         done_mailbox.close()
 
+    def _serve_echo(self, server_socket, served):
+        # Echoes single frame requests, tagging them with the port, until the peer closes
+        conn, addr = server_socket.accept()
+        conn.setblocking(1)
+        port = server_socket.getsockname()[1]
+        while 1:
+            header = conn.recv(LEN_FRAME_HEADER, socket.MSG_WAITALL)
+            if not header:
+                break
+            flags, length = unpack(FMT_FRAME_HEADER, header)
+            data = blocking_recv(conn, length - LEN_FRAME_HEADER)
+            served.append(port)
+            for frame in generate_payload_frame('%d:%s' % (port, data)):
+                blocking_send(conn, frame)
+        conn.close()
+
+    def _listen(self):
+        server_socket = socket.socket()
+        server_socket.bind(('', 0))
+        server_socket.listen(128)
+        return server_socket
+
+    def test_multiple_repliers_round_robin(self):
+        served = []
+        server_sockets = [self._server_socket, self._listen(), self._listen()]
+        connection = self._ctx.connection(REQUESTER)
+        for server_socket in server_sockets:
+            th = Thread(target=self._serve_echo, args=(server_socket, served))
+            th.daemon = True
+            th.start()
+            connection.connect(('localhost', server_socket.getsockname()[1]))
+
+        for i in xrange(9):
+            connection.send(str(i))
+            port, data = connection.recv().split(':')
+            self.assertEqual(data, str(i))
+
+        ports = [server_socket.getsockname()[1] for server_socket in server_sockets]
+        self.assertEqual(served, ports * 3)
+        connection.close()
+        for server_socket in server_sockets[1:]:
+            server_socket.close()
+
+    def test_eject_broken_replier(self):
+        served = []
+        broken_socket = self._listen()
+        connection = self._ctx.connection(REQUESTER)
+        th = Thread(target=self._serve_echo, args=(self._server_socket, served))
+        th.daemon = True
+        th.start()
+        connection.connect(('localhost', self._port))
+        connection.connect(('localhost', broken_socket.getsockname()[1]))
+        broken, addr = broken_socket.accept()
+
+        connection.send('a')
+        self.assertEqual(connection.recv(), '%d:a' % self._port)
+
+        # The second request goes to the broken replier, which goes away without replying
+        connection.send('b')
+        broken.close()
+        self.assertRaises(RequestFailed, connection.recv)
+
+        for _ in xrange(3):
+            connection.send('c')
+            self.assertEqual(connection.recv(), '%d:c' % self._port)
+        connection.close()
+        broken_socket.close()
+
+    def _serve_replier(self, count, delay=0):
+        # Binds a REPLIER echoing count requests, each after delay seconds
+        replier = self._ctx.connection(REPLIER)
+        replier.bind(('', 0))
+
+        def serve():
+            for _ in xrange(count):
+                data = replier.recv()
+                time.sleep(delay)
+                replier.send(data)
+            replier.close()
+
+        th = Thread(target=serve)
+        th.daemon = True
+        th.start()
+        return replier.getsockname()[1]
+
+    def test_pipelined_requests(self):
+        port = self._serve_replier(100)
+        connection = self._ctx.connection(REQUESTER)
+        connection.setsockopt(PIPELINE, True)
+        connection.connect(('localhost', port))
+
+        sent = dict((connection.send('request %d' % i), 'request %d' % i) for i in xrange(100))
+        self.assertEqual(len(sent), 100)
+        received = {}
+        while len(received) < 100:
+            for request_id, reply in connection.recv_many(100):
+                received[request_id] = reply
+        self.assertEqual(received, sent)
+        connection.close()
+
+    def test_pipelined_replies_out_of_order(self):
+        slow_port = self._serve_replier(1, delay=0.2)
+        fast_port = self._serve_replier(1)
+        connection = self._ctx.connection(REQUESTER)
+        connection.setsockopt(PIPELINE, True)
+        connection.connect(('localhost', slow_port))
+        connection.connect(('localhost', fast_port))
+
+        first = connection.send('slow')
+        second = connection.send('fast')
+        self.assertEqual(connection.recv(), (second, 'fast'))
+        self.assertEqual(connection.recv(), (first, 'slow'))
+        connection.close()
+
     def test_1M_send_and_receive(self):
         self._test_simple_send_and_receive('a' * 1024 * 1024, 1)
 
@@ -0,0 +1,117 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+from threading import Thread
+
+from ring.connection import NONBLOCK, PIPELINE, REQUESTER, ROUTER, SNDHWM
+from ring.connection_impl import Again
+from ring.context import Context
+
+
+class TestRouter(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+        self._router = self._ctx.connection(ROUTER)
+        self._router.bind(('', 0))
+        self._port = self._router.getsockname()[1]
+
+    def tearDown(self):
+        self._router.close()
+        self._ctx.stop()
+
+    def _requester(self, pipeline=False):
+        connection = self._ctx.connection(REQUESTER)
+        connection.setsockopt(PIPELINE, pipeline)
+        connection.connect(('localhost', self._port))
+        return connection
+
+    def test_reply_out_of_order_from_other_thread(self):
+        first = self._requester()
+        second = self._requester()
+        first.send('first')
+        second.send('second')
+
+        requests = dict((request, token) for token, request in
+                        [self._router.recv(), self._router.recv()])
+        self.assertEqual(sorted(requests), ['first', 'second'])
+
+        def reply():
+            self._router.send((requests['second'], 'reply to second'))
+            self._router.send((requests['first'], 'reply to first'))
+
+        th = Thread(target=reply)
+        th.start()
+        th.join()
+
+        self.assertEqual(second.recv(), 'reply to second')
+        self.assertEqual(first.recv(), 'reply to first')
+        first.close()
+        second.close()
+
+    def test_pipelined_requests(self):
+        requester = self._requester(pipeline=True)
+        ids = [requester.send_pyobj(i) for i in xrange(3)]
+
+        received = [self._router.recv_pyobj() for _ in xrange(3)]
+        self.assertEqual([obj for token, obj in received], [0, 1, 2])
+        self._router.send_pyobj_many((token, obj * 10) for token, obj in reversed(received))
+
+        self.assertEqual(
+            [requester.recv_pyobj() for _ in xrange(3)],
+            [(ids[2], 20), (ids[1], 10), (ids[0], 0)])
+        requester.close()
+
+    def test_reply_to_lost_requester(self):
+        requester = self._requester()
+        requester.send('a')
+        token, request = self._router.recv()
+        requester.close()
+
+        # Lets the router process the disconnect
+        self.assertEqual(self._router.recv_many(1, timeout=0.5), [])
+        self._router.send((token, 'b'))
+        self.assertEqual(self._router.stats()['unroutable'], 1)
+
+    def test_reply_backpressure(self):
+        self._router.setsockopt(SNDHWM, 0)
+        requester = self._requester(pipeline=True)
+        count = 20
+        for _ in xrange(count):
+            requester.send(b'')
+        tokens = [self._router.recv()[0] for _ in xrange(count)]
+
+        # Fills the socket buffers, then the send queue
+        reply = b'a' * 1024 * 1024
+        sent = 0
+        try:
+            while sent < count:
+                self._router.send((tokens[sent], reply), NONBLOCK)
+                sent += 1
+        except Again:
+            pass
+        self.assertTrue(sent < count)
+
+        # The rest block until the requester reads
+        rest = [(token, reply) for token in tokens[sent:]]
+        th = Thread(target=self._router.send_many, args=(rest,))
+        th.start()
+        self.assertEqual([len(requester.recv()[1]) for _ in xrange(count)], [len(reply)] * count)
+        th.join()
+        requester.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import collections
+import unittest
+
+from ring.options import InvalidOptionError
+from ring.scheduler import FairQueue
+
+
+class TestFairQueue(unittest.TestCase):
+
+    def _serve(self, queue, sizes, count):
+        # sizes maps peers to the size of all their messages. Returns bytes served per peer.
+        for peer in sizes:
+            queue.push(peer)
+        served = collections.Counter()
+        for _ in xrange(count):
+            peer = queue.next(sizes.get)
+            served[peer] += sizes[peer]
+        return served
+
+    def test_fair_by_bytes(self):
+        # The heavy peer sends messages 100 times larger, but gets no more bytes through
+        served = self._serve(FairQueue(1000), {'heavy': 1000, 'light': 10}, 1010)
+        self.assertEqual(served['heavy'], served['light'])
+
+    def test_weights(self):
+        queue = FairQueue(100)
+        queue.set_weight('a', 3)
+        served = self._serve(queue, {'a': 10, 'b': 10}, 400)
+        self.assertEqual(served['a'], 3 * served['b'])
+
+    def test_invalid_weight(self):
+        queue = FairQueue(100)
+        for weight in (0, -1, None, '2'):
+            self.assertRaises(InvalidOptionError, queue.set_weight, 'a', weight)
+        queue.set_weight('a', 0.5)
+
+    def test_message_larger_than_quantum(self):
+        served = self._serve(FairQueue(10), {'big': 25, 'small': 5}, 12)
+        self.assertEqual(served, {'big': 50, 'small': 50})
+
+    def test_remove(self):
+        queue = FairQueue(10)
+        queue.push('a')
+        queue.push('b')
+        self.assertEqual(queue.next(lambda peer: 10), 'a')
+        queue.remove('a')
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(queue.next(lambda peer: 10), 'b')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import tempfile
+import unittest
+
+from ring import sendfile
+from ring.budget import MemoryBudget
+from ring.connection import PIPELINE, PUBLISHER, PULLER, PUSHER, REPLIER, REQUESTER
+from ring.context import Context
+from ring.pipes import Pipe
+from ring.protocol import LEN_FRAME_HEADER, Envelope
+
+
+class TestSendFile(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+        self._data = os.urandom(300 * 1024 + 7)
+        fd, self._path = tempfile.mkstemp(prefix='ring-test-')
+        os.write(fd, self._data)
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self._path)
+        self._ctx.stop()
+
+    def _pair(self):
+        puller = self._ctx.connection(PULLER)
+        puller.bind(('', 0))
+        pusher = self._ctx.connection(PUSHER)
+        pusher.connect(('localhost', puller.getsockname()[1]))
+        return pusher, puller
+
+    def _test_interleaved(self):
+        pusher, puller = self._pair()
+        fd = os.open(self._path, os.O_RDONLY)
+        pusher.send(b'before')
+        pusher.send_file(self._path)
+        pusher.send_file(fd, 10, 100)
+        os.close(fd)
+        pusher.send_file(self._path, 5, 0)
+        pusher.send(b'after')
+
+        self.assertEqual(puller.recv(), b'before')
+        self.assertEqual(puller.recv(), self._data)
+        self.assertEqual(puller.recv(), self._data[10:110])
+        self.assertEqual(puller.recv(), b'')
+        self.assertEqual(puller.recv(), b'after')
+        pusher.close()
+        puller.close()
+
+    def test_interleaved_with_messages(self):
+        self._test_interleaved()
+
+    def test_without_sendfile(self):
+        original = sendfile._sendfile
+        sendfile._sendfile = None
+        try:
+            self._test_interleaved()
+        finally:
+            sendfile._sendfile = original
+
+    def test_pipelined_reply(self):
+        replier = self._ctx.connection(REPLIER)
+        replier.bind(('', 0))
+        requester = self._ctx.connection(REQUESTER)
+        requester.setsockopt(PIPELINE, True)
+        requester.connect(('localhost', replier.getsockname()[1]))
+
+        request_id = requester.send(b'file')
+        self.assertEqual(replier.recv(), b'file')
+        replier.send_file(self._path)
+        self.assertEqual(requester.recv(), (request_id, self._data))
+        requester.close()
+        replier.close()
+
+    def test_invalid_region(self):
+        pusher, puller = self._pair()
+        self.assertRaises(ValueError, pusher.send_file, self._path, len(self._data), 1)
+        self.assertRaises(ValueError, pusher.send_file, self._path, -1)
+        publisher = self._ctx.connection(PUBLISHER)
+        self.assertRaises(NotImplementedError, publisher.send_file, self._path)
+        pusher.close()
+        puller.close()
+
+    def test_queued_region_charges_header_only(self):
+        budget = MemoryBudget(100)
+        pipe = Pipe(hwm_bytes=100, budget=budget)
+        region = sendfile.FileRegion.open(self._path)
+        pipe.write(region)
+        pipe.write(Envelope(1, region.slice(0, 1000)))
+        self.assertEqual(budget.usage, 2 * LEN_FRAME_HEADER)
+        pipe.read()
+        pipe.read()
+        self.assertEqual(budget.usage, 0)
+        region.file.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import random
+import time
+import unittest
+from threading import Thread
+
+from ring.connection import PIPELINE, REQUESTER
+from ring.context import Context
+from ring.server import MODE_PROCESS, MODE_THREAD, HandlerError, Server, handle
+
+
+def square(x):
+    # Takes a little while, so pipelined requests would overtake each other if run in parallel
+    time.sleep(random.random() * 0.01)
+    return x * x
+
+
+def pid(x):
+    return os.getpid()
+
+
+def fail(x):
+    raise ValueError(x)
+
+
+class TestHandle(unittest.TestCase):
+
+    def test_plain_error(self):
+        self.assertEqual(handle(lambda request: request.upper(), b'request'), b'REQUEST')
+        self.assertEqual(handle(fail, b'request'), b'')
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+        self._server = None
+        self._thread = None
+
+    def tearDown(self):
+        self._server.stop()
+        self._thread.join()
+        self._ctx.stop()
+
+    def _serve(self, handler, workers, mode):
+        self._server = Server(('', 0), handler, workers, mode, pyobj=True)
+        self._server.start()
+        self._thread = Thread(target=self._server.serve_forever)
+        self._thread.start()
+
+    def _requester(self, pipeline=False):
+        connection = self._ctx.connection(REQUESTER)
+        connection.setsockopt(PIPELINE, pipeline)
+        connection.connect(('localhost', self._server.address[1]))
+        return connection
+
+    def test_thread_pool(self):
+        self._serve(square, 4, MODE_THREAD)
+        requesters = [self._requester() for _ in xrange(4)]
+        for i, requester in enumerate(requesters):
+            requester.send_pyobj(i)
+        self.assertEqual([requester.recv_pyobj() for requester in requesters], [0, 1, 4, 9])
+        for requester in requesters:
+            requester.close()
+
+    def test_pipelined_requests_stay_ordered(self):
+        self._serve(square, 4, MODE_THREAD)
+        requester = self._requester(pipeline=True)
+        ids = [requester.send_pyobj(i) for i in xrange(20)]
+        self.assertEqual(
+            [requester.recv_pyobj() for _ in xrange(20)],
+            [(request_id, i * i) for i, request_id in enumerate(ids)])
+        requester.close()
+
+    def test_process_pool(self):
+        self._serve(pid, 2, MODE_PROCESS)
+        requesters = [self._requester() for _ in xrange(4)]
+        for requester in requesters:
+            requester.send_pyobj(None)
+        pids = set(requester.recv_pyobj() for requester in requesters)
+        self.assertEqual(len(pids), 2)
+        self.assertFalse(os.getpid() in pids)
+        for requester in requesters:
+            requester.close()
+
+    def test_handler_error(self):
+        self._serve(fail, 1, MODE_THREAD)
+        requester = self._requester()
+        requester.send_pyobj(1)
+        error = requester.recv_pyobj()
+        self.assertTrue(isinstance(error, HandlerError))
+        self.assertTrue('ValueError' in str(error))
+        # The worker serves on
+        requester.send_pyobj(2)
+        self.assertTrue(isinstance(requester.recv_pyobj(), HandlerError))
+        requester.close()
+
+if __name__ == '__main__':
+    unittest.main()
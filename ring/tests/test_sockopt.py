@@ -0,0 +1,101 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import socket
+import time
+import unittest
+
+from ring.connection import (
+    KEEPALIVE, KEEPALIVE_IDLE, NODELAY, OVERFLOW, OVERFLOW_AGAIN, OVERFLOW_BLOCK,
+    OVERFLOW_DROP_OLDEST, PULLER, PUSHER, RCVBUF, REPLIER, REQUESTER, ROUTER, SNDHWM
+)
+from ring.context import Context
+from ring.options import InvalidOptionError
+
+
+class TestSocketOptions(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+
+    def tearDown(self):
+        self._ctx.stop()
+
+    def _accepted_socket(self, puller):
+        # The socket of the only peer, once accepted
+        for _ in xrange(100):
+            connections = puller._impl._connections
+            if connections:
+                engine, stream, recv_pipe, send_pipe = connections.values()[0]
+                return stream.socket
+            time.sleep(0.01)
+        self.fail('Peer not accepted')
+
+    def test_context_defaults(self):
+        self._ctx.setsockopt(RCVBUF, 256 * 1024)
+        self._ctx.setsockopt(SNDHWM, 10)
+        connection = self._ctx.connection(PULLER)
+        self.assertEqual(connection.getsockopt(RCVBUF), 256 * 1024)
+        self.assertEqual(connection.getsockopt(SNDHWM), 10)
+
+        # Connections override the defaults for themselves only
+        connection.setsockopt(SNDHWM, 20)
+        self.assertEqual(self._ctx.getsockopt(SNDHWM), 10)
+        self.assertEqual(self._ctx.connection(PULLER).getsockopt(SNDHWM), 10)
+
+        self.assertRaises(InvalidOptionError, self._ctx.setsockopt, RCVBUF, 0)
+
+    def test_lockstep_refuses_drop(self):
+        self._ctx.setsockopt(OVERFLOW, OVERFLOW_DROP_OLDEST)
+        self.assertEqual(
+            self._ctx.connection(PULLER).getsockopt(OVERFLOW), OVERFLOW_DROP_OLDEST)
+        for type in (REQUESTER, REPLIER, ROUTER):
+            connection = self._ctx.connection(type)
+            self.assertEqual(connection.getsockopt(OVERFLOW), OVERFLOW_BLOCK)
+            self.assertRaises(
+                InvalidOptionError, connection.setsockopt, OVERFLOW, OVERFLOW_DROP_OLDEST)
+            connection.setsockopt(OVERFLOW, OVERFLOW_AGAIN)
+
+    def test_applied_to_both_ends(self):
+        self._ctx.setsockopt(KEEPALIVE, True)
+        puller = self._ctx.connection(PULLER)
+        puller.setsockopt(KEEPALIVE_IDLE, 30)
+        puller.bind(('', 0))
+        pusher = self._ctx.connection(PUSHER)
+        pusher.connect(('localhost', puller.getsockname()[1]))
+        pusher.send(b'a')
+        self.assertEqual(puller.recv(), b'a')
+
+        accepted = self._accepted_socket(puller)
+        for sock in (pusher._socket, accepted):
+            self.assertTrue(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+            self.assertTrue(sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            self.assertEqual(accepted.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE), 30)
+        pusher.close()
+        puller.close()
+
+    def test_nagle(self):
+        puller = self._ctx.connection(PULLER)
+        puller.bind(('', 0))
+        pusher = self._ctx.connection(PUSHER)
+        pusher.setsockopt(NODELAY, False)
+        pusher.connect(('localhost', puller.getsockname()[1]))
+        self.assertFalse(pusher._socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        pusher.close()
+        puller.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from ring.pipes import Pipe
+from ring.protocol import Chunk
+from ring.stream_engine import _MAX_BATCH_SIZE, StreamEngine
+
+
+class TestBatch(unittest.TestCase):
+
+    def _engine(self, *messages):
+        send_pipe = Pipe()
+        for message in messages:
+            send_pipe.write(message)
+        return StreamEngine(None, None, None, send_pipe, None)
+
+    def test_small_messages_batched(self):
+        engine = self._engine(b'a', b'b', Chunk(b'c', True))
+        batch, x = engine._read_batch()
+        self.assertEqual(len(batch), 3)
+
+    def test_large_message_alone(self):
+        large = b'a' * _MAX_BATCH_SIZE
+        engine = self._engine(b'a', large, Chunk(large, False), b'b')
+        self.assertEqual(engine._read_batch()[0], [b'a'])
+        # Sent frame by frame rather than joined into one string
+        self.assertTrue(engine._read_batch()[0] is large)
+        self.assertTrue(isinstance(engine._read_batch()[0], Chunk))
+        self.assertEqual(engine._read_batch()[0], [b'b'])
+
+    def test_batch_bounded(self):
+        half = b'a' * (_MAX_BATCH_SIZE / 2 + 1)
+        engine = self._engine(half, half)
+        self.assertEqual(engine._read_batch()[0], [half])
+        self.assertEqual(engine._read_batch()[0], [half])
+
+if __name__ == '__main__':
+    unittest.main()
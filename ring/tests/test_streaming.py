@@ -0,0 +1,154 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import threading
+import unittest
+
+from ring.connection import (
+    CREDIT_BYTES, PIPELINE, PUBLISHER, PULLER, PUSHER, REPLIER, REQUESTER, StreamInterrupted
+)
+from ring.context import Context
+
+
+def _chunks(count, size=64 * 1024):
+    for i in xrange(count):
+        yield chr(ord('a') + i % 26) * size
+
+
+def _failing(count):
+    for chunk in _chunks(count):
+        yield chunk
+    raise ValueError('producer failed')
+
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+
+    def tearDown(self):
+        self._ctx.stop()
+
+    def _pair(self, *options):
+        puller = self._ctx.connection(PULLER)
+        for option, value in options:
+            puller.setsockopt(option, value)
+        puller.bind(('', 0))
+        pusher = self._ctx.connection(PUSHER)
+        pusher.connect(('localhost', puller.getsockname()[1]))
+        return pusher, puller
+
+    def test_recv_stream(self):
+        pusher, puller = self._pair()
+        pusher.send_stream(_chunks(20))
+        pusher.send(b'plain')
+
+        self.assertEqual(list(puller.recv_stream()), list(_chunks(20)))
+        # Plain messages come as a single chunk
+        self.assertEqual(list(puller.recv_stream()), [b'plain'])
+        pusher.close()
+        puller.close()
+
+    def test_recv_joins_stream(self):
+        pusher, puller = self._pair()
+        pusher.send_stream(_chunks(20))
+        pusher.send_stream([])
+        self.assertEqual(puller.recv(), b''.join(_chunks(20)))
+        self.assertEqual(puller.recv(), b'')
+        pusher.close()
+        puller.close()
+
+    def test_not_interleaved(self):
+        pusher, puller = self._pair()
+        other = self._ctx.connection(PUSHER)
+        other.connect(('localhost', puller.getsockname()[1]))
+        for _ in xrange(10):
+            other.send(b'plain')
+        pusher.send_stream(_chunks(50))
+        for _ in xrange(10):
+            other.send(b'plain')
+
+        received = [puller.recv() for _ in xrange(21)]
+        self.assertEqual(received.count(b'plain'), 20)
+        self.assertTrue(b''.join(_chunks(50)) in received)
+        other.close()
+        pusher.close()
+        puller.close()
+
+    def test_aborted(self):
+        pusher, puller = self._pair()
+        self.assertRaises(ValueError, pusher.send_stream, _failing(3))
+        pusher.send(b'after')
+
+        stream = puller.recv_stream()
+        for chunk in _chunks(3):
+            self.assertEqual(next(stream), chunk)
+        self.assertRaises(StreamInterrupted, next, stream)
+        self.assertEqual(puller.recv(), b'after')
+
+        self.assertRaises(ValueError, pusher.send_stream, _failing(3))
+        pusher.send(b'after')
+        self.assertRaises(StreamInterrupted, puller.recv)
+        self.assertEqual(puller.recv(), b'after')
+        pusher.close()
+        puller.close()
+
+    def test_beyond_credit(self):
+        # A single streamed message larger than the puller's window
+        pusher, puller = self._pair((CREDIT_BYTES, 256 * 1024))
+
+        def send():
+            pusher.send_stream(_chunks(40))
+            pusher.send(b'after')
+
+        # The window is only granted again as the message is received
+        sender = threading.Thread(target=send)
+        sender.start()
+        self.assertEqual(list(puller.recv_stream()), list(_chunks(40)))
+        self.assertEqual(puller.recv(), b'after')
+        sender.join()
+        pusher.close()
+        puller.close()
+
+    def test_reply(self):
+        replier = self._ctx.connection(REPLIER)
+        replier.bind(('', 0))
+        requester = self._ctx.connection(REQUESTER)
+        requester.connect(('localhost', replier.getsockname()[1]))
+
+        for _ in xrange(2):
+            requester.send(b'request')
+            self.assertEqual(replier.recv(), b'request')
+            replier.send_stream(_chunks(10))
+            self.assertEqual(list(requester.recv_stream()), list(_chunks(10)))
+
+        requester.send(b'request')
+        self.assertEqual(replier.recv(), b'request')
+        replier.send_stream(_chunks(10))
+        self.assertEqual(requester.recv(), b''.join(_chunks(10)))
+        requester.close()
+        replier.close()
+
+    def test_not_applicable(self):
+        publisher = self._ctx.connection(PUBLISHER)
+        self.assertRaises(NotImplementedError, publisher.send_stream, [b'a'])
+        self.assertRaises(NotImplementedError, publisher.recv_stream)
+        requester = self._ctx.connection(REQUESTER)
+        requester.setsockopt(PIPELINE, True)
+        self.assertRaises(NotImplementedError, requester.recv_stream)
+        self.assertRaises(NotImplementedError, requester.send_stream, [b'a'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import time
+import unittest
+
+from ring.connection import (
+    CREDIT, POLLIN, POLLOUT, PULLER, PUSHER, TimeoutError
+)
+from ring.connection_impl import Again
+from ring.context import Context
+
+
+class TestTimeout(unittest.TestCase):
+
+    def setUp(self):
+        self._ctx = Context()
+        self._puller = self._ctx.connection(PULLER)
+        self._puller.setsockopt(CREDIT, 1)
+        self._puller.bind(('', 0))
+        self._pusher = self._ctx.connection(PUSHER)
+        self._pusher.connect(('localhost', self._puller.getsockname()[1]))
+
+    def tearDown(self):
+        self._pusher.close()
+        self._puller.close()
+        self._ctx.stop()
+
+    def test_recv(self):
+        start = time.time()
+        self.assertRaises(TimeoutError, self._puller.recv, timeout=0.1)
+        self.assertTrue(time.time() - start >= 0.1)
+        # Still usable
+        self._pusher.send_pyobj('late')
+        self.assertEqual(self._puller.recv_pyobj(timeout=5), 'late')
+        self.assertRaises(TimeoutError, self._puller.recv_pyobj, timeout=0)
+
+    def test_timeout_is_again(self):
+        try:
+            self._puller.recv(timeout=0)
+        except Again:
+            pass
+        else:
+            self.fail('Again not raised')
+
+    def test_send(self):
+        # Wait for the puller's window
+        while self._pusher.peer_stats()[0]['credit'] is None:
+            self._pusher.poll(POLLOUT, 0.01)
+
+        self._pusher.send(b'first', timeout=0.1)
+        self.assertRaises(TimeoutError, self._pusher.send, b'second', timeout=0.1)
+        self.assertEqual(self._puller.recv(), b'first')
+        self._pusher.send_pyobj('second', timeout=5)
+        self.assertEqual(self._puller.recv_pyobj(), 'second')
+
+    def test_poll(self):
+        self.assertEqual(self._puller.poll(POLLIN), 0)
+        start = time.time()
+        self.assertEqual(self._puller.poll(POLLIN, 0.1), 0)
+        self.assertTrue(time.time() - start >= 0.1)
+
+        self._pusher.send(b'message')
+        self.assertEqual(self._puller.poll(POLLIN | POLLOUT, 5), POLLIN)
+        self.assertEqual(self._puller.poll(POLLIN, None), POLLIN)
+        self.assertEqual(self._puller.recv(), b'message')
+
+if __name__ == '__main__':
+    unittest.main()
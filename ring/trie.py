@@ -0,0 +1,78 @@
+# Copyright 2016 Douban Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+
+
+class _Node(object):
+
+    __slots__ = ('children', 'peers')
+
+    def __init__(self):
+        self.children = {}
+        # Peer -> number of times it subscribed to this exact prefix
+        self.peers = collections.Counter()
+
+
+class PrefixTrie(object):
+    """Maps topic prefixes to the peers subscribed to them.
+
+    Matching walks a message once, for as many bytes as the longest subscribed prefix along
+    its path, collecting every peer whose prefix it starts with.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+
+    def add(self, prefix, peer):
+        node = self._root
+        for char in prefix:
+            node = node.children.setdefault(char, _Node())
+        node.peers[peer] += 1
+
+    def remove(self, prefix, peer):
+        """Removes one subscription of peer to prefix. Returns whether there was one."""
+        path = [self._root]
+        for char in prefix:
+            node = path[-1].children.get(char)
+            if node is None:
+                return False
+            path.append(node)
+
+        node = path[-1]
+        if node.peers[peer] == 0:
+            del node.peers[peer]
+            return False
+        node.peers[peer] -= 1
+        if node.peers[peer] == 0:
+            del node.peers[peer]
+
+        # Prune the nodes left empty, leaf first
+        for i in xrange(len(prefix), 0, -1):
+            node = path[i]
+            if node.peers or node.children:
+                break
+            del path[i - 1].children[prefix[i - 1]]
+        return True
+
+    def match(self, data):
+        """Returns the set of peers subscribed to a prefix of data."""
+        node = self._root
+        matched = set(node.peers)
+        for char in data:
+            node = node.children.get(char)
+            if node is None:
+                break
+            matched.update(node.peers)
+        return matched
@@ -63,6 +63,9 @@ class Waker(object):
                 except (OSError, IOError, socket.error) as e:
                     if errno_from_exception(e) == errno.EINTR:
                         continue
+                    elif errno_from_exception(e) in ERR_WOULD_BLOCK:
+                        # The buffer is full of earlier wakes, the reader will wake anyway
+                        break
                     else:
                         raise
 